@@ -0,0 +1,5 @@
+"""
+PostgreSQL database backend with a per process connection pool.
+
+Enabled with the DB_POOL environment variable, see app/settings.py.
+"""
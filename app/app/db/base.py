@@ -0,0 +1,79 @@
+"""
+PostgreSQL database backend taking its connections from a ConnectionPool
+"""
+import hashlib
+from contextlib import contextmanager
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from .pool import close_pools, get_pool
+
+
+def connect(**conn_params):
+	"""It opens a connection set up like the postgresql backend does"""
+	connection = base.Database.connect(**conn_params)
+	psycopg2.extras.register_default_jsonb(
+		conn_or_curs=connection, loads=lambda x: x
+	)
+	return connection
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+	"""
+	The postgresql DatabaseWrapper, where opening a connection is a checkout
+	from the pool of the process and closing it gives it back to the pool.
+
+	The pool is configured by the POOL dict of the database settings,
+	with the MIN_SIZE, MAX_SIZE, MAX_LIFETIME, TIMEOUT and CHECK_IDLE keys.
+	"""
+
+	def get_pool(self, conn_params=None):
+		"""returns the connection pool of the database"""
+		if conn_params is None:
+			conn_params = self.get_connection_params()
+		options = {
+			key.lower(): value
+			for key, value in self.settings_dict.get('POOL', {}).items()
+		}
+		# a digest, the parameters hold the password.
+		key = hashlib.sha256(
+			repr(sorted(conn_params.items())).encode(),
+		).hexdigest()
+		return get_pool(
+			(self.alias, key),
+			lambda: connect(**conn_params),
+			**options,
+		)
+
+	@async_unsafe
+	def get_new_connection(self, conn_params):
+		"""checking out a connection from the pool"""
+		connection = self.get_pool(conn_params).checkout()
+
+		options = self.settings_dict['OPTIONS']
+		try:
+			self.isolation_level = options['isolation_level']
+		except KeyError:
+			self.isolation_level = connection.isolation_level
+		else:
+			if self.isolation_level != connection.isolation_level:
+				connection.set_session(isolation_level=self.isolation_level)
+		return connection
+
+	def _close(self):
+		"""giving the connection back to the pool instead of closing it"""
+		if self.connection is not None:
+			with self.wrap_database_errors:
+				self.get_pool().checkin(self.connection)
+
+	@contextmanager
+	def _nodb_cursor(self):
+		"""
+		closing the idle pooled connections first,
+		they would make CREATE and DROP DATABASE fail
+		"""
+		close_pools()
+		with super()._nodb_cursor() as cursor:
+			yield cursor
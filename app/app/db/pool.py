@@ -0,0 +1,272 @@
+"""
+A thread safe pool of database connections
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+from psycopg2 import OperationalError, extensions
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+	"""
+	A pool of open psycopg2 connections.
+
+	Connections are opened lazily up to max_size and given back on checkin
+	instead of being closed. On checkout a connection idle for longer than
+	check_idle seconds is pinged, and connections older than max_lifetime
+	seconds are closed and replaced. When every connection is in use,
+	checkout waits up to timeout seconds for one to be given back.
+	"""
+
+	def __init__(
+		self,
+		connect,
+		min_size=0,
+		max_size=10,
+		max_lifetime=1800,
+		timeout=10,
+		check_idle=10,
+	):
+		"""
+		:param connect: a callable opening a new connection
+		:param min_size: the number of connections opened on first use
+		:param max_size: the maximum number of open connections
+		:param max_lifetime: the seconds after which a connection is replaced
+		:param timeout: the seconds checkout waits for a free connection
+		:param check_idle: the idle seconds after which a connection is
+			pinged on checkout, 0 pings on every checkout
+		"""
+		self.connect = connect
+		self.min_size = min_size
+		self.max_size = max_size
+		self.max_lifetime = max_lifetime
+		self.timeout = timeout
+		self.check_idle = check_idle
+
+		# the pool belongs to the process that created it, connections
+		# inherited through a fork must not be used by the child.
+		self.pid = os.getpid()
+		self._condition = threading.Condition()
+		# (connection, returned at) of the connections waiting for a checkout
+		self._idle = collections.deque()
+		# connection -> opened at, for every open connection
+		self._opened = {}
+		# the open connections plus the ones being opened
+		self._size = 0
+		self._warmed = False
+		self._warming = False
+
+		self.counters = collections.Counter()
+
+	def checkout(self):
+		"""
+		It returns a healthy connection of the pool,
+		opening one when none is idle and the pool isn't full
+
+		:raise OperationalError: when no connection is free after timeout
+		"""
+		self._warm()
+		deadline = None
+		while True:
+			with self._condition:
+				while not self._idle and self._size >= self.max_size:
+					if deadline is None:
+						deadline = time.monotonic() + self.timeout
+						self.counters['waits'] += 1
+						logger.warning(
+							'database connection pool saturated, %d in use',
+							self._size,
+						)
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						self.counters['timeouts'] += 1
+						raise OperationalError(
+							'no database connection available in the pool '
+							f'after {self.timeout} seconds'
+						)
+					started = time.monotonic()
+					self._condition.wait(remaining)
+					self.counters['wait_ms'] += int(
+						(time.monotonic() - started) * 1000
+					)
+
+				if self._idle:
+					# the most recently used connection is the warmest one.
+					connection, returned_at = self._idle.pop()
+				else:
+					connection = None
+					self._size += 1
+
+			if connection is None:
+				return self._open()
+			if self._healthy(connection, returned_at):
+				self.counters['checkouts'] += 1
+				return connection
+			self._discard(connection)
+
+	def checkin(self, connection):
+		"""
+		It gives back a connection, rolling back its pending transaction,
+		the connection is closed when it is broken or too old
+		"""
+		if connection.closed:
+			self._discard(connection)
+			return
+		try:
+			if connection.get_transaction_status() != \
+				extensions.TRANSACTION_STATUS_IDLE:
+				connection.rollback()
+		except Exception:
+			self._discard(connection)
+			return
+		if self._expired(connection):
+			self._discard(connection)
+			return
+
+		with self._condition:
+			self._idle.append((connection, time.monotonic()))
+			self._condition.notify()
+
+	def close(self):
+		"""It closes the idle connections of the pool"""
+		with self._condition:
+			idle, self._idle = self._idle, collections.deque()
+		for connection, _ in idle:
+			self._discard(connection)
+
+	def stats(self):
+		"""
+		It returns the pool size, usage and counters,
+		saturation is the share of max_size in use
+		"""
+		with self._condition:
+			size, idle = self._size, len(self._idle)
+		return {
+			'size':       size,
+			'idle':       idle,
+			'in_use':     size - idle,
+			'max_size':   self.max_size,
+			'saturation': (size - idle) / self.max_size,
+			**self.counters,
+		}
+
+	def _warm(self):
+		"""
+		It opens min_size connections on the first checkout, again on the
+		next one when a connection couldn't be opened
+		"""
+		if self._warmed:
+			return
+		with self._condition:
+			if self._warmed or self._warming:
+				return
+			self._warming = True
+			reserved = max(self.min_size - self._size, 0)
+			self._size += reserved
+		try:
+			while reserved:
+				# _open frees the slot of a connection it can't open.
+				reserved -= 1
+				self.checkin(self._open())
+			self._warmed = True
+		finally:
+			with self._condition:
+				self._size -= reserved
+				self._warming = False
+				self._condition.notify_all()
+
+	def _open(self):
+		"""It opens a connection whose slot was already reserved in _size"""
+		try:
+			connection = self.connect()
+		except Exception:
+			with self._condition:
+				self._size -= 1
+				self._condition.notify()
+			raise
+		with self._condition:
+			self._opened[connection] = time.monotonic()
+		self.counters['opened'] += 1
+		return connection
+
+	def _discard(self, connection):
+		"""It closes a connection and frees its slot"""
+		try:
+			connection.close()
+		except Exception:
+			pass
+		with self._condition:
+			if self._opened.pop(connection, None) is not None:
+				self._size -= 1
+			self._condition.notify()
+		self.counters['discarded'] += 1
+
+	def _expired(self, connection):
+		"""It tells if the connection is older than max_lifetime"""
+		opened_at = self._opened.get(connection)
+		return opened_at is not None and self.max_lifetime and \
+			time.monotonic() - opened_at > self.max_lifetime
+
+	def _healthy(self, connection, returned_at):
+		"""
+		It tells if an idle connection can be used,
+		pinging it when it has been idle for more than check_idle seconds
+		"""
+		if connection.closed or self._expired(connection):
+			return False
+		if time.monotonic() - returned_at < self.check_idle:
+			return True
+		self.counters['checks'] += 1
+		try:
+			with connection.cursor() as cursor:
+				cursor.execute('SELECT 1')
+		except Exception:
+			self.counters['failed_checks'] += 1
+			return False
+		return True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, **options):
+	"""
+	It returns the pool of the current process for the key,
+	creating it with the options on first use
+
+	:param key: identifies the database the connections are opened to
+	:param connect: a callable opening a new connection
+	"""
+	pid = os.getpid()
+	pool = _pools.get(key)
+	if pool is None or pool.pid != pid:
+		with _pools_lock:
+			pool = _pools.get(key)
+			if pool is None or pool.pid != pid:
+				pool = ConnectionPool(connect, **options)
+				_pools[key] = pool
+	return pool
+
+
+def get_stats():
+	"""It returns the stats of every pool of the current process"""
+	pid = os.getpid()
+	return {
+		key: pool.stats() for key, pool in list(_pools.items())
+		if pool.pid == pid
+	}
+
+
+def close_pools():
+	"""It closes the idle connections of every pool of the current process"""
+	pid = os.getpid()
+	for pool in list(_pools.values()):
+		if pool.pid == pid:
+			pool.close()
@@ -0,0 +1,176 @@
+"""
+The routing of the reads to the read replicas of the default database.
+
+The reads of the safe requests (GET, HEAD, OPTIONS) go to one replica per
+request, picked at random among the healthy ones, every other read and
+every write goes to the primary. A request reads the primary from its
+first write on, and for DB_REPLICA_STICKY_SECONDS after the authenticated
+user wrote, see core.authentication, so users read their own writes.
+
+A replica is checked at most every DB_REPLICA_CHECK_INTERVAL seconds per
+process, it is out of rotation while it can't be reached or it replays
+the primary more than DB_REPLICA_MAX_LAG seconds late, counted from its
+last replay once its WAL receiver stopped.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# the models read by the token authentication, from the primary since
+# they tell whether the user wrote lately.
+PRIMARY_MODELS = {('authtoken', 'token'), ('core', 'user')}
+
+# the replay lag in seconds, 0 when the replica replayed all it received
+# or when it is a primary. Without a WAL receiver the replica receives
+# nothing, it lags since its last replay.
+LAG = """
+SELECT CASE
+	WHEN NOT pg_is_in_recovery() THEN 0
+	WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN coalesce(
+		extract(epoch FROM now() - pg_last_xact_replay_timestamp())::float8,
+		'Infinity'
+	)
+	WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+	ELSE coalesce(
+		extract(epoch FROM now() - pg_last_xact_replay_timestamp())::float8, 0
+	)
+END
+"""
+
+# ANY_REPLICA until the first read of the request picks one, None for
+# the primary.
+ANY_REPLICA = ''
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+# alias -> (checked at, healthy)
+_health = {}
+# the aliases being checked by a thread, the others use their last state.
+_checking = set()
+_health_lock = threading.Lock()
+
+
+def read_replicas():
+	"""It sends the reads of the current request to a replica"""
+	_read_alias.set(ANY_REPLICA)
+
+
+def read_primary(**kwargs):
+	"""
+	It sends the next reads of the current request to the primary,
+	connected to request_finished to end a request on the primary
+	"""
+	_read_alias.set(None)
+
+
+def stick(user):
+	"""
+	It sends the reads of the current request to the primary when the
+	user wrote within DB_REPLICA_STICKY_SECONDS
+	"""
+	modified_at = user.data_modified_at
+	if modified_at is not None and timezone.now() - modified_at < timedelta(
+		seconds=settings.DB_REPLICA_STICKY_SECONDS,
+	):
+		read_primary()
+
+
+def replica_lag(alias):
+	"""
+	It returns the replay lag of the replica in seconds
+
+	:raise DatabaseError: when the replica can't be reached, its
+		connection is closed so the next check opens a new one
+	"""
+	connection = connections[alias]
+	try:
+		with connection.cursor() as cursor:
+			cursor.execute(LAG)
+			return float(cursor.fetchone()[0])
+	except DatabaseError:
+		connection.close()
+		raise
+
+
+def check(alias):
+	"""It tells if the replica can be reached and is not too late"""
+	try:
+		lag = replica_lag(alias)
+	except DatabaseError as error:
+		logger.warning('Replica %s unreachable: %s', alias, error)
+		return False
+	if lag > settings.DB_REPLICA_MAX_LAG:
+		logger.warning('Replica %s lags by %.1f s', alias, lag)
+		return False
+	return True
+
+
+def is_healthy(alias):
+	"""
+	It tells if the replica is in rotation, checking it when its last
+	check is older than DB_REPLICA_CHECK_INTERVAL seconds. One thread
+	checks it at once, out of the lock, the others use its last state.
+	"""
+	now = time.monotonic()
+	with _health_lock:
+		checked_at, healthy = _health.get(alias, (None, False))
+		interval = settings.DB_REPLICA_CHECK_INTERVAL
+		if checked_at is not None and now - checked_at < interval:
+			return healthy
+		if alias in _checking:
+			return healthy
+		_checking.add(alias)
+
+	try:
+		healthy = check(alias)
+		with _health_lock:
+			_health[alias] = (now, healthy)
+	finally:
+		with _health_lock:
+			_checking.discard(alias)
+	return healthy
+
+
+class ReplicaRouter:
+	"""The database router of the DB_REPLICA_ALIASES replicas"""
+
+	def db_for_read(self, model, **hints):
+		"""a replica for the reads of a safe request, else the primary"""
+		alias = _read_alias.get()
+		if alias is None:
+			return DEFAULT_DB_ALIAS
+		# the reads of a transaction see its writes.
+		if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+			return DEFAULT_DB_ALIAS
+		if (model._meta.app_label, model._meta.model_name) in PRIMARY_MODELS:
+			return DEFAULT_DB_ALIAS
+		if alias == ANY_REPLICA:
+			healthy = [
+				replica for replica in settings.DB_REPLICA_ALIASES
+				if is_healthy(replica)
+			]
+			alias = random.choice(healthy) if healthy else None
+			_read_alias.set(alias)
+		return alias or DEFAULT_DB_ALIAS
+
+	def db_for_write(self, model, **hints):
+		"""the primary, read by the rest of the request"""
+		read_primary()
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		"""the replicas hold the same rows as the primary"""
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		"""the replicas are migrated by replication"""
+		return db == DEFAULT_DB_ALIAS
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
 	'django.contrib.sessions',
 	'django.contrib.messages',
 	'django.contrib.staticfiles',
+	'django.contrib.postgres',
 	'rest_framework',
 	'rest_framework.authtoken',
 	'phonenumber_field',
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 	'core',
 	'lead',
 	'user',
+	'benchmarks',
 ]
 
 AUTH_USER_MODEL = 'core.User'
@@ -81,15 +83,61 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# DB_POOL=true takes the connections from a per process pool (app.db),
+# giving them back at the end of each request instead of closing them.
+DB_POOL = os.environ.get('DB_POOL', 'false').lower() in ('1', 'true', 'yes')
+
 DATABASES = {
 	'default': {
-		'ENGINE':   'django.db.backends.postgresql',
-		'HOST':     os.environ.get('DB_HOST'),
-		'NAME':     os.environ.get('DB_NAME'),
-		'USER':     os.environ.get('DB_USER'),
-		'PASSWORD': os.environ.get('DB_PASS'),
+		'ENGINE':       'app.db' if DB_POOL else 'django.db.backends.postgresql',
+		'HOST':         os.environ.get('DB_HOST'),
+		'NAME':         os.environ.get('DB_NAME'),
+		'USER':         os.environ.get('DB_USER'),
+		'PASSWORD':     os.environ.get('DB_PASS'),
+		# seconds a connection is kept open between requests without a pool.
+		'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+		'POOL':         {
+			'MIN_SIZE':     int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+			'MAX_SIZE':     int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+			'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+			'TIMEOUT':      float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+			'CHECK_IDLE':   float(os.environ.get('DB_POOL_CHECK_IDLE', 10)),
+		},
 	}
 }
+
+# DB_REPLICAS=host[:port],... adds read replicas of the default database,
+# as replica1, replica2... The reads of the GET requests go to a healthy
+# replica, see app.db.router.
+DB_REPLICA_ALIASES = []
+for number, replica in enumerate(
+	filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1,
+):
+	host, _, port = replica.strip().partition(':')
+	DATABASES[f'replica{number}'] = {
+		**DATABASES['default'],
+		'HOST': host,
+		'PORT': port,
+		'OPTIONS': {'connect_timeout': int(
+			os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', 2)
+		)},
+		'TEST': {'MIRROR': 'default'},
+	}
+	DB_REPLICA_ALIASES.append(f'replica{number}')
+if DB_REPLICA_ALIASES:
+	DATABASE_ROUTERS = ['app.db.router.ReplicaRouter']
+	MIDDLEWARE.append('core.middleware.ReplicaRoutingMiddleware')
+# Seconds the reads of a user go to the primary after the user wrote,
+# over the lag allowed plus the check interval so the replicas have it.
+DB_REPLICA_STICKY_SECONDS = float(
+	os.environ.get('DB_REPLICA_STICKY_SECONDS', 10)
+)
+# Replay lag in seconds over which a replica is out of rotation, and the
+# seconds between the checks of a replica by each process.
+DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 2))
+DB_REPLICA_CHECK_INTERVAL = float(
+	os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)
+)
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -131,4 +179,169 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
 	'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+	# the token buckets of the views with a throttle_scope, per token and
+	# per client ip, see core.throttling.
+	'DEFAULT_THROTTLE_CLASSES': [
+		'core.throttling.TokenRateThrottle',
+		'core.throttling.IPRateThrottle',
+	],
+	# '<requests>/<period>', the period being s, min, hour or day. A client
+	# can send the requests at once, then at the rate. Unset, the scope
+	# isn't throttled, e.g. THROTTLE_LEAD_TOKEN_RATE=1200/min.
+	'DEFAULT_THROTTLE_RATES': {
+		'lead_token': os.environ.get('THROTTLE_LEAD_TOKEN_RATE', ''),
+		'lead_ip':    os.environ.get('THROTTLE_LEAD_IP_RATE', ''),
+		'user_token': os.environ.get('THROTTLE_USER_TOKEN_RATE', ''),
+		'user_ip':    os.environ.get('THROTTLE_USER_IP_RATE', ''),
+		# the sign up and the token requests.
+		'auth_ip':    os.environ.get('THROTTLE_AUTH_IP_RATE', ''),
+	},
+	# the proxies in front of the server, whose X-Forwarded-For gives the
+	# client ip, 0 taking the address of the connection.
+	'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# API schema
+
+# API_SCHEMA_CACHE=true serves /api/schema/ generated once per code version,
+# see the build_schema command, instead of generating it on each request.
+API_SCHEMA_CACHE = os.environ.get('API_SCHEMA_CACHE', 'false').lower() in (
+	'1', 'true', 'yes'
+)
+# The directory of the generated schemas.
+API_SCHEMA_DIR = os.environ.get('API_SCHEMA_DIR', BASE_DIR / '.schema')
+# The code version of the schema, e.g. the commit hash given at build time.
+# Empty, it is a hash of the sources.
+API_SCHEMA_VERSION = os.environ.get('API_SCHEMA_VERSION', '')
+
+# Lead API
+
+# Maximum number of leads accepted by a single bulk create request.
+LEAD_BULK_MAX_SIZE = int(os.environ.get('LEAD_BULK_MAX_SIZE', 5000))
+# Maximum number of leads deleted per statement by a bulk delete.
+LEAD_DELETE_BATCH_SIZE = int(os.environ.get('LEAD_DELETE_BATCH_SIZE', 1000))
+
+# Default and maximum number of leads in a page of the lead list.
+# Clients can pick a page size up to the maximum with ?page_size=.
+LEAD_PAGE_SIZE = int(os.environ.get('LEAD_PAGE_SIZE', 100))
+LEAD_MAX_PAGE_SIZE = int(os.environ.get('LEAD_MAX_PAGE_SIZE', 1000))
+
+# Number of rows fetched per round trip from the server-side cursor
+# when streaming a lead export.
+LEAD_EXPORT_CHUNK_SIZE = int(os.environ.get('LEAD_EXPORT_CHUNK_SIZE', 2000))
+
+# Number of most recent matching leads ranked by a lead search,
+# bounding the search cost whatever the number of leads of the user.
+LEAD_SEARCH_MAX_CANDIDATES = int(
+	os.environ.get('LEAD_SEARCH_MAX_CANDIDATES', 10000)
+)
+
+# LEAD_INGEST_ASYNC=true answers a lead create 202 with a receipt once the
+# lead is staged, the drain_leads workers insert the staged leads.
+LEAD_INGEST_ASYNC = os.environ.get('LEAD_INGEST_ASYNC', 'false').lower() in (
+	'1', 'true', 'yes'
+)
+# Number of pending leads over which creates are answered 503,
+# with Retry-After seconds.
+LEAD_INGEST_MAX_PENDING = int(
+	os.environ.get('LEAD_INGEST_MAX_PENDING', 100000)
+)
+LEAD_INGEST_RETRY_AFTER = int(os.environ.get('LEAD_INGEST_RETRY_AFTER', 5))
+# Workers of drain_leads and the number of leads inserted per batch.
+LEAD_INGEST_WORKERS = int(os.environ.get('LEAD_INGEST_WORKERS', 4))
+LEAD_INGEST_BATCH_SIZE = int(os.environ.get('LEAD_INGEST_BATCH_SIZE', 500))
+# Days the processed receipts are kept.
+LEAD_INGEST_RETENTION_DAYS = int(
+	os.environ.get('LEAD_INGEST_RETENTION_DAYS', 7)
+)
+
+# Number of hash partitions on user_id of the lead table,
+# created by partition_leads prepare.
+LEAD_PARTITIONS = int(os.environ.get('LEAD_PARTITIONS', 16))
+
+# Age in days over which archive_leads moves the leads to the archive
+# table, and the number of leads moved per transaction.
+LEAD_ARCHIVE_AFTER_DAYS = int(os.environ.get('LEAD_ARCHIVE_AFTER_DAYS', 365))
+LEAD_ARCHIVE_BATCH_SIZE = int(os.environ.get('LEAD_ARCHIVE_BATCH_SIZE', 1000))
+
+# The ip range index built by build_ip_index, setting the country, region
+# and ASN of the ip of the created leads. Empty, the leads aren't enriched.
+LEAD_IP_INDEX = os.environ.get('LEAD_IP_INDEX', '')
+# Number of leads enriched per transaction by enrich_leads.
+LEAD_ENRICH_BATCH_SIZE = int(os.environ.get('LEAD_ENRICH_BATCH_SIZE', 1000))
+
+# Days of the lead stats by default and at most, see GET lead/stats/.
+LEAD_STATS_DAYS = int(os.environ.get('LEAD_STATS_DAYS', 30))
+LEAD_STATS_MAX_DAYS = int(os.environ.get('LEAD_STATS_MAX_DAYS', 366))
+
+# User deletion
+
+# Rows deleted per transaction when deleting a user, see delete_users.
+# A user with at most that many leads is deleted at once.
+USER_DELETE_CHUNK_SIZE = int(os.environ.get('USER_DELETE_CHUNK_SIZE', 5000))
+
+# Phone numbers
+
+# Phone numbers are stored in E.164, e.g. +972541096752.
+PHONENUMBER_DB_FORMAT = 'E164'
+# Number of raw phone number strings whose parsing is kept in memory.
+PHONE_PARSE_CACHE_SIZE = int(os.environ.get('PHONE_PARSE_CACHE_SIZE', 20000))
+
+# Production server, see the serve command.
+
+SERVE_BIND = os.environ.get('SERVE_BIND', '0.0.0.0:8000')
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', 2 * os.cpu_count() + 1))
+SERVE_THREADS = int(os.environ.get('SERVE_THREADS', 1))
+# A worker is replaced after serving this many requests (plus a random
+# jitter, so the workers are not all replaced at once), 0 never.
+SERVE_MAX_REQUESTS = int(os.environ.get('SERVE_MAX_REQUESTS', 1000))
+SERVE_MAX_REQUESTS_JITTER = int(
+	os.environ.get('SERVE_MAX_REQUESTS_JITTER', 100)
+)
+SERVE_TIMEOUT = int(os.environ.get('SERVE_TIMEOUT', 30))
+# Seconds a stopping worker has to finish its requests.
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+
+# Throttling and load shedding
+
+# Number of token buckets shared by the processes of the server.
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+# Requests served at once by all the processes of the server over which
+# the requests are answered 503 with Retry-After seconds, 0 never.
+LOAD_SHED_MAX_REQUESTS = int(os.environ.get('LOAD_SHED_MAX_REQUESTS', 0))
+LOAD_SHED_RETRY_AFTER = int(os.environ.get('LOAD_SHED_RETRY_AFTER', 1))
+if LOAD_SHED_MAX_REQUESTS:
+	MIDDLEWARE.insert(0, 'core.middleware.LoadSheddingMiddleware')
+
+# Request metrics
+
+# REQUEST_METRICS=true sends the query count, the database, serializer and
+# auth time of each request in a Server-Timing header and logs them as JSON.
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS', 'false').lower() in (
+	'1', 'true', 'yes'
+)
+if REQUEST_METRICS:
+	MIDDLEWARE.insert(0, 'core.middleware.RequestMetricsMiddleware')
+
+# The metrics are logged one JSON object a line to the standard error, the
+# other loggers keeping the Django defaults.
+LOGGING = {
+	'version': 1,
+	'disable_existing_loggers': False,
+	'formatters': {
+		'message': {'format': '{message}', 'style': '{'},
+	},
+	'handlers': {
+		'metrics': {
+			'class': 'logging.StreamHandler',
+			'formatter': 'message',
+		},
+	},
+	'loggers': {
+		'core.middleware': {
+			'handlers': ['metrics'],
+			'level': 'INFO',
+			'propagate': False,
+		},
+	},
 }
@@ -0,0 +1,185 @@
+"""
+tests for the database connection pool
+"""
+import copy
+from unittest.mock import patch
+
+from django.db import connection, connections
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase
+from psycopg2 import OperationalError, extensions
+
+from app.db import pool
+
+
+class FakeConnection:
+	"""a psycopg2 connection stand in"""
+
+	def __init__(self):
+		self.closed = 0
+		self.status = extensions.TRANSACTION_STATUS_IDLE
+		self.rollbacks = 0
+
+	def get_transaction_status(self):
+		return self.status
+
+	def rollback(self):
+		self.rollbacks += 1
+		self.status = extensions.TRANSACTION_STATUS_IDLE
+
+	def close(self):
+		self.closed = 1
+
+	def cursor(self):
+		raise OperationalError('server closed the connection')
+
+
+class ConnectionPoolTests(SimpleTestCase):
+	"""Test the connection pool"""
+
+	def make_pool(self, **options):
+		"""creating a pool of fake connections"""
+		options.setdefault('check_idle', 60)
+		return pool.ConnectionPool(FakeConnection, **options)
+
+	def test_connection_reused(self):
+		"""Test a connection given back is checked out again"""
+		connections = self.make_pool()
+
+		first = connections.checkout()
+		connections.checkin(first)
+		second = connections.checkout()
+
+		self.assertIs(first, second)
+		self.assertEqual(connections.stats()['opened'], 1)
+
+	def test_min_size_opened_on_first_checkout(self):
+		"""Test min_size connections are opened on the first checkout"""
+		connections = self.make_pool(min_size=3)
+
+		connections.checkout()
+
+		stats = connections.stats()
+		self.assertEqual(stats['size'], 3)
+		self.assertEqual(stats['in_use'], 1)
+		self.assertEqual(stats['idle'], 2)
+
+	def test_failed_warm_up_retried(self):
+		"""Test a warm up failing midway frees its slots and is retried"""
+		opened = []
+
+		def connect():
+			if len(opened) == 1 and not failed:
+				failed.append(True)
+				raise OperationalError('the database is starting up')
+			opened.append(FakeConnection())
+			return opened[-1]
+
+		failed = []
+		connections = pool.ConnectionPool(connect, min_size=3, check_idle=60)
+
+		with self.assertRaises(OperationalError):
+			connections.checkout()
+		self.assertEqual(connections.stats()['size'], 1)
+
+		connections.checkout()
+
+		stats = connections.stats()
+		self.assertEqual(stats['size'], 3)
+		self.assertEqual(stats['in_use'], 1)
+
+	def test_pending_transaction_rolled_back(self):
+		"""Test a connection is given back without its transaction"""
+		connections = self.make_pool()
+		conn = connections.checkout()
+		conn.status = extensions.TRANSACTION_STATUS_INTRANS
+
+		connections.checkin(conn)
+
+		self.assertEqual(conn.rollbacks, 1)
+
+	def test_saturated_pool_times_out(self):
+		"""Test checkout fails when every connection is in use"""
+		connections = self.make_pool(max_size=1, timeout=0.01)
+		connections.checkout()
+
+		with self.assertRaises(OperationalError):
+			connections.checkout()
+
+		stats = connections.stats()
+		self.assertEqual(stats['saturation'], 1)
+		self.assertEqual(stats['waits'], 1)
+		self.assertEqual(stats['timeouts'], 1)
+
+	def test_closed_connection_replaced(self):
+		"""Test a connection closed by the server is replaced"""
+		connections = self.make_pool()
+		first = connections.checkout()
+		connections.checkin(first)
+		first.closed = 1
+
+		second = connections.checkout()
+
+		self.assertIsNot(first, second)
+		self.assertEqual(connections.stats()['size'], 1)
+
+	def test_idle_connection_health_checked(self):
+		"""Test an idle connection failing its health check is replaced"""
+		connections = self.make_pool(check_idle=0)
+		first = connections.checkout()
+		connections.checkin(first)
+
+		second = connections.checkout()
+
+		self.assertIsNot(first, second)
+		self.assertEqual(connections.stats()['failed_checks'], 1)
+
+	def test_expired_connection_replaced(self):
+		"""Test a connection older than max_lifetime is closed on checkin"""
+		connections = self.make_pool(max_lifetime=60)
+		conn = connections.checkout()
+
+		with patch('time.monotonic', return_value=10 ** 9):
+			connections.checkin(conn)
+
+		self.assertTrue(conn.closed)
+		self.assertEqual(connections.stats()['size'], 0)
+
+
+class PooledBackendTests(TestCase):
+	"""Test the pooled database backend"""
+
+	def setUp(self):
+		"""creating a pooled connection to the test database"""
+		settings_dict = copy.deepcopy(connection.settings_dict)
+		settings_dict['ENGINE'] = 'app.db'
+		backend = load_backend('app.db')
+		self.db = backend.DatabaseWrapper(settings_dict, alias='pool_test')
+		self.addCleanup(pool.close_pools)
+		# django.contrib.postgres looks the new connections up by alias.
+		connections['pool_test'] = self.db
+		self.addCleanup(connections.__delitem__, 'pool_test')
+
+	def test_connection_given_back_to_pool(self):
+		"""Test closing the connection gives it back to the pool"""
+		with self.db.cursor() as cursor:
+			cursor.execute('SELECT 1')
+		first = self.db.connection
+		self.db.close()
+
+		with self.db.cursor() as cursor:
+			cursor.execute('SELECT 1')
+			self.assertEqual(cursor.fetchone(), (1,))
+
+		self.assertIs(self.db.connection, first)
+		self.db.close()
+		self.assertFalse(first.closed)
+		self.assertEqual(self.db.get_pool().stats()['in_use'], 0)
+
+	def test_pool_key_without_password(self):
+		"""Test the pool isn't keyed by the connection parameters"""
+		self.db.get_pool()
+
+		for alias, key in pool.get_stats():
+			self.assertNotIn(connection.settings_dict['PASSWORD'], key)
+		self.assertIn('pool_test', [alias for alias, _key in pool.get_stats()])
@@ -0,0 +1,219 @@
+"""
+tests for the routing of the reads to the read replicas
+"""
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+from core.authentication import TokenAuthentication
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.http import HttpResponse
+from django.test import (
+	RequestFactory,
+	SimpleTestCase,
+	TestCase,
+	override_settings,
+)
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from app.db import router
+
+
+@override_settings(
+	DB_REPLICA_ALIASES=['replica1', 'replica2'],
+	DB_REPLICA_MAX_LAG=2,
+	DB_REPLICA_CHECK_INTERVAL=5,
+	DB_REPLICA_STICKY_SECONDS=10,
+)
+class ReplicaRouterTests(SimpleTestCase):
+	"""Test the routing of the reads and writes"""
+
+	def setUp(self):
+		self.router = router.ReplicaRouter()
+		self.lags = {'replica1': 0.0, 'replica2': 0.0}
+		lag = patch.object(
+			router, 'replica_lag', side_effect=self.replica_lag,
+		)
+		self.replica_lag_mock = lag.start()
+		self.addCleanup(lag.stop)
+		router._health.clear()
+		self.addCleanup(router._health.clear)
+		self.addCleanup(router._checking.clear)
+		self.addCleanup(router.read_primary)
+
+	def replica_lag(self, alias):
+		lag = self.lags[alias]
+		if isinstance(lag, Exception):
+			raise lag
+		return lag
+
+	def test_reads_outside_requests(self):
+		"""test the reads go to the primary by default"""
+		self.assertEqual(self.router.db_for_read(Lead), 'default')
+
+	def test_request_reads_one_replica(self):
+		"""test the reads of a request go to the same replica"""
+		router.read_replicas()
+
+		alias = self.router.db_for_read(Lead)
+
+		self.assertIn(alias, ['replica1', 'replica2'])
+		for _ in range(10):
+			self.assertEqual(self.router.db_for_read(Lead), alias)
+
+	def test_reads_after_write(self):
+		"""test the reads of a request after a write go to the primary"""
+		router.read_replicas()
+
+		self.assertEqual(self.router.db_for_write(Lead), 'default')
+
+		self.assertEqual(self.router.db_for_read(Lead), 'default')
+
+	def test_authentication_reads(self):
+		"""test the token and the user are read from the primary"""
+		router.read_replicas()
+
+		self.assertEqual(self.router.db_for_read(Token), 'default')
+		self.assertEqual(
+			self.router.db_for_read(get_user_model()), 'default',
+		)
+
+	def test_lagging_replica_out_of_rotation(self):
+		"""test a replica lagging or unreachable gets no reads"""
+		self.lags['replica1'] = 30.0
+		self.lags['replica2'] = DatabaseError('connection refused')
+
+		with self.assertLogs('app.db.router', 'WARNING') as logs:
+			router.read_replicas()
+			self.assertEqual(self.router.db_for_read(Lead), 'default')
+
+			self.lags['replica2'] = 0.5
+			router._health.clear()
+			router.read_replicas()
+			self.assertEqual(self.router.db_for_read(Lead), 'replica2')
+
+		self.assertIn('Replica replica2 unreachable', logs.output[1])
+
+	def test_replica_checked_every_interval(self):
+		"""test the health of a replica is checked once per interval"""
+		for _ in range(5):
+			router.read_replicas()
+			self.router.db_for_read(Lead)
+
+		self.assertEqual(self.replica_lag_mock.call_count, 2)
+
+		with patch.object(router.time, 'monotonic', return_value=1e9):
+			router.read_replicas()
+			self.router.db_for_read(Lead)
+
+		self.assertEqual(self.replica_lag_mock.call_count, 4)
+
+	def test_replica_checked_by_one_thread(self):
+		"""test the other threads use the last state during a check"""
+		router._health['replica1'] = (0, True)
+		checking = threading.Event()
+		release = threading.Event()
+
+		def slow_lag(alias):
+			checking.set()
+			release.wait(5)
+			return 30.0
+
+		self.replica_lag_mock.side_effect = slow_lag
+		checker = threading.Thread(
+			target=router.is_healthy, args=['replica1'],
+		)
+		checker.start()
+		self.addCleanup(checker.join)
+		self.addCleanup(release.set)
+		checking.wait(5)
+
+		with patch.object(router.time, 'monotonic', return_value=1e9):
+			self.assertTrue(router.is_healthy('replica1'))
+		self.assertEqual(self.replica_lag_mock.call_count, 1)
+
+		release.set()
+		checker.join()
+		self.assertFalse(router.is_healthy('replica1'))
+
+	def test_migrations_on_primary(self):
+		"""test only the primary is migrated"""
+		self.assertTrue(self.router.allow_migrate('default', 'core'))
+		self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+
+	def test_middleware(self):
+		"""test the safe requests read the replicas until they finish"""
+		def view(request):
+			view.alias = self.router.db_for_read(Lead)
+			return HttpResponse()
+
+		middleware = ReplicaRoutingMiddleware(view)
+		factory = RequestFactory()
+
+		middleware(factory.get('/'))
+		self.assertIn(view.alias, ['replica1', 'replica2'])
+		request_finished.send(sender=self.__class__)
+		self.assertEqual(self.router.db_for_read(Lead), 'default')
+
+		middleware(factory.post('/'))
+		self.assertEqual(view.alias, 'default')
+
+
+@override_settings(
+	DB_REPLICA_ALIASES=['replica1'],
+	DB_REPLICA_STICKY_SECONDS=10,
+)
+class StickinessTests(TestCase):
+	"""Test the users read their own writes"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.token = Token.objects.create(user=self.user)
+		self.router = router.ReplicaRouter()
+		self.addCleanup(router.read_primary)
+
+	def authenticate(self):
+		"""It authenticates a safe request of the user"""
+		router.read_replicas()
+		TokenAuthentication().authenticate_credentials(self.token.key)
+		# the reads of the test transaction stay on the primary.
+		with patch.object(
+			router.connections['default'], 'in_atomic_block', False,
+		), patch.object(router, 'is_healthy', return_value=True):
+			return self.router.db_for_read(Lead)
+
+	def test_reads_after_user_write(self):
+		"""test the reads of a user who just wrote go to the primary"""
+		self.user.bump_data_version()
+
+		self.assertEqual(self.authenticate(), 'default')
+
+	def test_reads_after_window(self):
+		"""test the reads go back to the replicas after the window"""
+		get_user_model().objects.filter(pk=self.user.pk).update(
+			data_modified_at=timezone.now() - timedelta(seconds=11),
+		)
+
+		self.assertEqual(self.authenticate(), 'replica1')
+
+	def test_reads_in_transaction(self):
+		"""test the reads in a transaction go to the primary"""
+		router.read_replicas()
+
+		with transaction.atomic():
+			self.assertEqual(self.router.db_for_read(Lead), 'default')
+
+
+class ReplicaLagTests(TestCase):
+	"""Test the lag query"""
+
+	def test_primary_lag(self):
+		"""test a server not replaying has no lag"""
+		self.assertEqual(router.replica_lag('default'), 0.0)
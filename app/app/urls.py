@@ -2,6 +2,8 @@
 This is the main urls.py file.
 It is used to route the requests to the appropriate apps views.
  """
+from core.schema import schema_view
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
@@ -12,8 +14,14 @@ urlpatterns = [
 	# This is the default Django admin site.
 	path('admin/', admin.site.urls),
 
-	# This is a path to the API schema.
-	path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+	# This is a path to the API schema, generated once per code version
+	# with API_SCHEMA_CACHE.
+	path(
+		'api/schema/',
+		schema_view if settings.API_SCHEMA_CACHE
+		else SpectacularAPIView.as_view(),
+		name='api-schema',
+	),
 	# This is a path to the API docs.
 	path(
 		'api/docs/',
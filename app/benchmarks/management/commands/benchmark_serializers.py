@@ -0,0 +1,142 @@
+"""a Django command that micro-benchmarks the API serializers"""
+
+import time
+
+from benchmarks.stats import report, summarize, write_report
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lead.serializers import LeadSerializer, LeadValuesSerializer
+from rest_framework.test import APIRequestFactory
+from user.serializers import AuthTokenSerializer, UserSerializer
+
+
+EMAIL = 'serializers@bench.example.com'
+PASSWORD = 'benchmark'
+
+LEAD_ROW = (1, 'John', 'Doe', 'lead@example.com', '+972541096752')
+LEAD_PAYLOAD = {
+	'fname': 'John',
+	'lname': 'Doe',
+	'email': 'lead@example.com',
+	'phone': '+972 54-109-6752',
+}
+
+
+def measure(function, number, rounds):
+	"""
+	It runs the function number times per round
+
+	:return: the mean seconds of one call, per round
+	"""
+	samples = []
+	for _ in range(rounds):
+		start = time.perf_counter()
+		for _ in range(number):
+			function()
+		samples.append((time.perf_counter() - start) / number)
+	return samples
+
+
+class Command(BaseCommand):
+	"""a Django command that micro-benchmarks the API serializers"""
+
+	help = (
+		'Micro-benchmark LeadSerializer, UserSerializer and '
+		'AuthTokenSerializer.validate, writing the results as JSON.'
+	)
+
+	def add_arguments(self, parser):
+		"""the number of calls per round, the rounds and the output"""
+		parser.add_argument('--number', type=int, default=1000)
+		parser.add_argument(
+			'--auth-number', type=int, default=10,
+			help='the calls per round of AuthTokenSerializer.validate, '
+			'each one hashes the password',
+		)
+		parser.add_argument('--rounds', type=int, default=5)
+		parser.add_argument(
+			'--output', default='-',
+			help='the path of the JSON results, - for stdout',
+		)
+
+	def handle(self, *args, **options):
+		"""
+		It times each serializer operation, in a transaction rolled back
+		at the end since the user ones query the database
+		"""
+		number, rounds = options['number'], options['rounds']
+		with transaction.atomic():
+			user = get_user_model().objects.create_user(
+				email=EMAIL, password=PASSWORD, name='Bench',
+			)
+			results = {
+				name: summarize(measure(function, count, rounds))
+				for name, function, count in self.benchmarks(
+					user, number, options['auth_number']
+				)
+			}
+			transaction.set_rollback(True)
+
+		write_report(
+			report('serializers', {
+				'number':      number,
+				'auth_number': options['auth_number'],
+				'rounds':      rounds,
+			}, results),
+			options['output'],
+			self.stdout,
+		)
+
+	def benchmarks(self, user, number, auth_number):
+		"""
+		It returns the benchmarked operations,
+		as (name, function, calls per round)
+		"""
+		fields = LeadSerializer.Meta.fields
+		lead = Lead.from_db('default', fields, LEAD_ROW)
+		values = dict(zip(fields, LEAD_ROW))
+		request = APIRequestFactory().post('/api/lead/lead/')
+		request.user = user
+
+		def lead_to_representation():
+			LeadSerializer(lead).data
+
+		def lead_values_to_representation():
+			LeadValuesSerializer(dict(values)).data
+
+		def lead_validate():
+			serializer = LeadSerializer(
+				data=LEAD_PAYLOAD, context={'request': request},
+			)
+			serializer.is_valid(raise_exception=True)
+
+		def user_to_representation():
+			UserSerializer(user).data
+
+		def user_validate():
+			serializer = UserSerializer(data={
+				'email': 'new@bench.example.com',
+				'password': PASSWORD,
+				'name': 'Bench',
+			})
+			serializer.is_valid(raise_exception=True)
+
+		def auth_token_validate():
+			AuthTokenSerializer().validate({
+				'email': EMAIL, 'password': PASSWORD,
+			})
+
+		return [
+			('LeadSerializer.to_representation', lead_to_representation,
+				number),
+			('LeadValuesSerializer.to_representation',
+				lead_values_to_representation, number),
+			('LeadSerializer.is_valid', lead_validate, number),
+			('UserSerializer.to_representation', user_to_representation,
+				number),
+			('UserSerializer.is_valid', user_validate, number),
+			('AuthTokenSerializer.validate', auth_token_validate,
+				auth_number),
+		]
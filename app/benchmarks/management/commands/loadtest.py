@@ -0,0 +1,208 @@
+"""a Django command that drives load against a running API server"""
+
+import collections
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.management.commands.seed_leads import (
+	SEED_PASSWORD,
+	seed_email,
+)
+from benchmarks.stats import report, summarize, write_report
+from django.core.management.base import BaseCommand, CommandError
+
+
+TOKEN_PATH = '/api/user/token/'
+LEAD_PATH = '/api/lead/lead/'
+
+OPERATIONS = ('token', 'create', 'list', 'retrieve', 'delete')
+
+
+class Client:
+	"""
+	A keep-alive HTTP client of the API recording the duration and the
+	status of each request, one per driver thread
+	"""
+
+	def __init__(self, url, timeout):
+		"""
+		:param url: the base URL of the server
+		:param timeout: the seconds a request may take
+		"""
+		parts = urlsplit(url)
+		connection_class = http.client.HTTPSConnection \
+			if parts.scheme == 'https' else http.client.HTTPConnection
+		self.connection = connection_class(parts.netloc, timeout=timeout)
+		self.prefix = parts.path.rstrip('/')
+		self.token = None
+		self.samples = collections.defaultdict(list)
+		self.errors = collections.Counter()
+
+	def request(self, operation, method, path, data=None, expected=200):
+		"""
+		It sends the request and records it under the operation
+
+		:return: the decoded JSON body, None when the request failed
+		"""
+		headers = {'Accept': 'application/json'}
+		body = None
+		if data is not None:
+			body = json.dumps(data)
+			headers['Content-Type'] = 'application/json'
+		if self.token:
+			headers['Authorization'] = f'Token {self.token}'
+
+		start = time.perf_counter()
+		try:
+			self.connection.request(
+				method, self.prefix + path, body=body, headers=headers,
+			)
+			response = self.connection.getresponse()
+			content = response.read()
+		except (OSError, http.client.HTTPException):
+			# the connection is reopened by the next request.
+			self.connection.close()
+			self.errors[operation] += 1
+			return None
+		self.samples[operation].append(time.perf_counter() - start)
+
+		if response.status != expected:
+			self.errors[operation] += 1
+			return None
+		return json.loads(content) if content else {}
+
+	def close(self):
+		"""It closes the connection"""
+		self.connection.close()
+
+
+def drive(client, credentials, deadline, iterations):
+	"""
+	It gets a token, then runs the create, list, retrieve and delete
+	scenario until the deadline or for the iterations
+	"""
+	count = 0
+	while time.monotonic() < deadline and \
+		(iterations is None or count < iterations):
+		count += 1
+		# once per client, as the API clients do, the token requests
+		# being throttled by ip.
+		if client.token is None:
+			token = client.request('token', 'POST', TOKEN_PATH, credentials)
+			if token is None:
+				continue
+			client.token = token['token']
+
+		lead = client.request('create', 'POST', LEAD_PATH, {
+			'fname': 'Load',
+			'lname': 'Test',
+			'email': f'load{threading.get_ident()}.{count}@example.com',
+			'phone': '+972541096752',
+		}, expected=201)
+		client.request('list', 'GET', LEAD_PATH)
+		if lead is None:
+			continue
+		detail = f'{LEAD_PATH}{lead["id"]}/'
+		client.request('retrieve', 'GET', detail)
+		client.request('delete', 'DELETE', detail, expected=204)
+
+
+class Command(BaseCommand):
+	"""a Django command that drives load against a running API server"""
+
+	help = (
+		'Get a token then drive the create, list, retrieve and delete '
+		'scenario against a running server from concurrent clients, '
+		'writing the latencies and throughput as JSON.'
+	)
+
+	def add_arguments(self, parser):
+		"""the server, the credentials, the concurrency and the output"""
+		parser.add_argument('--url', default='http://127.0.0.1:8000')
+		parser.add_argument(
+			'--email', default=None,
+			help=f'the user of each client, by default a seeded user, '
+			f'{seed_email(0)} for the first client',
+		)
+		parser.add_argument('--password', default=SEED_PASSWORD)
+		parser.add_argument('--concurrency', type=int, default=4)
+		parser.add_argument(
+			'--duration', type=float, default=30,
+			help='the seconds the scenario is repeated for',
+		)
+		parser.add_argument(
+			'--iterations', type=int, default=None,
+			help='the scenarios per client, instead of the duration',
+		)
+		parser.add_argument('--timeout', type=float, default=30)
+		parser.add_argument(
+			'--output', default='-',
+			help='the path of the JSON results, - for stdout',
+		)
+
+	def handle(self, *args, **options):
+		"""
+		It runs one client per thread and reports, per operation,
+		the latency percentiles, the errors and the throughput
+		"""
+		concurrency = options['concurrency']
+		if concurrency < 1:
+			raise CommandError('The concurrency must be at least 1')
+
+		deadline = time.monotonic() + options['duration'] \
+			if options['iterations'] is None else float('inf')
+		clients = [
+			Client(options['url'], options['timeout'])
+			for _ in range(concurrency)
+		]
+		threads = [
+			threading.Thread(target=drive, args=(
+				client,
+				{
+					'email': options['email'] or seed_email(index),
+					'password': options['password'],
+				},
+				deadline,
+				options['iterations'],
+			))
+			for index, client in enumerate(clients)
+		]
+
+		start = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		elapsed = time.perf_counter() - start
+		for client in clients:
+			client.close()
+
+		results = {}
+		for operation in OPERATIONS:
+			samples = [
+				sample for client in clients
+				for sample in client.samples[operation]
+			]
+			errors = sum(client.errors[operation] for client in clients)
+			results[operation] = {
+				**summarize(samples),
+				'errors':         errors,
+				'requests_per_s': len(samples) / elapsed,
+			}
+
+		write_report(
+			report('loadtest', {
+				'url':         options['url'],
+				'concurrency': concurrency,
+				'duration':    options['duration'],
+				'iterations':  options['iterations'],
+				'elapsed_s':   elapsed,
+			}, results),
+			options['output'],
+			self.stdout,
+		)
+		if sum(result['errors'] for result in results.values()):
+			self.stderr.write('Some requests failed, see the errors')
@@ -0,0 +1,177 @@
+"""a Django command that seeds synthetic users and leads"""
+
+import csv
+import io
+import random
+import time
+
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+
+SEED_DOMAIN = 'bench.example.com'
+SEED_PASSWORD = 'benchmark'
+
+COLUMNS = ('user_id', 'fname', 'lname', 'email', 'phone', 'ip')
+
+FIRST_NAMES = (
+	'John', 'Jane', 'Noa', 'David', 'Maya', 'Yosef', 'Sara', 'Ariel',
+	'Tamar', 'Daniel', 'Lea', 'Omer', 'Rivka', 'Itai', 'Yael', 'Adam',
+)
+LAST_NAMES = (
+	'Doe', 'Cohen', 'Levi', 'Mizrahi', 'Peretz', 'Biton', 'Dahan',
+	'Avraham', 'Friedman', 'Katz', 'Azoulay', 'Malka', 'Amar', 'Ohana',
+)
+
+
+def seed_email(index):
+	"""returns the email of the seeded user of the index"""
+	return f'bench{index}@{SEED_DOMAIN}'
+
+
+def generate_leads(rng, user_ids, leads_per_user):
+	"""
+	It yields the rows of leads_per_user synthetic leads for each user,
+	in COLUMNS order, with unique emails and E.164 israeli mobile numbers
+	"""
+	for user_id in user_ids:
+		for i in range(leads_per_user):
+			yield (
+				user_id,
+				rng.choice(FIRST_NAMES),
+				rng.choice(LAST_NAMES),
+				f'lead{i}.{user_id}@example.com',
+				f'+97254{rng.randrange(10 ** 7):07d}',
+				'.'.join(str(rng.randrange(1, 255)) for _ in range(4)),
+			)
+
+
+class Command(BaseCommand):
+	"""a Django command that seeds synthetic users and leads"""
+
+	help = (
+		'Seed synthetic users and their leads with COPY, '
+		f'the users are bench<n>@{SEED_DOMAIN} '
+		f'with the password "{SEED_PASSWORD}".'
+	)
+
+	def add_arguments(self, parser):
+		"""the number of users, of leads per user and the COPY chunk size"""
+		parser.add_argument('--users', type=int, default=1000)
+		parser.add_argument('--leads-per-user', type=int, default=1000)
+		parser.add_argument(
+			'--chunk-size', type=int, default=50000,
+			help='the number of rows sent per COPY',
+		)
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument(
+			'--clear', action='store_true',
+			help='delete the seeded users and their leads first',
+		)
+
+	def handle(self, *args, **options):
+		"""
+		It creates the users after the ones already seeded, then copies
+		their leads in chunks, each chunk committed on its own so millions
+		of rows are seeded in constant memory
+		"""
+		self.verbosity = options['verbosity']
+		if options['clear']:
+			self.clear()
+
+		start = time.perf_counter()
+		user_ids = self.create_users(options['users'])
+		rows = generate_leads(
+			random.Random(options['seed']),
+			user_ids,
+			options['leads_per_user'],
+		)
+		copied = self.copy_rows(rows, options['chunk_size'])
+
+		with connection.cursor() as cursor:
+			cursor.execute(f'ANALYZE {Lead._meta.db_table}')
+
+		elapsed = time.perf_counter() - start
+		self.stdout.write(self.style.SUCCESS(
+			f'Seeded {len(user_ids)} users and {copied} leads '
+			f'in {elapsed:.1f} s ({copied / max(elapsed, 1e-9):.0f} leads/s)'
+		))
+
+	def clear(self):
+		"""It deletes the seeded users, their leads first in one statement"""
+		users = get_user_model().objects.filter(
+			email__endswith=f'@{SEED_DOMAIN}'
+		)
+		leads, _ = Lead.objects.filter(user__in=users).delete()
+		count, _ = users.delete()
+		self.stdout.write(f'Deleted {leads} leads and {count} users')
+
+	def create_users(self, count):
+		"""
+		It creates count users numbered after the seeded ones,
+		the password is hashed once for all of them
+
+		:return: the ids of the created users
+		"""
+		User = get_user_model()
+		offset = User.objects.filter(
+			email__endswith=f'@{SEED_DOMAIN}'
+		).count()
+		password = make_password(SEED_PASSWORD)
+		users = [
+			User(
+				email=seed_email(index),
+				name=f'Bench {index}',
+				password=password,
+			)
+			for index in range(offset, offset + count)
+		]
+		User.objects.bulk_create(users, batch_size=1000)
+		return list(
+			User.objects.filter(
+				email__in=[user.email for user in users]
+			).order_by('id').values_list('id', flat=True)
+		)
+
+	def copy_rows(self, rows, chunk_size):
+		"""
+		It copies the rows into the lead table, one COPY FROM STDIN and
+		one transaction per chunk
+
+		:return: the number of copied rows
+		"""
+		copied = pending = 0
+		buffer = io.StringIO()
+		writer = csv.writer(buffer)
+
+		for row in rows:
+			writer.writerow(row)
+			pending += 1
+			if pending >= chunk_size:
+				self.copy_buffer(buffer)
+				copied += pending
+				pending = 0
+				buffer.seek(0)
+				buffer.truncate()
+				if self.verbosity >= 2:
+					self.stdout.write(f'{copied} leads copied')
+
+		if pending:
+			self.copy_buffer(buffer)
+			copied += pending
+
+		return copied
+
+	def copy_buffer(self, buffer):
+		"""It sends the CSV rows of the buffer to the lead table"""
+		buffer.seek(0)
+		with transaction.atomic(), connection.cursor() as cursor:
+			# the psycopg2 cursor under the django cursor wrapper.
+			cursor.cursor.copy_expert(
+				f'COPY {Lead._meta.db_table} ({", ".join(COLUMNS)}) '
+				'FROM STDIN WITH (FORMAT csv)',
+				buffer,
+			)
@@ -0,0 +1,79 @@
+"""
+Statistics and reports of the benchmarks
+"""
+import json
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+
+import django
+
+
+def percentile(ordered, fraction):
+	"""
+	It returns the value at the fraction of the ordered samples,
+	the nearest rank method
+
+	:param ordered: the samples, sorted
+	:param fraction: the percentile as a fraction, e.g. 0.99
+	"""
+	if not ordered:
+		return None
+	index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+	return ordered[index]
+
+
+def summarize(samples):
+	"""
+	It summarizes durations in seconds as milliseconds
+
+	:param samples: the durations of the operations, in seconds
+	:return: a dict of the count, mean, min, max and percentiles in ms
+	"""
+	ordered = sorted(sample * 1000 for sample in samples)
+	if not ordered:
+		return {'count': 0}
+	return {
+		'count':   len(ordered),
+		'mean_ms': statistics.fmean(ordered),
+		'min_ms':  ordered[0],
+		'p50_ms':  percentile(ordered, 0.50),
+		'p90_ms':  percentile(ordered, 0.90),
+		'p99_ms':  percentile(ordered, 0.99),
+		'max_ms':  ordered[-1],
+	}
+
+
+def report(name, options, results):
+	"""
+	It builds the machine readable report of a benchmark run
+
+	:param name: the name of the benchmark
+	:param options: the options of the run, to compare like with like
+	:param results: the results, by benchmarked operation
+	"""
+	return {
+		'benchmark':   name,
+		'created_at':  datetime.now(timezone.utc).isoformat(),
+		'environment': {
+			'python':   platform.python_version(),
+			'django':   django.get_version(),
+			'platform': platform.platform(),
+		},
+		'options':     options,
+		'results':     results,
+	}
+
+
+def write_report(data, path, stdout=sys.stdout):
+	"""
+	It writes the report as JSON to the path, or to stdout when the path
+	is '-' or None
+	"""
+	content = json.dumps(data, indent=2, default=str)
+	if path in (None, '-'):
+		stdout.write(content)
+		return
+	with open(path, 'w') as file:
+		file.write(content + '\n')
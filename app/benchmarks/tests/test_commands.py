@@ -0,0 +1,137 @@
+"""Test the benchmark commands"""
+import json
+from io import StringIO
+
+from benchmarks.management.commands.seed_leads import (
+	SEED_PASSWORD,
+	seed_email,
+)
+from benchmarks.stats import percentile, summarize
+from core import throttling
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase
+
+
+class StatsTest(SimpleTestCase):
+	"""Test the benchmark statistics"""
+
+	def test_percentile(self):
+		"""test the nearest rank percentiles"""
+		ordered = list(range(1, 101))
+
+		self.assertEqual(percentile(ordered, 0.5), 50)
+		self.assertEqual(percentile(ordered, 0.99), 99)
+		self.assertEqual(percentile(ordered, 1), 100)
+		self.assertIsNone(percentile([], 0.5))
+
+	def test_summarize_in_milliseconds(self):
+		"""test summarizing durations in seconds as milliseconds"""
+		summary = summarize([0.002, 0.001, 0.003])
+
+		self.assertEqual(summary['count'], 3)
+		self.assertAlmostEqual(summary['min_ms'], 1)
+		self.assertAlmostEqual(summary['p50_ms'], 2)
+		self.assertAlmostEqual(summary['max_ms'], 3)
+		self.assertEqual(summarize([]), {'count': 0})
+
+
+class SeedLeadsCommandTest(TestCase):
+	"""Test the seed_leads command"""
+
+	def test_seed_leads(self):
+		"""test seeding users and their leads in chunks"""
+		call_command(
+			'seed_leads', users=3, leads_per_user=5, chunk_size=4,
+			stdout=StringIO(),
+		)
+
+		users = get_user_model().objects.filter(
+			email__endswith='@bench.example.com'
+		)
+		self.assertEqual(users.count(), 3)
+		self.assertTrue(users.get(email=seed_email(0)).check_password(
+			SEED_PASSWORD
+		))
+		for user in users:
+			self.assertEqual(Lead.objects.filter(user=user).count(), 5)
+
+	def test_seed_leads_appends_and_clears(self):
+		"""test seeding after the seeded users, and clearing them"""
+		call_command(
+			'seed_leads', users=2, leads_per_user=1, stdout=StringIO(),
+		)
+		call_command(
+			'seed_leads', users=1, leads_per_user=1, stdout=StringIO(),
+		)
+		self.assertTrue(
+			get_user_model().objects.filter(email=seed_email(2)).exists()
+		)
+
+		call_command(
+			'seed_leads', users=1, leads_per_user=2, clear=True,
+			stdout=StringIO(),
+		)
+
+		self.assertEqual(
+			list(get_user_model().objects.values_list('email', flat=True)),
+			[seed_email(0)],
+		)
+		self.assertEqual(Lead.objects.count(), 2)
+
+
+class BenchmarkSerializersCommandTest(TestCase):
+	"""Test the benchmark_serializers command"""
+
+	def test_benchmark_serializers(self):
+		"""test the results are JSON and the benchmark user rolled back"""
+		out = StringIO()
+
+		call_command(
+			'benchmark_serializers', number=2, auth_number=1, rounds=2,
+			stdout=out,
+		)
+
+		data = json.loads(out.getvalue())
+		self.assertEqual(data['benchmark'], 'serializers')
+		self.assertEqual(data['results'].keys(), {
+			'LeadSerializer.to_representation',
+			'LeadValuesSerializer.to_representation',
+			'LeadSerializer.is_valid',
+			'UserSerializer.to_representation',
+			'UserSerializer.is_valid',
+			'AuthTokenSerializer.validate',
+		})
+		self.assertEqual(
+			data['results']['AuthTokenSerializer.validate']['count'], 2
+		)
+		self.assertFalse(get_user_model().objects.exists())
+
+
+class LoadtestCommandTest(LiveServerTestCase):
+	"""Test the loadtest command against the live test server"""
+
+	def setUp(self):
+		throttling.state.reset()
+		self.addCleanup(throttling.state.reset)
+
+	def test_loadtest(self):
+		"""test running the scenario, every request succeeding"""
+		call_command(
+			'seed_leads', users=2, leads_per_user=3, stdout=StringIO(),
+		)
+		out = StringIO()
+
+		call_command(
+			'loadtest', url=self.live_server_url, concurrency=2,
+			iterations=2, stdout=out, stderr=StringIO(),
+		)
+
+		results = json.loads(out.getvalue())['results']
+		self.assertEqual(results['token']['count'], 2)
+		for operation in ('token', 'create', 'list', 'retrieve', 'delete'):
+			self.assertEqual(results[operation]['errors'], 0)
+		for operation in ('create', 'list', 'retrieve', 'delete'):
+			self.assertEqual(results[operation]['count'], 4)
+		self.assertEqual(Lead.objects.count(), 6)
@@ -1,11 +1,85 @@
 """
 Django admin customisation
 """
-from django.contrib import admin
+import json
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from django.utils.translation import gettext_lazy as _
+from django.contrib.postgres.search import SearchQuery
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _, ngettext
+from lead.deletion import delete_leads
 
 from . import models
+from .deletion import delete_user
+from .normalization import dedupe_key
+from .search import SEARCH_CONFIG, search_vector
+
+
+# Under this number of rows estimated by the planner, the changelists of
+# the big tables count exactly.
+EXACT_COUNT_MAX = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+	"""
+	A paginator for the changelists of the big tables. The count is the
+	planner estimate of the filtered queryset, exact when small, and the
+	page is always the first of the queryset, the next ones being reached
+	by keyset, see KeysetChangeList.
+	"""
+
+	@cached_property
+	def count(self):
+		"""the number of rows estimated by EXPLAIN, exact when small"""
+		queryset = self.object_list.order_by()
+		sql, params = queryset.query.sql_with_params()
+		with connections[queryset.db].cursor() as cursor:
+			cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+			plan = cursor.fetchone()[0]
+		if isinstance(plan, str):
+			plan = json.loads(plan)
+		estimate = int(plan[0]['Plan']['Plan Rows'])
+		if estimate < EXACT_COUNT_MAX:
+			return queryset.count()
+		return estimate
+
+	def page(self, number):
+		"""the first page, no OFFSET is ever read"""
+		return self._get_page(list(self.object_list[:self.per_page]), 1, self)
+
+
+class KeysetChangeList(ChangeList):
+	"""
+	A changelist ordered by descending id, paged by an id__lt filter on
+	the last id shown instead of page numbers
+	"""
+
+	def get_results(self, request):
+		"""
+		setting the links of the older rows and of the newest ones, and
+		the owner link of each row, keeping the filters and the search
+		"""
+		super().get_results(request)
+		for obj in self.result_list:
+			obj.owner_url = self.get_query_string(
+				{'user__id__exact': obj.user_id}, ['id__lt', 'p'],
+			)
+		self.older_url = self.newest_url = None
+		if self.multi_page and len(self.result_list) >= self.list_per_page:
+			self.older_url = self.get_query_string(
+				{'id__lt': self.result_list[-1].pk}, ['p'],
+			)
+		if 'id__lt' in self.params:
+			self.newest_url = self.get_query_string(remove=['id__lt', 'p'])
 
 
 class UserAdmin(BaseUserAdmin):
@@ -28,6 +102,8 @@ class UserAdmin(BaseUserAdmin):
 					 )
 			}
 		),
+		# Leads
+		(_('Leads'), {'fields': ('lead_dedupe',)}),
 		# Dates
 		(_('Important Dates'), {'fields': ('last_login',)}),
 
@@ -51,8 +127,219 @@ class UserAdmin(BaseUserAdmin):
 		),
 	)
 
+	def save_model(self, request, obj, form, change):
+		"""warning the existing leads are rekeyed by rekey_leads"""
+		super().save_model(request, obj, form, change)
+		if change and 'lead_dedupe' in form.changed_data:
+			self.message_user(
+				request,
+				_('The existing leads are deduplicated with the new mode '
+				  'once rekey_leads rebuilt their keys.'),
+				messages.WARNING,
+			)
+
+	def get_deleted_objects(self, objs, request):
+		"""
+		listing the deleted users only with their number of leads, by the
+		lead counters, collecting the leads would load them all
+		"""
+		leads = models.LeadStats.objects.filter(user__in=objs).aggregate(
+			total=Sum('total'),
+		)['total']
+		return (
+			[obj.email for obj in objs],
+			{
+				self.opts.verbose_name_plural: len(objs),
+				models.Lead._meta.verbose_name_plural: leads or 0,
+			},
+			set(),
+			[],
+		)
+
+	def delete_model(self, request, obj):
+		"""deleting the user by chunks, in the background for many leads"""
+		request.user_deletions = [delete_user(obj)]
+
+	def delete_queryset(self, request, queryset):
+		"""deleting the users by chunks, in the background for many leads"""
+		request.user_deletions = [delete_user(user) for user in queryset]
+
+	def message_user(self, request, message, level=messages.INFO,
+	                 *args, **kwargs):
+		"""
+		the deletions left to delete_users linked to their progress, instead
+		of the stock message telling the users were deleted
+		"""
+		deletions = getattr(request, 'user_deletions', [])
+		scheduled = [
+			deletion for deletion in deletions
+			if deletion.status != models.UserDeletion.Status.DONE
+		]
+		if level != messages.SUCCESS or not scheduled:
+			return super().message_user(
+				request, message, level, *args, **kwargs,
+			)
+
+		deleted = len(deletions) - len(scheduled)
+		if deleted:
+			super().message_user(request, ngettext(
+				'Deleted %(count)d user.', 'Deleted %(count)d users.', deleted,
+			) % {'count': deleted}, messages.SUCCESS)
+		for deletion in scheduled:
+			super().message_user(request, format_html(
+				_('The deletion of {} is scheduled, see <a href="{}">its '
+				  'progress</a>.'),
+				deletion.email,
+				reverse('admin:core_userdeletion_change', args=[deletion.pk]),
+			), messages.WARNING)
+
+
+class UserDeletionAdmin(admin.ModelAdmin):
+	"""The progress of the user deletions, read only"""
+	list_display = [
+		'email', 'status', 'leads_deleted', 'leads_total',
+		'created_at', 'finished_at',
+	]
+	list_filter = ['status']
+	ordering = ['-id']
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+
+class LeadAdminForm(forms.ModelForm):
+	"""The lead form, refusing a duplicate of another lead of the owner"""
+
+	def clean(self):
+		"""the dedupe key of the lead must be free among the owner leads"""
+		cleaned_data = super().clean()
+		if 'user' in self.fields:
+			user = cleaned_data.get('user')
+		else:
+			user = self.instance.user
+		if user is None or self.errors:
+			return cleaned_data
+		key = dedupe_key(
+			user.lead_dedupe, cleaned_data.get('email'),
+			cleaned_data.get('phone'),
+		)
+		duplicates = models.Lead.objects.filter(user=user, dedupe_key=key)
+		if key is not None and \
+			duplicates.exclude(pk=self.instance.pk).exists():
+			raise forms.ValidationError(
+				_('The owner has a lead with the same contact details.'),
+				code='duplicate',
+			)
+		return cleaned_data
+
+
+class LeadAdmin(admin.ModelAdmin):
+	"""
+	The admin pages of the leads, responsive whatever their number: the
+	counts are estimated, the pages are read by keyset on the id, the
+	search uses the full text index and the owners are filtered by their
+	indexed id, following the owner links.
+	"""
+	list_display = [
+		'id', 'email', 'fname', 'lname', 'phone', 'owner', 'created_at',
+	]
+	list_select_related = ['user']
+	list_filter = ['created_at']
+	list_per_page = 100
+	list_max_show_all = 200
+	show_full_result_count = False
+	# the keyset paging needs the id order.
+	sortable_by = []
+	ordering = ['-id']
+	search_fields = ['email']
+	search_help_text = _('Names, email or phone number')
+	raw_id_fields = ['user']
+	readonly_fields = [
+		'ip_country', 'ip_region', 'ip_asn', 'dedupe_key', 'created_at',
+	]
+	paginator = EstimatedCountPaginator
+	change_list_template = 'admin/core/lead/change_list.html'
+	actions = ['delete_selected_leads']
+	form = LeadAdminForm
+
+	def get_changelist(self, request, **kwargs):
+		return KeysetChangeList
+
+	def get_readonly_fields(self, request, obj=None):
+		"""
+		the owner of an existing lead, the lead counters being kept by
+		the insert and delete triggers only
+		"""
+		readonly_fields = super().get_readonly_fields(request, obj)
+		if obj is not None:
+			readonly_fields = [*readonly_fields, 'user']
+		return readonly_fields
+
+	def save_model(self, request, obj, form, change):
+		"""rebuilding the dedupe key of the lead, bumping the owner version"""
+		obj.dedupe_key = obj.build_dedupe_key()
+		super().save_model(request, obj, form, change)
+		obj.user.bump_data_version()
+
+	def delete_model(self, request, obj):
+		"""bumping the data version of the owner of the deleted lead"""
+		super().delete_model(request, obj)
+		obj.user.bump_data_version()
+
+	def get_actions(self, request):
+		"""the bulk delete instead of delete_selected, which loads the leads"""
+		actions = super().get_actions(request)
+		actions.pop('delete_selected', None)
+		return actions
+
+	def get_search_results(self, request, queryset, search_term):
+		"""matching the search on the full text index of the leads"""
+		search_term = ' '.join(search_term.split())
+		if not search_term:
+			return queryset, False
+		query = SearchQuery(
+			search_term, config=SEARCH_CONFIG, search_type='websearch',
+		)
+		return queryset.alias(search_vector=search_vector()).filter(
+			search_vector=query,
+		), False
+
+	@admin.display(description=_('Owner'))
+	def owner(self, obj):
+		"""the email of the owner, linked to the leads of the owner"""
+		return format_html(
+			'<a href="{}">{}</a>',
+			getattr(obj, 'owner_url', f'?user__id__exact={obj.user_id}'),
+			obj.user.email,
+		)
+
+	@admin.action(
+		description=_('Delete selected leads'),
+		permissions=['delete'],
+	)
+	def delete_selected_leads(self, request, queryset):
+		"""deleting the selected leads by batches, per owner"""
+		queryset = queryset.order_by()
+		deleted = 0
+		for user in models.User.objects.filter(
+			pk__in=queryset.values('user_id'),
+		):
+			deleted += delete_leads(
+				user,
+				queryset.filter(user=user),
+				settings.LEAD_DELETE_BATCH_SIZE,
+			)
+		self.message_user(request, ngettext(
+			'Deleted %(count)d lead.', 'Deleted %(count)d leads.', deleted,
+		) % {'count': deleted})
+
 
 # Registering the User model with the UserAdmin class.
 admin.site.register(models.User, UserAdmin)
-# Registering the Lead model to the admin site.
-admin.site.register(models.Lead)
+# Registering the Lead model with the LeadAdmin class.
+admin.site.register(models.Lead, LeadAdmin)
+# Registering the progress of the user deletions.
+admin.site.register(models.UserDeletion, UserDeletionAdmin)
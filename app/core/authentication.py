@@ -0,0 +1,19 @@
+"""
+Authentication of the API
+"""
+from app.db import router
+from rest_framework import authentication
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+	"""
+	The token authentication, reading the primary database for the rest
+	of the request when the user wrote within DB_REPLICA_STICKY_SECONDS,
+	so users read their own writes. The token and the user are read from
+	the primary, see app.db.router.
+	"""
+
+	def authenticate_credentials(self, key):
+		user, token = super().authenticate_credentials(key)
+		router.stick(user)
+		return user, token
@@ -0,0 +1,160 @@
+"""
+The deletion of the users with many leads.
+
+Deleting a user with the ORM deletes all its leads in one statement of
+one transaction, and the admin lists them all first. Instead the user is
+deactivated and its tokens revoked at once, then its staged, archived
+and live leads are deleted by chunks, each in its own short transaction
+recording the progress, and the user is deleted last with what is left
+of its rows. A deletion can be run again after an interruption.
+
+A run claims a deletion with a session advisory lock on its id, held
+across its chunk transactions and released when the connection closes,
+so overlapping runs, delete_users and the API, never process the same
+deletion twice.
+"""
+from core.models import LeadStats, UserDeletion
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+# the tables deleted by chunks, in order: the staged leads first so the
+# ingest can't add leads behind the deletion.
+CHUNKED_TABLES = ('core_leadingest', 'core_archivedlead', 'core_lead')
+
+# filtered on the user twice so the partitions of core_lead are pruned.
+DELETE_CHUNK = """
+DELETE FROM {table} WHERE user_id = %s AND id IN (
+	SELECT id FROM {table} WHERE user_id = %s LIMIT %s
+)
+"""
+
+
+def schedule(user):
+	"""
+	It deactivates the user, revokes its tokens and records its deletion
+
+	:return: the pending UserDeletion
+	"""
+	with transaction.atomic():
+		deletion = UserDeletion.objects.create(
+			user_id=user.pk,
+			email=user.email,
+			leads_total=LeadStats.objects.filter(user=user).values_list(
+				'total', flat=True,
+			).first() or 0,
+		)
+		type(user).objects.filter(pk=user.pk).update(is_active=False)
+		Token.objects.filter(user=user).delete()
+	user.is_active = False
+	return deletion
+
+
+def process(deletion, chunk_size):
+	"""
+	It deletes the rows of the user by chunks, then the user
+
+	:param deletion: a UserDeletion not done
+	:param chunk_size: the rows deleted per transaction
+	"""
+	UserDeletion.objects.filter(pk=deletion.pk).update(
+		status=UserDeletion.Status.RUNNING,
+	)
+	for table in CHUNKED_TABLES:
+		sql = DELETE_CHUNK.format(table=table)
+		count = chunk_size
+		while count == chunk_size:
+			with transaction.atomic(), connection.cursor() as cursor:
+				cursor.execute(
+					sql, [deletion.user_id, deletion.user_id, chunk_size],
+				)
+				count = cursor.rowcount
+				if table == 'core_lead' and count:
+					UserDeletion.objects.filter(pk=deletion.pk).update(
+						leads_deleted=models.F('leads_deleted') + count,
+					)
+					deletion.leads_deleted += count
+
+	deletion.status = UserDeletion.Status.DONE
+	deletion.finished_at = timezone.now()
+	with transaction.atomic():
+		get_user_model().objects.filter(pk=deletion.user_id).delete()
+		UserDeletion.objects.filter(pk=deletion.pk).update(
+			status=deletion.status,
+			finished_at=deletion.finished_at,
+		)
+
+
+def claim(deletions):
+	"""
+	It claims the oldest deletion not done of the queryset that no other
+	run is processing, to be released by release
+
+	:return: the claimed UserDeletion, None when there is none
+	"""
+	taken = []
+	while True:
+		with transaction.atomic(), connection.cursor() as cursor:
+			# the row lock orders the claims, the advisory lock outlives
+			# the transaction.
+			deletion = (
+				deletions
+				.exclude(status=UserDeletion.Status.DONE)
+				.exclude(pk__in=taken)
+				.select_for_update(skip_locked=True)
+				.order_by('id')
+				.first()
+			)
+			if deletion is None:
+				return None
+			cursor.execute('SELECT pg_try_advisory_lock(%s)', [deletion.pk])
+			if cursor.fetchone()[0]:
+				return deletion
+		taken.append(deletion.pk)
+
+
+def release(deletion):
+	"""It releases a deletion claimed by claim"""
+	with connection.cursor() as cursor:
+		cursor.execute('SELECT pg_advisory_unlock(%s)', [deletion.pk])
+
+
+def delete_user(user):
+	"""
+	It schedules the deletion of the user, done at once when the user has
+	at most USER_DELETE_CHUNK_SIZE leads, by delete_users otherwise
+
+	:return: the UserDeletion
+	"""
+	deletion = schedule(user)
+	if deletion.leads_total <= settings.USER_DELETE_CHUNK_SIZE:
+		claimed = claim(UserDeletion.objects.filter(pk=deletion.pk))
+		if claimed is not None:
+			try:
+				process(claimed, settings.USER_DELETE_CHUNK_SIZE)
+			finally:
+				release(claimed)
+			deletion = claimed
+	return deletion
+
+
+def process_pending(chunk_size):
+	"""
+	It processes the deletions not done that no other run is processing,
+	oldest first
+
+	:return: the number of processed deletions
+	"""
+	processed = 0
+	while True:
+		deletion = claim(UserDeletion.objects.all())
+		if deletion is None:
+			return processed
+		try:
+			process(deletion, chunk_size)
+		finally:
+			release(deletion)
+		processed += 1
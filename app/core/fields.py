@@ -0,0 +1,49 @@
+"""
+Custom model fields
+"""
+from core.normalization import to_phone_number
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+from phonenumber_field import modelfields
+from phonenumber_field.phonenumber import PhoneNumber
+
+
+def validate_phone_number(value):
+	"""validates a phone number parsing it through the phone number cache"""
+	phone = to_phone_number(value)
+	if isinstance(phone, PhoneNumber) and not phone.is_valid():
+		raise ValidationError(
+			_('The phone number entered is not valid.'),
+			code='invalid_phone_number',
+		)
+
+
+class PhoneNumberDescriptor(modelfields.PhoneNumberDescriptor):
+	"""
+	The phone number descriptor, converting the assigned strings,
+	like the values loaded from the database, through the phone number cache
+	"""
+
+	def __set__(self, instance, value):
+		instance.__dict__[self.field.name] = to_phone_number(
+			value,
+			region=self.field.region,
+		)
+
+
+class PhoneNumberField(modelfields.PhoneNumberField):
+	"""
+	A PhoneNumberField parsing the phone numbers once per raw string.
+
+	The numbers are stored in E.164 (PHONENUMBER_DB_FORMAT), so reading a
+	lead whose number was already seen costs a cache hit instead of
+	a parse, and formatting it back costs nothing.
+	"""
+	descriptor_class = PhoneNumberDescriptor
+	default_validators = [validate_phone_number]
+
+	def get_prep_value(self, value):
+		"""converting strings through the phone number cache"""
+		if isinstance(value, str):
+			value = to_phone_number(value)
+		return super().get_prep_value(value)
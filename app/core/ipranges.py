@@ -0,0 +1,232 @@
+"""
+The IP range index of the lead enrichment.
+
+A range file (a CSV of start ip, end ip, country, region, asn) is built by
+the build_ip_index command into a binary index of sorted arrays:
+
+	header: magic, number of ranges, size of the labels
+	starts: the first address of each range, sorted, 16 bytes each
+	ends: the last address of each range, 16 bytes each
+	values: the label number and the ASN of each range, 8 bytes
+	labels: the distinct (country, region) pairs, as JSON
+
+The addresses are IPv6, the IPv4 ones mapped to ::ffff:0:0/96, big endian
+so their bytes compare as their numbers. The index is memory-mapped read
+only, so the processes reading it share the pages of the file, and a
+lookup is a binary search over the starts without any I/O.
+"""
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+
+
+MAGIC = b'LEADIP1\0'
+HEADER = struct.Struct('<8sII')
+ADDRESS_SIZE = 16
+VALUE = struct.Struct('<II')
+IPV4_MAPPED = b'\0' * 10 + b'\xff\xff'
+# the lengths of Lead.ip_country and Lead.ip_region.
+COUNTRY_LENGTH = 2
+REGION_LENGTH = 255
+
+IPRange = namedtuple('IPRange', ['country', 'region', 'asn'])
+
+_index = {'path': None, 'index': None}
+_index_lock = threading.Lock()
+
+
+def pack(address):
+	"""
+	returns the 16 bytes of an ip address, an IPv4 one mapped to IPv6
+
+	:param address: an ip address, str or ipaddress object
+	:raise ValueError: when it isn't an ip address
+	"""
+	if not isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+		address = ipaddress.ip_address(address)
+	if address.version == 4:
+		return IPV4_MAPPED + address.packed
+	return address.packed
+
+
+def parse_address(value):
+	"""returns the ip address of a range file, in text or as an integer"""
+	value = value.strip()
+	if value.isdigit():
+		return ipaddress.ip_address(int(value))
+	return ipaddress.ip_address(value)
+
+
+def read_ranges(file):
+	"""
+	It yields the ranges of a CSV range file as (start, end, country,
+	region, asn) tuples, a first line that isn't a range being a header.
+	The country and region are cut to the length of the lead fields.
+
+	:raise ValueError: when a line isn't a valid range
+	"""
+	for number, row in enumerate(csv.reader(file), start=1):
+		if not row:
+			continue
+		try:
+			start, end = parse_address(row[0]), parse_address(row[1])
+		except (ValueError, IndexError):
+			if number == 1:
+				continue
+			raise ValueError(f'line {number}: invalid addresses')
+		if start.version != end.version or start > end:
+			raise ValueError(f'line {number}: invalid range')
+		country, region, asn = (row[2:] + ['', '', ''])[:3]
+		asn = asn.strip().upper().removeprefix('AS')
+		yield (
+			start,
+			end,
+			country.strip().upper()[:COUNTRY_LENGTH],
+			region.strip()[:REGION_LENGTH],
+			int(asn) if asn.isdigit() else 0,
+		)
+
+
+def build(ranges, path):
+	"""
+	It writes the index of the ranges, replacing the file at once so a
+	process opening it never reads it partly written
+
+	:param ranges: (start, end, country, region, asn) tuples, in any order
+	:raise ValueError: when two ranges overlap
+	:return: the number of ranges
+	"""
+	packed = sorted(
+		(pack(start), pack(end), (country, region), asn)
+		for start, end, country, region, asn in ranges
+	)
+	labels = {}
+	starts, ends, values = bytearray(), bytearray(), bytearray()
+	previous_end = None
+	for start, end, label, asn in packed:
+		if previous_end is not None and start <= previous_end:
+			raise ValueError(
+				f'the range starting at {ipaddress.ip_address(start)} '
+				f'overlaps the previous one'
+			)
+		previous_end = end
+		starts += start
+		ends += end
+		values += VALUE.pack(labels.setdefault(label, len(labels)), asn)
+	encoded_labels = json.dumps(list(labels)).encode()
+
+	path = Path(path)
+	fd, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'wb') as file:
+			file.write(HEADER.pack(MAGIC, len(packed), len(encoded_labels)))
+			for block in (starts, ends, values, encoded_labels):
+				file.write(block)
+		os.replace(temporary, path)
+	except BaseException:
+		os.unlink(temporary)
+		raise
+	return len(packed)
+
+
+class Addresses:
+	"""A read only sequence of the 16 bytes addresses of an index block"""
+
+	def __init__(self, buffer, offset, count):
+		self.buffer = buffer
+		self.offset = offset
+		self.count = count
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, position):
+		start = self.offset + position * ADDRESS_SIZE
+		return self.buffer[start:start + ADDRESS_SIZE]
+
+
+class IPRangeIndex:
+	"""A memory-mapped index built by build"""
+
+	def __init__(self, path):
+		"""
+		:raise ValueError: when the file isn't an index
+		"""
+		with open(path, 'rb') as file:
+			self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, count, labels_size = HEADER.unpack_from(self.buffer)
+		if magic != MAGIC:
+			self.buffer.close()
+			raise ValueError(f'{path} is not an ip range index')
+		self.starts = Addresses(self.buffer, HEADER.size, count)
+		self.ends = Addresses(
+			self.buffer, HEADER.size + count * ADDRESS_SIZE, count,
+		)
+		self.values_offset = HEADER.size + 2 * count * ADDRESS_SIZE
+		labels_offset = self.values_offset + count * VALUE.size
+		self.labels = [
+			tuple(label) for label in json.loads(
+				self.buffer[labels_offset:labels_offset + labels_size]
+			)
+		]
+
+	def __len__(self):
+		return len(self.starts)
+
+	def lookup(self, address):
+		"""
+		returns the IPRange of the ip address, None when no range holds it,
+		its unknown values being None
+
+		:raise ValueError: when it isn't an ip address
+		"""
+		key = pack(address)
+		position = bisect.bisect_right(self.starts, key) - 1
+		if position < 0 or key > self.ends[position]:
+			return None
+		label, asn = VALUE.unpack_from(
+			self.buffer, self.values_offset + position * VALUE.size,
+		)
+		country, region = self.labels[label]
+		return IPRange(country or None, region or None, asn or None)
+
+	def close(self):
+		self.buffer.close()
+
+
+def get_index():
+	"""
+	It returns the index of LEAD_IP_INDEX, opened once per process,
+	None when it isn't set. The index of a former LEAD_IP_INDEX is closed.
+	"""
+	path = settings.LEAD_IP_INDEX
+	if _index['path'] != path:
+		with _index_lock:
+			if _index['path'] != path:
+				previous = _index['index']
+				_index['index'] = IPRangeIndex(path) if path else None
+				_index['path'] = path
+				if previous is not None:
+					previous.close()
+	return _index['index']
+
+
+def enrich(lead, index):
+	"""
+	It sets the country, region and ASN of the lead from its ip, None
+	when the lead has no ip or no range holds it
+
+	:param index: an IPRangeIndex
+	"""
+	found = index.lookup(lead.ip) if lead.ip else None
+	lead.ip_country, lead.ip_region, lead.ip_asn = found or (None, None, None)
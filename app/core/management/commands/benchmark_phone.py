@@ -0,0 +1,78 @@
+"""a Django command that measures the phone number parsing cost"""
+
+import random
+import time
+
+from core.normalization import _parse_phone, to_phone_number
+from django.core.management.base import BaseCommand
+from phonenumber_field.phonenumber import to_python
+
+
+def create_path(convert, raw_numbers):
+	"""parsing, validating and formatting for storage, like a lead create"""
+	for raw in raw_numbers:
+		phone = convert(raw)
+		if phone.is_valid():
+			phone.as_e164
+
+
+def read_path(convert, stored_numbers):
+	"""parsing a stored number and rendering it, like a lead list"""
+	for stored in stored_numbers:
+		str(convert(stored))
+
+
+class Command(BaseCommand):
+	"""a Django command that measures the phone number parsing cost"""
+
+	help = (
+		'Measure the phone number parsing cost per 10k leads, '
+		'with phonenumber_field and with the phone number cache.'
+	)
+
+	def add_arguments(self, parser):
+		"""the number of leads and of distinct phone numbers among them"""
+		parser.add_argument('--count', type=int, default=10000)
+		parser.add_argument('--distinct', type=int, default=1000)
+		parser.add_argument('--seed', type=int, default=0)
+
+	def handle(self, *args, **options):
+		"""
+		It times the create and the read paths over the same phone numbers,
+		before (phonenumber_field) and after (cold and warm phone cache)
+		"""
+		count = options['count']
+		rng = random.Random(options['seed'])
+		distinct = [
+			f'+97254{rng.randrange(10 ** 7):07d}'
+			for _ in range(options['distinct'])
+		]
+		stored = [rng.choice(distinct) for _ in range(count)]
+		# the raw inputs, formatted like webhooks send them.
+		raw = [f'{n[:4]} {n[4:6]}-{n[6:9]}-{n[9:]}' for n in stored]
+
+		for name, path, numbers in [
+			('create', create_path, raw),
+			('read', read_path, stored),
+		]:
+			_parse_phone.cache_clear()
+			before = self.measure(path, to_python, numbers)
+			cold = self.measure(path, to_phone_number, numbers)
+			warm = self.measure(path, to_phone_number, numbers)
+			self.stdout.write(
+				f'{name}: '
+				f'before {self.per_10k(before, count):.1f} ms, '
+				f'after cold {self.per_10k(cold, count):.1f} ms, '
+				f'after warm {self.per_10k(warm, count):.1f} ms '
+				'per 10k leads'
+			)
+
+	def measure(self, path, convert, numbers):
+		"""returns the seconds spent running the path over the numbers"""
+		start = time.perf_counter()
+		path(convert, numbers)
+		return time.perf_counter() - start
+
+	def per_10k(self, seconds, count):
+		"""converts a duration over count leads to ms per 10k leads"""
+		return seconds * 1000 * 10000 / count
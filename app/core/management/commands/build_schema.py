@@ -0,0 +1,22 @@
+"""a Django command that generates the API schema of the code version"""
+
+from core import schema
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+	"""a Django command that generates the API schema of the code version"""
+
+	help = (
+		'Generate the OpenAPI schema of the current code version into '
+		'API_SCHEMA_DIR, served by /api/schema/ with API_SCHEMA_CACHE. '
+		'Run it at build time so no worker generates it.'
+	)
+
+	def handle(self, *args, **options):
+		"""It generates and writes the schema"""
+		version = schema.build()
+		self.stdout.write(self.style.SUCCESS(
+			f'Generated the API schema of version {version} '
+			f'in {schema.schema_path(version, "yaml").parent}'
+		))
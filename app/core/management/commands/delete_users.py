@@ -0,0 +1,43 @@
+"""a Django command that deletes the users scheduled for deletion"""
+
+import time
+
+from core.deletion import process_pending
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+	"""a Django command that deletes the users scheduled for deletion"""
+
+	help = (
+		'Delete the users scheduled for deletion, their leads by chunks '
+		'of --chunk-size rows. Each deletion is processed by one run at '
+		'a time, an interrupted deletion is resumed by the next run.'
+	)
+
+	def add_arguments(self, parser):
+		"""the chunk size and the polling interval"""
+		parser.add_argument(
+			'--chunk-size', type=int, default=settings.USER_DELETE_CHUNK_SIZE,
+			help='the rows deleted per transaction',
+		)
+		parser.add_argument(
+			'--poll-interval', type=float, default=5.0,
+			help='the seconds waited before polling again',
+		)
+		parser.add_argument(
+			'--once', action='store_true',
+			help='exit once no deletion is pending',
+		)
+
+	def handle(self, *args, **options):
+		"""It processes the pending deletions until stopped"""
+		deleted = 0
+		while True:
+			deleted += process_pending(options['chunk_size'])
+			if options['once']:
+				break
+			time.sleep(options['poll_interval'])
+
+		self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} users'))
@@ -0,0 +1,258 @@
+"""a Django command that loads leads from a CSV or JSONL file"""
+
+import csv
+import io
+import ipaddress
+import json
+import os
+
+from core import ipranges
+from core.normalization import (
+	dedupe_key,
+	normalize_email,
+	normalize_phone,
+)
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+
+# The columns read from the file, in the staging table order.
+COLUMNS = ('fname', 'lname', 'email', 'phone', 'ip')
+# The columns of the staging table.
+STAGING_COLUMNS = COLUMNS + (
+	'dedupe_key', 'ip_country', 'ip_region', 'ip_asn',
+)
+
+# file extension -> file format
+FORMATS = {
+	'.csv':    'csv',
+	'.jsonl':  'jsonl',
+	'.ndjson': 'jsonl',
+}
+
+STAGING_TABLE = 'core_lead_import'
+
+
+def read_csv(file):
+	"""It yields the rows of a CSV file with a header line as dicts"""
+	yield from csv.DictReader(file)
+
+
+def read_jsonl(file):
+	"""
+	It yields the objects of a JSON lines file, skipping blank lines,
+	a line that isn't valid JSON is yielded as None
+	"""
+	for line in file:
+		if not line.strip():
+			continue
+		try:
+			yield json.loads(line)
+		except ValueError:
+			yield None
+
+
+READERS = {
+	'csv':   read_csv,
+	'jsonl': read_jsonl,
+}
+
+
+def read_text(row, column):
+	"""
+	It returns a column of a row stripped, '' when missing, a number
+	of a JSON object being read as its text
+
+	:raise ValidationError: when the value isn't a string nor a number
+	"""
+	value = row.get(column)
+	if value is None:
+		return ''
+	if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+		raise ValidationError(f'Invalid {column}.')
+	return str(value).strip()
+
+
+def clean_row(row, dedupe, index=None):
+	"""
+	It validates and normalizes a row read from the file
+
+	:param row: a dict of the raw columns
+	:param dedupe: the lead dedupe mode of the user
+	:param index: the IPRangeIndex enriching the ip, None not to
+	:return: a tuple of the columns in the staging table order
+	"""
+	if not isinstance(row, dict):
+		raise ValidationError('Expected an object.')
+
+	names = []
+	for column in ('fname', 'lname'):
+		value = read_text(row, column)
+		if not value or len(value) > 255:
+			raise ValidationError(f'Invalid {column}.')
+		names.append(value)
+
+	ip = read_text(row, 'ip') or None
+	if ip is not None:
+		try:
+			ip = str(ipaddress.ip_address(ip))
+		except ValueError:
+			raise ValidationError('Invalid ip.')
+
+	email = normalize_email(read_text(row, 'email'))
+	phone = normalize_phone(read_text(row, 'phone'))
+	found = index.lookup(ip) if index is not None and ip else None
+	return (
+		*names, email, phone, ip, dedupe_key(dedupe, email, phone),
+		*(found or (None, None, None)),
+	)
+
+
+class Command(BaseCommand):
+	"""a Django command that loads leads from a CSV or JSONL file"""
+
+	help = (
+		'Load leads of a user from a CSV or JSONL file, '
+		'with COPY into a staging table merged into core_lead.'
+	)
+
+	def add_arguments(self, parser):
+		"""the file to load, the owner of the leads and the loading options"""
+		parser.add_argument('path', help='the CSV or JSONL file to load')
+		parser.add_argument(
+			'--user',
+			required=True,
+			help='the email of the user owning the leads',
+		)
+		parser.add_argument(
+			'--format',
+			choices=sorted(READERS),
+			help='the file format, guessed from the extension by default',
+		)
+		parser.add_argument(
+			'--chunk-size',
+			type=int,
+			default=10000,
+			help='the number of rows validated and copied at once',
+		)
+
+	def handle(self, *args, **options):
+		"""
+		It streams the file in chunks, validating and normalizing every
+		row, copies the valid rows into a temporary staging table and
+		merges the staging table into core_lead in one statement,
+		skipping the duplicates of the user leads
+		"""
+		try:
+			user = get_user_model().objects.get(email=options['user'])
+		except get_user_model().DoesNotExist:
+			raise CommandError(f"User {options['user']} does not exist")
+
+		path = options['path']
+		file_format = options['format'] or FORMATS.get(
+			os.path.splitext(path)[1].lower()
+		)
+		if file_format is None:
+			raise CommandError(
+				'Unable to guess the file format, use --format'
+			)
+
+		self.verbosity = options['verbosity']
+		with open(path, newline='', encoding='utf-8') as file:
+			with transaction.atomic(), connection.cursor() as cursor:
+				self.create_staging_table(cursor)
+				copied, skipped = self.copy_rows(
+					cursor,
+					READERS[file_format](file),
+					user.lead_dedupe,
+					options['chunk_size'],
+				)
+				imported = self.merge_staging_table(cursor, user)
+				if imported:
+					user.bump_data_version()
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Imported {imported} leads ({copied} valid rows, '
+			f'{copied - imported} duplicates and '
+			f'{skipped} invalid rows skipped)'
+		))
+
+	def create_staging_table(self, cursor):
+		"""It creates the staging table, dropped when the import commits"""
+		cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+		cursor.execute(
+			f'CREATE TEMPORARY TABLE {STAGING_TABLE} ('
+			'fname varchar(255) NOT NULL, '
+			'lname varchar(255) NOT NULL, '
+			'email varchar(254) NOT NULL, '
+			'phone varchar(128) NOT NULL, '
+			'ip inet, '
+			'dedupe_key varchar(400), '
+			'ip_country varchar(2), '
+			'ip_region varchar(255), '
+			'ip_asn bigint'
+			') ON COMMIT DROP'
+		)
+
+	def copy_rows(self, cursor, rows, dedupe, chunk_size):
+		"""
+		It copies the valid rows into the staging table,
+		one COPY FROM STDIN per chunk
+
+		:return: the number of copied rows and of skipped rows
+		"""
+		copied = skipped = 0
+		index = ipranges.get_index()
+		buffer = io.StringIO()
+		writer = csv.writer(buffer)
+		pending = 0
+
+		for line, row in enumerate(rows, start=1):
+			try:
+				writer.writerow(clean_row(row, dedupe, index))
+			except ValidationError as exc:
+				skipped += 1
+				if self.verbosity >= 2:
+					self.stderr.write(f'row {line}: {"; ".join(exc.messages)}')
+				continue
+			pending += 1
+			if pending >= chunk_size:
+				self.copy_buffer(cursor, buffer)
+				copied += pending
+				pending = 0
+				buffer.seek(0)
+				buffer.truncate()
+
+		if pending:
+			self.copy_buffer(cursor, buffer)
+			copied += pending
+
+		return copied, skipped
+
+	def copy_buffer(self, cursor, buffer):
+		"""It sends the CSV rows of the buffer to the staging table"""
+		buffer.seek(0)
+		# the psycopg2 cursor under the django cursor wrapper.
+		cursor.cursor.copy_expert(
+			f'COPY {STAGING_TABLE} ({", ".join(STAGING_COLUMNS)}) '
+			'FROM STDIN WITH (FORMAT csv)',
+			buffer,
+		)
+
+	def merge_staging_table(self, cursor, user):
+		"""
+		It inserts the staged rows into core_lead for the user,
+		the rows conflicting on the dedupe key are skipped
+
+		:return: the number of inserted leads
+		"""
+		columns = ', '.join(STAGING_COLUMNS)
+		cursor.execute(
+			f'INSERT INTO core_lead (user_id, {columns}) '
+			f'SELECT %s, {columns} FROM {STAGING_TABLE} '
+			'ON CONFLICT (user_id, dedupe_key) DO NOTHING',
+			[user.id],
+		)
+		return cursor.rowcount
@@ -0,0 +1,112 @@
+"""a Django command that moves core_lead online to a partitioned table"""
+
+from core import partitioning
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+	"""a Django command that moves core_lead online to a partitioned table"""
+
+	help = (
+		'Move the lead table online to a table hash partitioned on user_id, '
+		'step by step: prepare, backfill, verify, swap then drop. '
+		'abort undoes prepare. See core/partitioning.py.'
+	)
+
+	def add_arguments(self, parser):
+		"""the step and its options"""
+		parser.add_argument(
+			'step',
+			choices=(
+				'status', 'prepare', 'backfill', 'verify', 'swap', 'drop',
+				'abort',
+			),
+		)
+		parser.add_argument(
+			'--partitions', type=int, default=settings.LEAD_PARTITIONS,
+			help='the number of hash partitions created by prepare',
+		)
+		parser.add_argument(
+			'--batch-size', type=int, default=10000,
+			help='the leads copied per backfill transaction',
+		)
+		parser.add_argument(
+			'--start-id', type=int, default=0,
+			help='the id after which backfill copies, to resume it',
+		)
+		parser.add_argument(
+			'--pause', type=float, default=0.0,
+			help='the seconds slept between backfill batches',
+		)
+		parser.add_argument(
+			'--lock-timeout', default='5s',
+			help='the wait for the lead table lock of prepare and swap',
+		)
+
+	def handle(self, *args, **options):
+		"""It runs the step"""
+		step = options['step']
+		try:
+			getattr(self, f'run_{step}')(options)
+		except partitioning.PartitioningError as error:
+			raise CommandError(str(error))
+
+	def run_status(self, options):
+		"""writing the step the move is at"""
+		self.stdout.write(f'The lead table is {partitioning.state()}')
+
+	def run_prepare(self, options):
+		"""creating the shadow table and the mirroring trigger"""
+		partitioning.prepare(options['partitions'], options['lock_timeout'])
+		self.stdout.write(self.style.SUCCESS(
+			f'Created {options["partitions"]} partitions, '
+			f'writes are mirrored from now on'
+		))
+
+	def run_backfill(self, options):
+		"""copying the leads, writing the progress to resume from"""
+		def progress(last_id, total):
+			self.stdout.write(f'Copied {total} leads up to id {last_id}')
+
+		total = partitioning.backfill(
+			options['batch_size'],
+			start_id=options['start_id'],
+			pause=options['pause'],
+			progress=progress,
+		)
+		self.stdout.write(self.style.SUCCESS(f'Backfilled {total} leads'))
+
+	def run_verify(self, options):
+		"""comparing both tables"""
+		source, shadow = partitioning.verify()
+		if source != shadow:
+			raise CommandError(
+				f'The tables differ: {source[0]} leads in core_lead, '
+				f'{shadow[0]} in the partitioned table, run backfill'
+			)
+		self.stdout.write(self.style.SUCCESS(
+			f'Both tables hold the same {source[0]} leads'
+		))
+
+	def run_swap(self, options):
+		"""putting the partitioned table in place"""
+		partitioning.swap(options['lock_timeout'])
+		self.stdout.write(self.style.SUCCESS(
+			f'The lead table is partitioned, the previous one is kept as '
+			f'{partitioning.RETIRED}'
+		))
+
+	def run_drop(self, options):
+		"""dropping the unpartitioned table"""
+		partitioning.drop()
+		self.stdout.write(self.style.SUCCESS(
+			f'Dropped {partitioning.RETIRED}'
+		))
+
+	def run_abort(self, options):
+		"""dropping the shadow table"""
+		partitioning.abort()
+		self.stdout.write(self.style.SUCCESS(
+			f'Dropped {partitioning.SHADOW}'
+		))
@@ -0,0 +1,153 @@
+"""a Django command that runs the production server"""
+
+import time
+
+from app.db.pool import close_pools
+from core import schema, throttling
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import get_resolver
+from gunicorn.app.base import BaseApplication
+
+
+def post_fork(server, worker):
+	"""recording when the worker was forked"""
+	worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+	"""reporting the worker cold start, from the fork to serving"""
+	worker.log.info(
+		'Worker %s ready in %.1f ms',
+		worker.pid,
+		(time.perf_counter() - worker.forked_at) * 1000,
+	)
+
+
+def child_exit(server, worker):
+	"""uncounting the requests of an exited worker, in the master"""
+	throttling.state.release_process(worker.pid)
+
+
+def worker_exit(server, worker):
+	"""closing the database connections of a stopping worker"""
+	connections.close_all()
+	close_pools()
+
+
+class Server(BaseApplication):
+	"""
+	A gunicorn application serving app.wsgi or app.asgi.
+
+	The application and the URLconf are loaded once in the master before
+	the workers are forked, so the workers share them copy-on-write.
+	"""
+
+	def __init__(self, application, options, report):
+		"""
+		:param application: the dotted path of the application to serve
+		:param options: the gunicorn settings
+		:param report: a callable writing the preload duration
+		"""
+		self.application_path = application
+		self.options = options
+		self.report = report
+		super().__init__()
+
+	def load_config(self):
+		"""setting the gunicorn settings"""
+		for key, value in self.options.items():
+			self.cfg.set(key, value)
+
+	def load(self):
+		"""
+		It imports the application and every URL module and view, and the
+		cached API schema, then closes the database connections so none is
+		shared by a fork
+		"""
+		start = time.perf_counter()
+		module_name, name = self.application_path.split(':')
+		module = __import__(module_name, fromlist=[name])
+		application = getattr(module, name)
+		# resolving the URLconf imports the URL modules and their views.
+		get_resolver().url_patterns
+		if settings.API_SCHEMA_CACHE:
+			schema.load()
+		connections.close_all()
+		self.report(
+			f'Preloaded {self.application_path} '
+			f'in {(time.perf_counter() - start) * 1000:.1f} ms'
+		)
+		return application
+
+
+class Command(BaseCommand):
+	"""a Django command that runs the production server"""
+
+	help = (
+		'Run the production server: preloaded application, '
+		'preforked workers recycled after a number of requests.'
+	)
+
+	def add_arguments(self, parser):
+		"""the server options, defaulting to the SERVE_* settings"""
+		parser.add_argument('--bind', default=settings.SERVE_BIND)
+		parser.add_argument(
+			'--workers', type=int, default=settings.SERVE_WORKERS,
+		)
+		parser.add_argument(
+			'--threads', type=int, default=settings.SERVE_THREADS,
+			help='the threads per worker, WSGI only',
+		)
+		parser.add_argument(
+			'--max-requests', type=int, default=settings.SERVE_MAX_REQUESTS,
+			help='the requests after which a worker is replaced, 0 never',
+		)
+		parser.add_argument(
+			'--max-requests-jitter', type=int,
+			default=settings.SERVE_MAX_REQUESTS_JITTER,
+		)
+		parser.add_argument(
+			'--timeout', type=int, default=settings.SERVE_TIMEOUT,
+		)
+		parser.add_argument(
+			'--graceful-timeout', type=int,
+			default=settings.SERVE_GRACEFUL_TIMEOUT,
+			help='the seconds a stopping worker has to finish its requests',
+		)
+		parser.add_argument(
+			'--asgi', action='store_true',
+			help='serve app.asgi with uvicorn workers',
+		)
+
+	def handle(self, *args, **options):
+		"""It runs the server until it is stopped"""
+		options_map = {
+			'bind':                options['bind'],
+			'workers':             options['workers'],
+			'threads':             options['threads'],
+			'max_requests':        options['max_requests'],
+			'max_requests_jitter': options['max_requests_jitter'],
+			'timeout':             options['timeout'],
+			'graceful_timeout':    options['graceful_timeout'],
+			'preload_app':         True,
+			'accesslog':           '-',
+			'post_fork':           post_fork,
+			'post_worker_init':    post_worker_init,
+			'worker_exit':         worker_exit,
+			'child_exit':          child_exit,
+		}
+		application = 'app.wsgi:application'
+
+		if options['asgi']:
+			try:
+				import uvicorn.workers  # noqa: F401
+			except ImportError:
+				raise CommandError('Serving app.asgi requires uvicorn')
+			options_map['worker_class'] = 'uvicorn.workers.UvicornWorker'
+			application = 'app.asgi:application'
+		elif options['threads'] > 1:
+			options_map['worker_class'] = 'gthread'
+
+		Server(application, options_map, self.stdout.write).run()
@@ -0,0 +1,108 @@
+"""
+Per request metrics: query count, database, serializer and auth time
+"""
+import collections
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from rest_framework.request import Request
+from rest_framework.serializers import BaseSerializer
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_instrumented = False
+
+
+class RequestMetrics:
+	"""
+	The metrics of a request: the number of queries and the seconds spent
+	in the database, the serializers and the authentication.
+
+	The timings may overlap, the queries run by a serializer count in the
+	database time and in the serializer time.
+	"""
+
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.queries = 0
+		self.timings = collections.defaultdict(float)
+		self._running = set()
+
+	@contextmanager
+	def timer(self, name):
+		"""
+		It adds the duration of the block to the timing of the name,
+		a block nested in a block of the same name isn't counted twice
+		"""
+		if name in self._running:
+			yield
+			return
+		self._running.add(name)
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.timings[name] += time.perf_counter() - start
+			self._running.discard(name)
+
+	def execute(self, execute, sql, params, many, context):
+		"""a database execute wrapper counting and timing the queries"""
+		self.queries += 1
+		with self.timer('db'):
+			return execute(sql, params, many, context)
+
+	def elapsed(self):
+		"""returns the seconds since the request started"""
+		return time.perf_counter() - self.started
+
+
+def current():
+	"""returns the metrics of the current request, None when not collected"""
+	return _current.get()
+
+
+@contextmanager
+def collect():
+	"""It collects the metrics of the block, yielding them"""
+	metrics = RequestMetrics()
+	token = _current.set(metrics)
+	try:
+		yield metrics
+	finally:
+		_current.reset(token)
+
+
+def timed(name):
+	"""a decorator adding the calls duration to the timing of the name"""
+
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			metrics = _current.get()
+			if metrics is None:
+				return function(*args, **kwargs)
+			with metrics.timer(name):
+				return function(*args, **kwargs)
+		return wrapper
+
+	return decorator
+
+
+def instrument():
+	"""
+	It times the serializers validation and representation and the DRF
+	authentication, once per process. The wrappers only read a context
+	variable when no metrics are collected.
+	"""
+	global _instrumented
+	if _instrumented:
+		return
+	_instrumented = True
+
+	BaseSerializer.is_valid = timed('serializer')(BaseSerializer.is_valid)
+	BaseSerializer.data = property(
+		timed('serializer')(BaseSerializer.data.fget)
+	)
+	Request._authenticate = timed('auth')(Request._authenticate)
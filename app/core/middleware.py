@@ -0,0 +1,136 @@
+"""
+Middleware of the API
+"""
+import json
+import logging
+from contextlib import ExitStack
+
+from app.db import pool, router
+from core import metrics, throttling
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.translation import gettext as _
+from rest_framework.permissions import SAFE_METHODS
+
+
+logger = logging.getLogger(__name__)
+
+# the Server-Timing metrics, in the header order.
+TIMINGS = ('db', 'serializer', 'auth')
+
+
+class RequestMetricsMiddleware:
+	"""
+	Record the query count, the database, serializer and auth time of
+	each request. They are sent in the Server-Timing header and logged
+	as JSON by the core.middleware logger, with the stats of the
+	connection pools of the process under DB_POOL.
+
+	Enabled by REQUEST_METRICS=true. The body of a streaming response is
+	generated after the middleware returns, its queries aren't counted.
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		metrics.instrument()
+
+	def __call__(self, request):
+		with metrics.collect() as current, ExitStack() as stack:
+			for connection in connections.all():
+				stack.enter_context(
+					connection.execute_wrapper(current.execute)
+				)
+			response = self.get_response(request)
+			total = current.elapsed()
+
+		response['Server-Timing'] = self.server_timing(current, total)
+		entry = {
+			'method':     request.method,
+			'path':       request.path,
+			'status':     response.status_code,
+			'queries':    current.queries,
+			**{
+				f'{name}_ms': round(current.timings[name] * 1000, 3)
+				for name in TIMINGS
+			},
+			'total_ms':   round(total * 1000, 3),
+		}
+		if settings.DB_POOL:
+			# the connection pools of the process, by database alias.
+			entry['pools'] = {
+				alias: stats for (alias, _key), stats in pool.get_stats().items()
+			}
+		logger.info(json.dumps(entry))
+		return response
+
+	def server_timing(self, current, total):
+		"""returns the Server-Timing header value of the metrics"""
+		entries = [
+			f'db;dur={current.timings["db"] * 1000:.3f};'
+			f'desc="{current.queries} queries"',
+		]
+		entries += [
+			f'{name};dur={current.timings[name] * 1000:.3f}'
+			for name in TIMINGS[1:]
+		]
+		entries.append(f'total;dur={total * 1000:.3f}')
+		return ', '.join(entries)
+
+
+class ReplicaRoutingMiddleware:
+	"""
+	Send the reads of the safe requests to the read replicas, see
+	app.db.router. The reads go back to the primary once the request is
+	finished, after a streaming response is consumed.
+
+	Enabled by DB_REPLICAS.
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		request_finished.connect(
+			router.read_primary, dispatch_uid='replica_routing',
+		)
+
+	def __call__(self, request):
+		if request.method in SAFE_METHODS:
+			router.read_replicas()
+		else:
+			router.read_primary()
+		return self.get_response(request)
+
+
+class LoadSheddingMiddleware:
+	"""
+	Answer 503 with Retry-After, before any query, while
+	LOAD_SHED_MAX_REQUESTS requests are being served by all the processes
+	of the server, see core.throttling. It comes first in MIDDLEWARE.
+
+	Enabled by LOAD_SHED_MAX_REQUESTS.
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		if not throttling.enter():
+			response = JsonResponse(
+				{'detail': _('The server is overloaded, retry later.')},
+				status=503,
+			)
+			response['Retry-After'] = str(settings.LOAD_SHED_RETRY_AFTER)
+			return response
+		try:
+			response = self.get_response(request)
+		except BaseException:
+			throttling.leave()
+			raise
+		if response.streaming:
+			# counted until its body is sent, the server closes the
+			# response once done or when the client is gone.
+			response._resource_closers.append(throttling.leave)
+		else:
+			throttling.leave()
+		return response
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_lead_ip'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lead',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['user', '-id'], name='core_lead_user_id_idx'),
+        ),
+    ]
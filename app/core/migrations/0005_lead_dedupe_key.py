@@ -0,0 +1,27 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_lead_user_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='dedupe_key',
+            field=models.CharField(blank=True, editable=False, max_length=400, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='lead_dedupe',
+            field=models.CharField(blank=True, choices=[('', 'No deduplication'), ('email', 'Email'), ('phone', 'Phone'), ('email_phone', 'Email and phone')], default='', max_length=16),
+        ),
+        migrations.AddConstraint(
+            model_name='lead',
+            constraint=models.UniqueConstraint(fields=('user', 'dedupe_key'), name='core_lead_user_dedupe_key_uniq'),
+        ),
+    ]
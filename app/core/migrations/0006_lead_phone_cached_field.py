@@ -0,0 +1,19 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:28
+
+import core.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_lead_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lead',
+            name='phone',
+            field=core.fields.PhoneNumberField(max_length=128, region=None),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_lead_phone_cached_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_modified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
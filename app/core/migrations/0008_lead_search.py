@@ -0,0 +1,43 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:47
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from core.search import trigram_index
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    creating pg_trgm and the trigram index of the lead search when the
+    extension is available, the search falls back to full text otherwise
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(apps.get_model('core', 'Lead'), trigram_index())
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute(
+        f'DROP INDEX IF EXISTS {trigram_index().name}'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_user_data_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('fname', 'lname', 'email', 'phone', config='simple'), name='core_lead_search_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_lead_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadIngest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('fname', models.CharField(max_length=255)),
+                ('lname', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(max_length=128)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('created', 'Created'), ('duplicate', 'Duplicate')], default='pending', max_length=16)),
+                ('lead_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='leadingest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='core_leadingest_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# the counters are kept by statement level triggers reading the transition
+# tables, so multi-row inserts, COPY and deletes update them set based.
+# the rows are upserted in (user_id, day) order so concurrent statements
+# don't deadlock, a delete only decrements existing counters.
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_lead_stats_insert() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO core_leadstats AS stats (user_id, total)
+    SELECT user_id, count(*) FROM inserted GROUP BY user_id ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET total = stats.total + EXCLUDED.total;
+
+    INSERT INTO core_leaddailystats AS stats (user_id, day, count)
+    SELECT user_id, (created_at AT TIME ZONE 'UTC')::date AS day, count(*)
+    FROM inserted WHERE created_at IS NOT NULL
+    GROUP BY user_id, day ORDER BY user_id, day
+    ON CONFLICT (user_id, day) DO UPDATE SET count = stats.count + EXCLUDED.count;
+    RETURN NULL;
+END
+$$;
+
+CREATE FUNCTION core_lead_stats_delete() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE core_leadstats AS stats SET total = stats.total - deleted.count
+    FROM (
+        SELECT user_id, count(*) FROM deleted GROUP BY user_id ORDER BY user_id
+    ) AS deleted
+    WHERE stats.user_id = deleted.user_id;
+
+    UPDATE core_leaddailystats AS stats SET count = stats.count - deleted.count
+    FROM (
+        SELECT user_id, (created_at AT TIME ZONE 'UTC')::date AS day, count(*)
+        FROM deleted WHERE created_at IS NOT NULL
+        GROUP BY user_id, day ORDER BY user_id, day
+    ) AS deleted
+    WHERE stats.user_id = deleted.user_id AND stats.day = deleted.day;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER core_lead_stats_insert AFTER INSERT ON core_lead
+REFERENCING NEW TABLE AS inserted
+FOR EACH STATEMENT EXECUTE FUNCTION core_lead_stats_insert();
+
+CREATE TRIGGER core_lead_stats_delete AFTER DELETE ON core_lead
+REFERENCING OLD TABLE AS deleted
+FOR EACH STATEMENT EXECUTE FUNCTION core_lead_stats_delete();
+
+INSERT INTO core_leadstats (user_id, total)
+SELECT user_id, count(*) FROM core_lead GROUP BY user_id;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_lead_stats_insert ON core_lead;
+DROP TRIGGER core_lead_stats_delete ON core_lead;
+DROP FUNCTION core_lead_stats_insert();
+DROP FUNCTION core_lead_stats_delete();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_leadingest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lead_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.BigIntegerField(default=0)),
+            ],
+        ),
+        # the existing leads keep a null created_at, the default now() is
+        # set after adding the column so the table isn't rewritten.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'ALTER TABLE core_lead '
+                    'ADD COLUMN created_at timestamp with time zone NULL; '
+                    'ALTER TABLE core_lead '
+                    'ALTER COLUMN created_at SET DEFAULT now();',
+                    'ALTER TABLE core_lead DROP COLUMN created_at;',
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='lead',
+                    name='created_at',
+                    field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False, null=True),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeadDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='leaddailystats',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='core_leaddailystats_user_day_uniq'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
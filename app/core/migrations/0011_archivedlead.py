@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:06
+
+from django.conf import settings
+from core.partitioning import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    # the index of the lead table is built without blocking the writes,
+    # on each partition when the lead table is partitioned.
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_lead_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLead',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fname', models.CharField(max_length=255)),
+                ('lname', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(max_length=128)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='lead',
+            index=models.Index(fields=['created_at'], name='core_lead_created_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedlead',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedlead',
+            index=models.Index(fields=['user', '-id'], name='core_archivedlead_user_id_idx'),
+        ),
+    ]
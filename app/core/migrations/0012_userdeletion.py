@@ -0,0 +1,29 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:09
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_archivedlead'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('user_id', models.BigIntegerField()),
+                ('email', models.EmailField(max_length=254)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=16)),
+                ('leads_total', models.BigIntegerField(default=0)),
+                ('leads_deleted', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
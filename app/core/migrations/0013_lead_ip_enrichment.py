@@ -0,0 +1,28 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_userdeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='ip_asn',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='ip_country',
+            field=models.CharField(blank=True, editable=False, max_length=2, null=True),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='ip_region',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+    ]
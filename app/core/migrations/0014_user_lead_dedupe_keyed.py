@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_lead_ip_enrichment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='lead_dedupe_keyed',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, null=True),
+        ),
+        # the keys of the existing leads were built with the current mode.
+        migrations.RunSQL(
+            'UPDATE core_user SET lead_dedupe_keyed = lead_dedupe',
+            migrations.RunSQL.noop,
+        ),
+    ]
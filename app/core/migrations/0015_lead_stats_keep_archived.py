@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+# the leads deleted by archive_leads, which sets lead.archiving, stay in
+# the counters, they are moved to core_archivedlead.
+KEEP_ARCHIVED = """
+CREATE OR REPLACE FUNCTION core_lead_stats_delete() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('lead.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE core_leadstats AS stats SET total = stats.total - deleted.count
+    FROM (
+        SELECT user_id, count(*) FROM deleted GROUP BY user_id ORDER BY user_id
+    ) AS deleted
+    WHERE stats.user_id = deleted.user_id;
+
+    UPDATE core_leaddailystats AS stats SET count = stats.count - deleted.count
+    FROM (
+        SELECT user_id, (created_at AT TIME ZONE 'UTC')::date AS day, count(*)
+        FROM deleted WHERE created_at IS NOT NULL
+        GROUP BY user_id, day ORDER BY user_id, day
+    ) AS deleted
+    WHERE stats.user_id = deleted.user_id AND stats.day = deleted.day;
+    RETURN NULL;
+END
+$$;
+"""
+
+COUNT_ARCHIVED = """
+CREATE OR REPLACE FUNCTION core_lead_stats_delete() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE core_leadstats AS stats SET total = stats.total - deleted.count
+    FROM (
+        SELECT user_id, count(*) FROM deleted GROUP BY user_id ORDER BY user_id
+    ) AS deleted
+    WHERE stats.user_id = deleted.user_id;
+
+    UPDATE core_leaddailystats AS stats SET count = stats.count - deleted.count
+    FROM (
+        SELECT user_id, (created_at AT TIME ZONE 'UTC')::date AS day, count(*)
+        FROM deleted WHERE created_at IS NOT NULL
+        GROUP BY user_id, day ORDER BY user_id, day
+    ) AS deleted
+    WHERE stats.user_id = deleted.user_id AND stats.day = deleted.day;
+    RETURN NULL;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_lead_dedupe_keyed'),
+    ]
+
+    operations = [
+        migrations.RunSQL(KEEP_ARCHIVED, COUNT_ARCHIVED),
+    ]
@@ -0,0 +1,73 @@
+"""
+Mixins shared by the API views
+"""
+import hashlib
+
+from django.utils.cache import (
+	get_conditional_response,
+	patch_cache_control,
+	patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+	"""
+	Answer the reads of the authenticated user with ETag and Last-Modified,
+	versioned by the data version of the user.
+
+	The version is loaded with the user by the authentication, so a read
+	matching If-None-Match or If-Modified-Since is answered 304 without
+	any query nor serialization. Views bump the version with
+	User.bump_data_version whenever they change the data.
+	"""
+
+	def get_etag(self, request):
+		"""
+		returns the ETag of the response to the request,
+		a hash of the user data version, the URL and the accepted media type
+		"""
+		user = request.user
+		key = ':'.join([
+			str(user.pk),
+			str(user.data_version),
+			request.get_full_path(),
+			request.META.get('HTTP_ACCEPT', ''),
+		])
+		return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+	def conditional_get(self, request, view, *args, **kwargs):
+		"""
+		It answers 304 when the client has the current version,
+		otherwise it runs the view and tags its response
+
+		:param view: the view method answering the request
+		"""
+		etag = self.get_etag(request)
+		modified_at = request.user.data_modified_at
+		last_modified = int(modified_at.timestamp()) if modified_at else None
+
+		not_modified = get_conditional_response(
+			request,
+			etag=etag,
+			last_modified=last_modified,
+		)
+		if not_modified is not None:
+			return self.tag_response(not_modified, etag, last_modified)
+
+		response = view(request, *args, **kwargs)
+		if response.status_code == 200:
+			self.tag_response(response, etag, last_modified)
+		return response
+
+	def tag_response(self, response, etag, last_modified):
+		"""
+		It sets the validators of the response, cacheable by the client only
+		since it depends on the authenticated user
+		"""
+		response['ETag'] = etag
+		if last_modified is not None:
+			response['Last-Modified'] = http_date(last_modified)
+		patch_cache_control(response, private=True, no_cache=True)
+		patch_vary_headers(response, ['Accept', 'Authorization'])
+		return response
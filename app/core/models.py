@@ -1,13 +1,21 @@
 """
 DATABASE Core models
 """
+import uuid
+
 from django.contrib.auth.models import (
 	AbstractBaseUser,
 	BaseUserManager,
 	PermissionsMixin,
 )
-from django.db import models
-from phonenumber_field.modelfields import PhoneNumberField
+from core import ipranges
+from core.fields import PhoneNumberField
+from core.normalization import dedupe_key
+from core.search import search_vector
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connection, models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
 from app import settings
 
@@ -43,18 +51,151 @@ class UserManager(BaseUserManager):
 class User(AbstractBaseUser, PermissionsMixin):
 	"""user in the system."""
 
+	class LeadDedupe(models.TextChoices):
+		"""the contact details identifying duplicated leads of the user"""
+		NONE = '', _('No deduplication')
+		EMAIL = 'email', _('Email')
+		PHONE = 'phone', _('Phone')
+		EMAIL_PHONE = 'email_phone', _('Email and phone')
+
 	email = models.EmailField(max_length=255, unique=True)
 	name = models.CharField(max_length=255)
 	is_active = models.BooleanField(default=True)
 	is_staff = models.BooleanField(default=False)
+	lead_dedupe = models.CharField(
+		max_length=16,
+		choices=LeadDedupe.choices,
+		default=LeadDedupe.NONE,
+		blank=True,
+	)
+	# the lead_dedupe the dedupe keys of the leads were built with, null
+	# while rekey_leads rebuilds them after a change, see lead.dedupe.
+	lead_dedupe_keyed = models.CharField(
+		max_length=16,
+		default=LeadDedupe.NONE,
+		blank=True,
+		null=True,
+		editable=False,
+	)
+	# bumped whenever the profile or the leads of the user change,
+	# it versions the ETag and Last-Modified of the user and lead reads.
+	data_version = models.PositiveBigIntegerField(default=0, editable=False)
+	data_modified_at = models.DateTimeField(
+		blank=True,
+		null=True,
+		editable=False,
+	)
 
 	objects = UserManager()
 
 	USERNAME_FIELD = 'email'
 
+	# only written by bump_data_version, so saving a user loaded before
+	# a bump never writes back the old version.
+	VERSION_FIELDS = ('data_version', 'data_modified_at')
+	# only written by lead.dedupe, for the same reason.
+	KEYED_FIELDS = ('lead_dedupe_keyed',)
+
 	def __str__(self):
 		return self.name
 
+	def save(self, *args, **kwargs):
+		"""saving the user without its data version and keyed fields"""
+		if not self._state.adding and kwargs.get('update_fields') is None:
+			managed = self.VERSION_FIELDS + self.KEYED_FIELDS
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in managed
+			]
+		super().save(*args, **kwargs)
+
+	def bump_data_version(self):
+		"""
+		It increments the data version of the user in the database,
+		invalidating the cached reads of the profile and of the leads
+		"""
+		now = timezone.now()
+		type(self).objects.filter(pk=self.pk).update(
+			data_version=models.F('data_version') + 1,
+			data_modified_at=now,
+		)
+		self.data_version += 1
+		self.data_modified_at = now
+
+
+class LeadManager(models.Manager):
+	"""Manager for the leads, inserting with ON CONFLICT on the dedupe key"""
+
+	def insert(self, leads, batch_size=1000):
+		"""
+		It inserts the leads with INSERT ... ON CONFLICT DO NOTHING,
+		so a lead whose dedupe key already exists for its user is skipped
+		by the unique index instead of being looked up first. With
+		LEAD_IP_INDEX the country, region and ASN of their ip are set.
+
+		:param leads: unsaved Lead objects, with their user set
+		:param batch_size: the number of leads per INSERT statement
+		:return: the inserted leads, with their id set
+		"""
+		meta = self.model._meta
+		fields = [field for field in meta.concrete_fields
+		          if not field.primary_key]
+		columns = ', '.join(
+			connection.ops.quote_name(field.column) for field in fields
+		)
+		# typed, the VALUES of a subquery being text otherwise.
+		row = '(%s, ' + ', '.join(
+			f'%s::{field.cast_db_type(connection)}' for field in fields
+		) + ')'
+		# postgres accepts at most 65535 parameters per statement.
+		batch_size = min(batch_size, 65535 // (len(fields) + 1))
+
+		index = ipranges.get_index()
+		inserted = []
+		for start in range(0, len(leads), batch_size):
+			batch = leads[start:start + batch_size]
+			params = [meta.db_table, meta.pk.column]
+			for position, lead in enumerate(batch):
+				lead.dedupe_key = lead.build_dedupe_key()
+				if index is not None:
+					ipranges.enrich(lead, index)
+				params.append(position)
+				params.extend(
+					field.get_db_prep_save(
+						field.pre_save(lead, True),
+						connection,
+					) for field in fields
+				)
+
+			# the ids are drawn before the insert, so the inserted rows
+			# are matched with the batch by id whatever order postgres
+			# returns them in, the skipped ones are missing.
+			with connection.cursor() as cursor:
+				cursor.execute(
+					f'WITH batch AS MATERIALIZED ('
+					f'SELECT position, nextval(pg_get_serial_sequence(%s, %s)) '
+					f'AS id, {columns} '
+					f'FROM (VALUES {", ".join([row] * len(batch))}) '
+					f'AS batch (position, {columns}) ORDER BY position'
+					f'), inserted AS ('
+					f'INSERT INTO {meta.db_table} ({meta.pk.column}, {columns}) '
+					f'SELECT id, {columns} FROM batch ORDER BY position '
+					'ON CONFLICT (user_id, dedupe_key) DO NOTHING '
+					'RETURNING id'
+					') SELECT batch.position, batch.id '
+					'FROM batch JOIN inserted USING (id)',
+					params,
+				)
+				returned = dict(cursor.fetchall())
+
+			for position, lead in enumerate(batch):
+				if position in returned:
+					lead.id = returned[position]
+					lead._state.adding = False
+					inserted.append(lead)
+
+		return inserted
+
 
 class Lead(models.Model):
 	"""Basic Lead model"""
@@ -62,13 +203,228 @@ class Lead(models.Model):
 	user = models.ForeignKey(
 		settings.AUTH_USER_MODEL,
 		on_delete=models.CASCADE,
-	)  # the user is the owner of the lead
+		db_index=False,
+	)  # the user is the owner of the lead, indexed by core_lead_user_id_idx
 
 	fname = models.CharField(max_length=255)
 	lname = models.CharField(max_length=255)
 	email = models.EmailField()
 	phone = PhoneNumberField()
 	ip = models.GenericIPAddressField(blank=True, null=True)
+	# the country, region and autonomous system of the ip in the
+	# LEAD_IP_INDEX ranges, null when unknown or not enriched yet.
+	ip_country = models.CharField(
+		max_length=2, blank=True, null=True, editable=False,
+	)
+	ip_region = models.CharField(
+		max_length=255, blank=True, null=True, editable=False,
+	)
+	ip_asn = models.PositiveBigIntegerField(
+		blank=True, null=True, editable=False,
+	)
+	# null for the leads created before it was recorded, defaults to now()
+	# in the database too so the COPY imports set it.
+	created_at = models.DateTimeField(
+		default=timezone.now,
+		blank=True,
+		null=True,
+		editable=False,
+	)
+	# normalized email and/or phone, according to the user lead_dedupe,
+	# null when the leads of the user are not deduplicated.
+	dedupe_key = models.CharField(
+		max_length=400,
+		blank=True,
+		null=True,
+		editable=False,
+	)
+
+	objects = LeadManager()
+
+	class Meta:
+		indexes = [
+			# serves every per user lookup ordered by newest first,
+			# so listing, retrieving and deleting leads never sort.
+			models.Index(fields=['user', '-id'], name='core_lead_user_id_idx'),
+			# the full text search of the leads, the trigram index of the
+			# fuzzy search is created by migration when pg_trgm is available.
+			GinIndex(search_vector(), name='core_lead_search_idx'),
+			# the oldest leads first, read by archive_leads.
+			models.Index(fields=['created_at'], name='core_lead_created_at_idx'),
+		]
+		constraints = [
+			models.UniqueConstraint(
+				fields=['user', 'dedupe_key'],
+				name='core_lead_user_dedupe_key_uniq',
+			),
+		]
+
+	def __str__(self):
+		return self.email
+
+	def save(self, *args, **kwargs):
+		"""setting the dedupe key of a new lead before saving it"""
+		if self._state.adding:
+			self.dedupe_key = self.build_dedupe_key()
+		super().save(*args, **kwargs)
+
+	def build_dedupe_key(self):
+		"""returns the dedupe key of the lead for the dedupe mode of its user"""
+		return dedupe_key(self.user.lead_dedupe, self.email, self.phone)
+
+
+class LeadStats(models.Model):
+	"""
+	The number of leads of a user, archived ones included.
+
+	It is maintained by the statement level triggers on core_lead of
+	migration 0010, so every insert, COPY and delete of leads updates it
+	in the same transaction, but the deletes of archive_leads.
+	rebuild_lead_stats recomputes it.
+	"""
+
+	user = models.OneToOneField(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		primary_key=True,
+		related_name='lead_stats',
+	)
+	total = models.BigIntegerField(default=0)
+
+
+class LeadDailyStats(models.Model):
+	"""
+	The number of leads of a user by creation day (UTC), maintained by
+	the triggers like LeadStats. The leads without created_at count in
+	LeadStats only.
+	"""
+
+	user = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		db_index=False,
+	)  # indexed by core_leaddailystats_user_day_uniq
+	day = models.DateField()
+	count = models.BigIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=['user', 'day'],
+				name='core_leaddailystats_user_day_uniq',
+			),
+		]
+
+
+class ArchivedLead(models.Model):
+	"""
+	A lead moved out of core_lead by archive_leads once older than
+	LEAD_ARCHIVE_AFTER_DAYS, keeping its id. The archived leads are read
+	only and aren't searched nor deduplicated.
+	"""
+
+	id = models.BigIntegerField(primary_key=True)
+	user = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		db_index=False,
+	)  # indexed by core_archivedlead_user_id_idx
+	fname = models.CharField(max_length=255)
+	lname = models.CharField(max_length=255)
+	email = models.EmailField()
+	# the phone number, in E.164.
+	phone = models.CharField(max_length=128)
+	ip = models.GenericIPAddressField(blank=True, null=True)
+	created_at = models.DateTimeField(blank=True, null=True)
+	archived_at = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		indexes = [
+			models.Index(
+				fields=['user', '-id'],
+				name='core_archivedlead_user_id_idx',
+			),
+		]
+
+	def __str__(self):
+		return self.email
+
+
+class LeadIngest(models.Model):
+	"""
+	A lead accepted by the async ingest, staged until a drain_leads worker
+	inserts it. The row is kept as the receipt of the lead.
+	"""
+
+	class Status(models.TextChoices):
+		"""the outcomes of a staged lead"""
+		PENDING = 'pending', _('Pending')
+		CREATED = 'created', _('Created')
+		DUPLICATE = 'duplicate', _('Duplicate')
+
+	receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+	user = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+	)
+	fname = models.CharField(max_length=255)
+	lname = models.CharField(max_length=255)
+	email = models.EmailField()
+	# the validated phone number, in E.164.
+	phone = models.CharField(max_length=128)
+	ip = models.GenericIPAddressField(blank=True, null=True)
+	status = models.CharField(
+		max_length=16,
+		choices=Status.choices,
+		default=Status.PENDING,
+	)
+	# the created lead, not a foreign key so deleting leads never
+	# looks the receipts up.
+	lead_id = models.BigIntegerField(blank=True, null=True)
+	created_at = models.DateTimeField(default=timezone.now)
+	processed_at = models.DateTimeField(blank=True, null=True)
+
+	class Meta:
+		indexes = [
+			# the queue: the pending leads in arrival order.
+			models.Index(
+				fields=['id'],
+				name='core_leadingest_pending_idx',
+				condition=models.Q(status='pending'),
+			),
+		]
+
+	def __str__(self):
+		return str(self.receipt)
+
+
+class UserDeletion(models.Model):
+	"""
+	The deletion of a user, scheduled by its account or the admin. The
+	user is deactivated at once, then its leads are deleted by chunks and
+	the user last, see core.deletion. The row is kept as the receipt.
+	"""
+
+	class Status(models.TextChoices):
+		"""the progress of a deletion"""
+		PENDING = 'pending', _('Pending')
+		RUNNING = 'running', _('Running')
+		DONE = 'done', _('Done')
+
+	receipt = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+	# the deleted user, not a foreign key since the user goes away.
+	user_id = models.BigIntegerField()
+	email = models.EmailField()
+	status = models.CharField(
+		max_length=16,
+		choices=Status.choices,
+		default=Status.PENDING,
+	)
+	# the leads of the user when scheduled, by its lead counter.
+	leads_total = models.BigIntegerField(default=0)
+	leads_deleted = models.BigIntegerField(default=0)
+	created_at = models.DateTimeField(default=timezone.now)
+	finished_at = models.DateTimeField(blank=True, null=True)
 
 	def __str__(self):
 		return self.email
@@ -0,0 +1,135 @@
+"""
+Normalization of lead contact details
+"""
+from functools import lru_cache
+
+import phonenumbers
+from django.conf import settings
+from django.contrib.auth.models import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from phonenumber_field.phonenumber import PhoneNumber, to_python
+
+
+class CanonicalPhoneNumber(PhoneNumber):
+	"""
+	A PhoneNumber remembering the validity and the E.164 form computed
+	when it was parsed, so formatting it for the database or the API
+	doesn't run the phonenumbers metadata matching again.
+	It is built by to_phone_number and must be treated as immutable.
+	"""
+	valid = None
+	e164 = None
+
+	def is_valid(self):
+		"""returns the validity computed when the number was parsed"""
+		if self.valid is None:
+			return super().is_valid()
+		return self.valid
+
+	def format_as(self, format):
+		"""returns the E.164 form computed when the number was parsed"""
+		if format == phonenumbers.PhoneNumberFormat.E164 and self.e164:
+			return self.e164
+		return super().format_as(format)
+
+
+@lru_cache(maxsize=settings.PHONE_PARSE_CACHE_SIZE)
+def _parse_phone(value, region):
+	"""
+	It parses a raw phone number string once per string and region
+
+	:return: the parsed PhoneNumber, its validity and its E.164 form
+	"""
+	phone = to_python(value, region=region)
+	valid = phone.is_valid()
+	return phone, valid, phone.as_e164 if valid else None
+
+
+def to_phone_number(value, region=None):
+	"""
+	It converts a value to a PhoneNumber like phonenumber_field to_python,
+	but the strings are parsed through a bounded LRU cache of
+	PHONE_PARSE_CACHE_SIZE raw strings
+
+	:param value: a phone number string or PhoneNumber
+	:param region: the region of national numbers,
+		PHONENUMBER_DEFAULT_REGION by default
+	"""
+	if not isinstance(value, str) or not value:
+		return to_python(value, region=region)
+	if region is None:
+		region = getattr(settings, 'PHONENUMBER_DEFAULT_REGION', None)
+
+	phone, valid, e164 = _parse_phone(value, region)
+	# a copy, the cached number is shared between the callers.
+	number = CanonicalPhoneNumber()
+	number.merge_from(phone)
+	number.valid = valid
+	number.e164 = e164
+	return number
+
+
+def normalize_email(value):
+	"""
+	It validates an email address and returns it normalized,
+	stripped and with the domain part lowercased like the user emails
+
+	:param value: the raw email address
+	:return: the normalized email address
+	"""
+	if value is not None and not isinstance(value, str):
+		raise ValidationError('Enter a valid email address.', code='invalid')
+	email = BaseUserManager.normalize_email((value or '').strip())
+	validate_email(email)
+	return email
+
+
+def normalize_phone(value):
+	"""
+	It parses a phone number, using PHONENUMBER_DEFAULT_REGION for
+	national numbers, and returns it in E.164 format
+
+	:param value: the raw phone number
+	:return: the phone number in E.164 format, e.g. +972541096752
+	"""
+	if value is not None and not isinstance(value, str):
+		raise ValidationError('Enter a valid phone number.', code='invalid')
+	phone = to_phone_number((value or '').strip())
+	if not phone or not phone.is_valid():
+		raise ValidationError('Enter a valid phone number.', code='invalid')
+	return phone.as_e164
+
+
+def phone_key(value):
+	"""
+	It returns the E.164 form of a phone number, or its raw input
+	when it isn't a valid number, used to compare phone numbers
+
+	:param value: a phone number string or PhoneNumber
+	"""
+	phone = to_phone_number(value)
+	if not phone:
+		return ''
+	if phone.is_valid():
+		return phone.as_e164
+	return str(phone)
+
+
+def dedupe_key(mode, email, phone):
+	"""
+	It builds the key identifying duplicated leads of a user
+
+	:param mode: the lead dedupe mode of the user, see User.LeadDedupe
+	:param email: the email of the lead
+	:param phone: the phone of the lead
+	:return: the key, or None when leads are not deduplicated
+	"""
+	email = (email or '').strip().lower()
+	if mode == 'email':
+		return email
+	if mode == 'phone':
+		return phone_key(phone)
+	if mode == 'email_phone':
+		return f'{email}|{phone_key(phone)}'
+	return None
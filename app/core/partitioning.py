@@ -0,0 +1,422 @@
+"""
+The online move of core_lead to a table hash partitioned on user_id.
+
+Every lead query of the API filters on the user, so each one is pruned
+to the partition of the user. The move is done in steps, see the
+partition_leads command:
+
+1. prepare: the partitioned shadow table is created with the columns,
+	constraints and indexes of core_lead, the primary key being
+	(user_id, id) since it must hold the partition key, plus an index on
+	id for the reads by id alone. A row trigger mirrors every write of
+	core_lead into it from then on.
+2. backfill: the existing leads are copied in batches of ids, each in
+	its own short transaction. The copied rows are locked FOR SHARE so a
+	concurrent delete or update waits and is then mirrored by the trigger.
+3. verify: the row count and id sum of both tables are compared in a
+	single snapshot.
+4. swap: under a brief exclusive lock, the shadow table takes the name,
+	index names, sequence and statement triggers of core_lead, which is
+	kept as core_lead_unpartitioned.
+5. drop: the unpartitioned table is dropped.
+
+abort drops the shadow table and the trigger before the swap.
+"""
+import re
+import time
+
+from django.contrib.postgres import operations
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+
+SOURCE = 'core_lead'
+SHADOW = 'core_lead_partitioned'
+RETIRED = 'core_lead_unpartitioned'
+SYNC_TRIGGER = 'core_lead_partition_sync'
+# the index of the reads by id alone, e.g. the admin changelist and the
+# enrich_leads batches, the primary key leading with user_id.
+ID_INDEX = 'core_lead_id_idx'
+# the suffix of the index names of the shadow table until the swap,
+# and of the index names of the retired table after the swap.
+SHADOW_SUFFIX = '_p'
+RETIRED_SUFFIX = '_old'
+
+CREATE_SYNC_TRIGGER = f"""
+CREATE FUNCTION {SYNC_TRIGGER}() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {SHADOW} WHERE user_id = OLD.user_id AND id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {SHADOW} SELECT NEW.* ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER {SYNC_TRIGGER}
+AFTER INSERT OR UPDATE OR DELETE ON {SOURCE}
+FOR EACH ROW EXECUTE FUNCTION {SYNC_TRIGGER}();
+"""
+
+DROP_SYNC_TRIGGER = f"""
+DROP TRIGGER IF EXISTS {SYNC_TRIGGER} ON {SOURCE};
+DROP FUNCTION IF EXISTS {SYNC_TRIGGER}();
+"""
+
+BACKFILL = f"""
+WITH batch AS (
+    SELECT * FROM {SOURCE} WHERE id > %s ORDER BY id LIMIT %s FOR SHARE
+), copied AS (
+    INSERT INTO {SHADOW} SELECT * FROM batch ON CONFLICT DO NOTHING
+)
+SELECT max(id), count(*) FROM batch
+"""
+
+
+class PartitioningError(Exception):
+	"""A step of the move was run in the wrong state"""
+
+
+def partition_name(remainder):
+	"""returns the name of a partition of the lead table"""
+	return f'{SOURCE}_p{remainder}'
+
+
+def relation_kind(cursor, name):
+	"""returns the pg_class relkind of the table, None when it doesn't exist"""
+	cursor.execute(
+		'SELECT relkind FROM pg_class '
+		'WHERE oid = to_regclass(%s)',
+		[name],
+	)
+	row = cursor.fetchone()
+	return row[0] if row else None
+
+
+def table_partitions(cursor, table):
+	"""returns the partitions of the table, None when it isn't partitioned"""
+	if relation_kind(cursor, table) != 'p':
+		return None
+	cursor.execute(
+		'SELECT inhrelid::regclass::text FROM pg_inherits '
+		'WHERE inhparent = %s::regclass ORDER BY 1',
+		[table],
+	)
+	return [row[0] for row in cursor.fetchall()]
+
+
+class AddIndexConcurrently(operations.AddIndexConcurrently):
+	"""
+	The AddIndexConcurrently of the lead table, partitioned or not, for
+	the migrations applied after the swap. Postgres can't CREATE INDEX
+	CONCURRENTLY on a partitioned table, so the index is created on the
+	table only, invalid, then concurrently on each partition and attached
+	to it, which makes it valid once attached to every partition.
+	"""
+
+	def database_forwards(self, app_label, schema_editor, from_state, to_state):
+		model = to_state.apps.get_model(app_label, self.model_name)
+		table = model._meta.db_table
+		with schema_editor.connection.cursor() as cursor:
+			partitions = table_partitions(cursor, table)
+		if partitions is None:
+			super().database_forwards(
+				app_label, schema_editor, from_state, to_state,
+			)
+			return
+		self._ensure_not_in_transaction(schema_editor)
+		if not self.allow_migrate_model(schema_editor.connection.alias, model):
+			return
+
+		quote = schema_editor.quote_name
+		name = self.index.name
+		sql = str(self.index.create_sql(model, schema_editor))
+		schema_editor.execute(sql.replace(
+			f' ON {quote(table)} ', f' ON ONLY {quote(table)} ', 1,
+		))
+		sql = str(self.index.create_sql(model, schema_editor, concurrently=True))
+		for partition in partitions:
+			partition_index = re.sub(rf'^{table}', partition, name)[:63]
+			schema_editor.execute(
+				sql.replace(quote(name), quote(partition_index), 1).replace(
+					f' ON {quote(table)} ', f' ON {quote(partition)} ', 1,
+				)
+			)
+			schema_editor.execute(
+				f'ALTER INDEX {quote(name)} '
+				f'ATTACH PARTITION {quote(partition_index)}'
+			)
+
+	def database_backwards(self, app_label, schema_editor, from_state, to_state):
+		model = from_state.apps.get_model(app_label, self.model_name)
+		with schema_editor.connection.cursor() as cursor:
+			partitions = table_partitions(cursor, model._meta.db_table)
+		if partitions is None:
+			super().database_backwards(
+				app_label, schema_editor, from_state, to_state,
+			)
+			return
+		# no DROP INDEX CONCURRENTLY either, the index of each partition
+		# is dropped with the index of the table.
+		if self.allow_migrate_model(schema_editor.connection.alias, model):
+			schema_editor.remove_index(model, self.index)
+
+
+def state():
+	"""
+	It returns the step the move is at: 'unpartitioned', 'prepared',
+	'swapped' or 'partitioned'
+	"""
+	with connection.cursor() as cursor:
+		if relation_kind(cursor, SOURCE) == 'p':
+			if relation_kind(cursor, RETIRED):
+				return 'swapped'
+			return 'partitioned'
+		if relation_kind(cursor, SHADOW):
+			return 'prepared'
+		return 'unpartitioned'
+
+
+def require(*states):
+	"""
+	:raise PartitioningError: when the move isn't at one of the states
+	"""
+	current = state()
+	if current not in states:
+		raise PartitioningError(
+			f'The lead table is {current}, expected {" or ".join(states)}.'
+		)
+
+
+def require_migrated():
+	"""
+	:raise PartitioningError: when migrations aren't applied, the indexes
+		they would add to core_lead once prepared would miss the shadow
+		table
+	"""
+	executor = MigrationExecutor(connection)
+	if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+		raise PartitioningError(
+			'Apply the migrations before partitioning the lead table.'
+		)
+
+
+def index_definitions(cursor, table):
+	"""
+	It returns the names and definitions of the indexes of the table not
+	backing a constraint
+	"""
+	cursor.execute(
+		'SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) '
+		'FROM pg_index WHERE indrelid = %s::regclass AND NOT EXISTS ('
+		'SELECT 1 FROM pg_constraint WHERE conindid = indexrelid'
+		') ORDER BY 1',
+		[table],
+	)
+	return cursor.fetchall()
+
+
+def constraint_definitions(cursor, table, types):
+	"""
+	It returns the names, types and definitions of the constraints of
+	the table of the types, e.g. 'uf' for the unique and foreign keys
+	"""
+	cursor.execute(
+		'SELECT conname, contype, pg_get_constraintdef(oid) '
+		'FROM pg_constraint WHERE conrelid = %s::regclass '
+		'AND contype = ANY(%s) ORDER BY 1',
+		[table, list(types)],
+	)
+	return cursor.fetchall()
+
+
+def statement_triggers(cursor, table):
+	"""
+	It returns the names and definitions of the triggers of the table,
+	but the internal triggers and the mirroring trigger
+	"""
+	cursor.execute(
+		'SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger '
+		'WHERE tgrelid = %s::regclass AND NOT tgisinternal '
+		'AND tgname <> %s ORDER BY 1',
+		[table, SYNC_TRIGGER],
+	)
+	return cursor.fetchall()
+
+
+def prepare(partitions, lock_timeout='5s'):
+	"""
+	It creates the shadow table hash partitioned on user_id and the
+	trigger mirroring the writes of core_lead into it
+
+	:param partitions: the number of partitions
+	:param lock_timeout: the wait for the lock taken to create the
+		trigger, after which it fails instead of queueing the writes
+	"""
+	require('unpartitioned')
+	require_migrated()
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute('SET LOCAL lock_timeout = %s', [lock_timeout])
+		cursor.execute(
+			f'CREATE TABLE {SHADOW} (LIKE {SOURCE} INCLUDING DEFAULTS '
+			f'INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+			f'PARTITION BY HASH (user_id)'
+		)
+		for remainder in range(partitions):
+			cursor.execute(
+				f'CREATE TABLE {partition_name(remainder)} '
+				f'PARTITION OF {SHADOW} FOR VALUES '
+				f'WITH (MODULUS {partitions}, REMAINDER {remainder})'
+			)
+		cursor.execute(
+			f'ALTER TABLE {SHADOW} ADD CONSTRAINT {SHADOW}_pkey '
+			f'PRIMARY KEY (user_id, id)'
+		)
+		cursor.execute(
+			f'CREATE INDEX {ID_INDEX}{SHADOW_SUFFIX} ON {SHADOW} (id)'
+		)
+
+		# the unique constraints hold user_id, so they are allowed on the
+		# partitioned table. Their index names are global, unlike the
+		# foreign key names.
+		for name, kind, definition in constraint_definitions(
+			cursor, SOURCE, 'uf',
+		):
+			if kind == 'u':
+				name += SHADOW_SUFFIX
+			cursor.execute(
+				f'ALTER TABLE {SHADOW} ADD CONSTRAINT {name} {definition}'
+			)
+		for name, definition in index_definitions(cursor, SOURCE):
+			definition = re.sub(
+				rf'^CREATE (UNIQUE )?INDEX {name} ON (\w+\.)?{SOURCE} ',
+				rf'CREATE \1INDEX {name}{SHADOW_SUFFIX} ON {SHADOW} ',
+				definition,
+			)
+			cursor.execute(definition)
+
+		cursor.execute(CREATE_SYNC_TRIGGER)
+
+
+def backfill(batch_size, start_id=0, pause=0.0, progress=None):
+	"""
+	It copies the leads of core_lead into the shadow table by batches of
+	ids, each batch in its own transaction. It can be run again from any
+	id, the copied leads are skipped.
+
+	:param batch_size: the number of leads copied per transaction
+	:param start_id: the id after which the leads are copied
+	:param pause: the seconds slept between batches
+	:param progress: a callable given the last copied id and the number
+		of leads read so far after each batch
+	:return: the number of leads read
+	"""
+	require('prepared')
+	last_id, total = start_id, 0
+	while True:
+		with transaction.atomic(), connection.cursor() as cursor:
+			cursor.execute(BACKFILL, [last_id, batch_size])
+			batch_last_id, count = cursor.fetchone()
+		if not count:
+			return total
+		last_id, total = batch_last_id, total + count
+		if progress is not None:
+			progress(last_id, total)
+		if pause:
+			time.sleep(pause)
+
+
+def verify():
+	"""
+	It compares the leads of core_lead and of the shadow table in one
+	snapshot, the trigger writing both in the same transaction
+
+	:return: the (count, id sum) of core_lead and of the shadow table
+	"""
+	require('prepared')
+	# a nested transaction already has its snapshot.
+	outermost = not connection.in_atomic_block
+	with transaction.atomic(), connection.cursor() as cursor:
+		if outermost:
+			cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+		totals = []
+		for table in (SOURCE, SHADOW):
+			cursor.execute(
+				f'SELECT count(*), coalesce(sum(id), 0) FROM {table}'
+			)
+			totals.append(cursor.fetchone())
+	return tuple(totals)
+
+
+def swap(lock_timeout='5s'):
+	"""
+	It puts the shadow table in place of core_lead in one transaction,
+	core_lead is kept as core_lead_unpartitioned with its indexes renamed
+
+	:param lock_timeout: the wait for the exclusive lock of core_lead,
+		after which it fails instead of queueing the reads and writes
+	"""
+	require('prepared')
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute('SET LOCAL lock_timeout = %s', [lock_timeout])
+		cursor.execute(f'LOCK TABLE {SOURCE} IN ACCESS EXCLUSIVE MODE')
+		cursor.execute(DROP_SYNC_TRIGGER)
+
+		triggers = statement_triggers(cursor, SOURCE)
+		for name, _definition in triggers:
+			cursor.execute(f'DROP TRIGGER {name} ON {SOURCE}')
+		cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [SOURCE, 'id'])
+		sequence = cursor.fetchone()[0]
+
+		renames = [
+			(table, name, kind)
+			for table in (SOURCE, SHADOW)
+			for name, kind, _definition in constraint_definitions(
+				cursor, table, 'pu',
+			)
+		] + [
+			(table, name, 'i')
+			for table in (SOURCE, SHADOW)
+			for name, _definition in index_definitions(cursor, table)
+		]
+		for table, name, kind in renames:
+			if table == SOURCE:
+				new_name = name + RETIRED_SUFFIX
+			elif kind == 'p':
+				new_name = f'{SOURCE}_pkey'
+			else:
+				new_name = name[:-len(SHADOW_SUFFIX)]
+			if kind == 'i':
+				cursor.execute(f'ALTER INDEX {name} RENAME TO {new_name}')
+			else:
+				cursor.execute(
+					f'ALTER TABLE {table} RENAME CONSTRAINT {name} '
+					f'TO {new_name}'
+				)
+
+		cursor.execute(f'ALTER TABLE {SOURCE} RENAME TO {RETIRED}')
+		cursor.execute(f'ALTER TABLE {SHADOW} RENAME TO {SOURCE}')
+		if sequence:
+			cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {SOURCE}.id')
+		# the definitions name core_lead, now the partitioned table.
+		for _name, definition in triggers:
+			cursor.execute(definition)
+		cursor.execute(f'ANALYZE {SOURCE}')
+
+
+def drop():
+	"""It drops the unpartitioned lead table once swapped"""
+	require('swapped')
+	with connection.cursor() as cursor:
+		cursor.execute(f'DROP TABLE {RETIRED}')
+
+
+def abort():
+	"""It drops the shadow table and the mirroring trigger before the swap"""
+	require('prepared')
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute(DROP_SYNC_TRIGGER)
+		cursor.execute(f'DROP TABLE {SHADOW}')
@@ -0,0 +1,195 @@
+"""
+The OpenAPI schema generated once per code version.
+
+With API_SCHEMA_CACHE the schema of /api/schema/ is generated by the
+build_schema command at build time, or at its first request, and kept
+in memory and in API_SCHEMA_DIR. It is served as is with an ETag, the
+views and serializers are introspected again only when the code version
+changes. drf_spectacular is still imported by the urls and the views,
+only the introspection of each request is avoided.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from importlib import metadata
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import (
+	get_conditional_response,
+	patch_cache_control,
+	patch_vary_headers,
+)
+from django.utils.http import quote_etag
+
+
+# the media types and file extensions of the schema, YAML by default as
+# SpectacularAPIView.
+FORMATS = {
+	'yaml': ('application/vnd.oai.openapi; charset=utf-8', 'yaml'),
+	'json': ('application/vnd.oai.openapi+json; charset=utf-8', 'json'),
+}
+# the distributions whose version changes the schema.
+DISTRIBUTIONS = ('Django', 'djangorestframework', 'drf-spectacular')
+
+_schemas = {}
+_lock = threading.Lock()
+_code_version = None
+
+
+def code_version():
+	"""
+	It returns the code version of the schema, API_SCHEMA_VERSION when set
+	at build time, e.g. the commit hash, otherwise a hash of the python
+	sources of the project and of the versions of the schema distributions,
+	computed once per process
+	"""
+	global _code_version
+	if settings.API_SCHEMA_VERSION:
+		return settings.API_SCHEMA_VERSION
+	if _code_version is None:
+		digest = hashlib.sha1()
+		for name in DISTRIBUTIONS:
+			digest.update(f'{name}=={metadata.version(name)}\n'.encode())
+		base_dir = Path(settings.BASE_DIR)
+		for path in sorted(base_dir.rglob('*.py')):
+			digest.update(str(path.relative_to(base_dir)).encode())
+			digest.update(path.read_bytes())
+		_code_version = digest.hexdigest()[:16]
+	return _code_version
+
+
+def generate():
+	"""
+	It introspects the views and serializers as SpectacularAPIView does
+
+	:return: the schema rendered by format, e.g. {'yaml': b'...'}
+	"""
+	from drf_spectacular.renderers import (
+		OpenApiJsonRenderer,
+		OpenApiYamlRenderer,
+	)
+	from drf_spectacular.settings import spectacular_settings
+
+	generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+	schema = generator.get_schema(request=None, public=True)
+	return {
+		'yaml': OpenApiYamlRenderer().render(schema, renderer_context={}),
+		'json': OpenApiJsonRenderer().render(schema, renderer_context={}),
+	}
+
+
+def schema_path(version, extension):
+	"""returns the file of the schema of the version in API_SCHEMA_DIR"""
+	return Path(settings.API_SCHEMA_DIR) / f'schema-{version}.{extension}'
+
+
+def read(version):
+	"""
+	It reads the schema of the version from API_SCHEMA_DIR
+
+	:return: the schema rendered by format, None when a file is missing
+	"""
+	try:
+		return {
+			name: schema_path(version, extension).read_bytes()
+			for name, (_media_type, extension) in FORMATS.items()
+		}
+	except FileNotFoundError:
+		return None
+
+
+def write(version, rendered):
+	"""
+	It writes the schema of the version to API_SCHEMA_DIR, each file
+	replaced at once so a concurrent read never sees it partly written
+	"""
+	directory = Path(settings.API_SCHEMA_DIR)
+	directory.mkdir(parents=True, exist_ok=True)
+	for name, (_media_type, extension) in FORMATS.items():
+		fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as file:
+				file.write(rendered[name])
+			os.replace(temporary, schema_path(version, extension))
+		except BaseException:
+			os.unlink(temporary)
+			raise
+
+
+def build():
+	"""
+	It generates the schema of the current code version and writes it to
+	API_SCHEMA_DIR, see the build_schema command
+
+	:return: the code version
+	"""
+	version = code_version()
+	rendered = generate()
+	write(version, rendered)
+	with _lock:
+		_schemas.clear()
+		_schemas[version] = rendered
+	return version
+
+
+def load():
+	"""
+	It returns the schema of the current code version, from memory, else
+	from API_SCHEMA_DIR, else generated and written there when writable
+
+	:return: the code version and the schema rendered by format
+	"""
+	version = code_version()
+	rendered = _schemas.get(version)
+	if rendered is not None:
+		return version, rendered
+	with _lock:
+		rendered = _schemas.get(version)
+		if rendered is None:
+			rendered = read(version)
+		if rendered is None:
+			rendered = generate()
+			try:
+				write(version, rendered)
+			except OSError:
+				# a read only file system, the schema is kept in memory.
+				pass
+		# the schemas of the former versions are dropped.
+		_schemas.clear()
+		_schemas[version] = rendered
+	return version, rendered
+
+
+def requested_format(request):
+	"""returns the format asked by ?format= or by the Accept header"""
+	name = request.GET.get('format')
+	if name in FORMATS:
+		return name
+	if 'json' in request.META.get('HTTP_ACCEPT', ''):
+		return 'json'
+	return 'yaml'
+
+
+def schema_view(request):
+	"""
+	It answers the cached schema, 304 when the client has the current one.
+	The schema is public and the same for every user.
+	"""
+	name = requested_format(request)
+	version, rendered = load()
+	etag = quote_etag(f'{version}-{name}')
+
+	response = get_conditional_response(request, etag=etag)
+	if response is None:
+		media_type, extension = FORMATS[name]
+		response = HttpResponse(rendered[name], content_type=media_type)
+		response['Content-Disposition'] = (
+			f'inline; filename="schema.{extension}"'
+		)
+	response['ETag'] = etag
+	patch_cache_control(response, public=True, no_cache=True)
+	patch_vary_headers(response, ['Accept'])
+	return response
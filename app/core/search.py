@@ -0,0 +1,61 @@
+"""
+The indexed expressions of the lead search
+"""
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import connections
+from django.db.models import F, Func, TextField
+
+
+SEARCH_FIELDS = ('fname', 'lname', 'email', 'phone')
+# the text search configuration, without stemming nor stop words since
+# the searched fields are names, emails and phone numbers.
+SEARCH_CONFIG = 'simple'
+
+TRIGRAM_INDEX_NAME = 'core_lead_search_trgm_idx'
+
+
+class SearchDocument(Func):
+	"""
+	The searched fields joined by spaces, with || since CONCAT isn't
+	immutable and so can't be indexed. The fields are all NOT NULL.
+	"""
+	template = '%(expressions)s'
+	arg_joiner = " || ' ' || "
+	output_field = TextField()
+
+
+def search_vector():
+	"""returns the full text vector of a lead, as indexed"""
+	return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def search_document():
+	"""returns the text of a lead matched by trigrams, as indexed"""
+	return SearchDocument(*[F(field) for field in SEARCH_FIELDS])
+
+
+def trigram_index():
+	"""
+	returns the trigram GIN index of the lead search document,
+	created by migration when the pg_trgm extension is available
+	"""
+	return GinIndex(
+		OpClass(search_document(), name='gin_trgm_ops'),
+		name=TRIGRAM_INDEX_NAME,
+	)
+
+
+def trigram_available(using='default'):
+	"""
+	It tells if the pg_trgm extension is installed in the database,
+	the answer is kept on the connection
+	"""
+	connection = connections[using]
+	if not hasattr(connection, 'trigram_available'):
+		with connection.cursor() as cursor:
+			cursor.execute(
+				"SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+			)
+			connection.trigram_available = cursor.fetchone() is not None
+	return connection.trigram_available
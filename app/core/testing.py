@@ -0,0 +1,77 @@
+"""
+Test helpers shared by the API tests
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+
+
+def endpoint_names(urlpatterns, namespace=None):
+	"""
+	It returns the names of the endpoints of the URL patterns, prefixed
+	by their namespace, e.g. {'lead:lead-list', 'lead:lead-detail'}
+
+	:param urlpatterns: the urlpatterns of a URL module
+	:param namespace: the namespace of the URL module
+	"""
+	names = set()
+	for pattern in urlpatterns:
+		if isinstance(pattern, URLResolver):
+			names |= endpoint_names(
+				pattern.url_patterns,
+				pattern.namespace or namespace,
+			)
+		elif isinstance(pattern, URLPattern) and pattern.name:
+			names.add(
+				f'{namespace}:{pattern.name}' if namespace else pattern.name
+			)
+	return names
+
+
+class QueryBudgetMixin:
+	"""
+	Assert the number of queries of the endpoints of a URL module, so an
+	N+1 query fails the tests. It is mixed into a TestCase with an APIClient
+	client, every endpoint of the module must be given a budget.
+	"""
+
+	# the URL module, e.g. lead.urls
+	urls = None
+	# the maximum number of queries by endpoint name and method,
+	# e.g. {'lead:lead-list': {'get': 2, 'post': 3}}
+	budgets = {}
+
+	def test_every_endpoint_has_a_budget(self):
+		"""test a new endpoint must be given a query budget"""
+		self.assertEqual(
+			endpoint_names(self.urls.urlpatterns, self.urls.app_name),
+			set(self.budgets),
+		)
+
+	def assertQueryBudget(self, name, method, args=None, data=None, **extra):
+		"""
+		It sends the request to the endpoint, consuming a streaming
+		response, and fails when it runs more queries than its budget
+
+		:param name: the endpoint name, e.g. 'lead:lead-detail'
+		:param method: the APIClient method, e.g. 'get'
+		:param args: the arguments of the endpoint URL
+		:return: the response
+		"""
+		budget = self.budgets[name][method]
+		path = reverse(name, args=args)
+		with CaptureQueriesContext(connection) as context:
+			response = getattr(self.client, method)(path, data, **extra)
+			if response.streaming:
+				b''.join(response.streaming_content)
+
+		if len(context) > budget:
+			queries = '\n'.join(
+				f'{i}. {query["sql"]}'
+				for i, query in enumerate(context.captured_queries, start=1)
+			)
+			self.fail(
+				f'{method.upper()} {path} ran {len(context)} queries, '
+				f'over its budget of {budget}:\n{queries}'
+			)
+		return response
@@ -1,10 +1,15 @@
 """
 test for the django admin modification.
 """
+from unittest import mock
 
+from core.models import Lead
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.html import escape
 
 
 class AdminSiteTests(TestCase):
@@ -48,3 +53,203 @@ class AdminSiteTests(TestCase):
 		response = self.client.get(url)
 
 		self.assertEqual(response.status_code, 200)
+
+
+class LeadAdminTests(TestCase):
+	"""Tests for the admin pages of the leads"""
+
+	def setUp(self):
+		"""setting up client, users and leads for tests"""
+		self.client = Client()
+		User = get_user_model()
+		self.admin_user = User.objects.create_superuser(
+			email='admin@example.com',
+			password='password123',
+		)
+		self.client.force_login(self.admin_user)
+		self.user = User.objects.create_user(
+			email='user@example.com',
+			password='password123',
+		)
+		self.other = User.objects.create_user(
+			email='other@example.com',
+			password='password123',
+		)
+		self.leads = Lead.objects.insert([
+			Lead(
+				user=user,
+				fname='John',
+				lname='Doe',
+				email=f'lead{i}@example.com',
+				phone='+972541096752',
+			)
+			for i, user in enumerate([self.user] * 3 + [self.other] * 2)
+		])
+		self.url = reverse('admin:core_lead_changelist')
+
+	def test_leads_list(self):
+		"""Test the leads are listed newest first with their owner link"""
+		response = self.client.get(self.url)
+
+		self.assertContains(response, self.leads[0].email)
+		self.assertContains(
+			response, f'href="?user__id__exact={self.user.id}"',
+		)
+		self.assertEqual(
+			[lead.id for lead in response.context['cl'].result_list],
+			sorted((lead.id for lead in self.leads), reverse=True),
+		)
+		self.assertContains(response, 'About 5 leads')
+
+	def test_leads_list_estimated_count(self):
+		"""Test the big changelists are not counted"""
+		with mock.patch('core.admin.EXACT_COUNT_MAX', 0), \
+			CaptureQueriesContext(connection) as context:
+			response = self.client.get(self.url)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertFalse([
+			query['sql'] for query in context.captured_queries
+			if 'COUNT(*)' in query['sql'] and '"core_lead"' in query['sql']
+		])
+		self.assertFalse([
+			query['sql'] for query in context.captured_queries
+			if 'OFFSET' in query['sql']
+		])
+
+	def test_leads_list_older_page(self):
+		"""Test the older leads are reached by keyset"""
+		with mock.patch('core.admin.LeadAdmin.list_per_page', 2):
+			response = self.client.get(self.url)
+			older_url = response.context['cl'].older_url
+			self.assertEqual(older_url, f'?id__lt={self.leads[3].id}')
+
+			response = self.client.get(self.url + older_url)
+
+		self.assertEqual(
+			[lead.id for lead in response.context['cl'].result_list],
+			[self.leads[2].id, self.leads[1].id],
+		)
+		self.assertEqual(response.context['cl'].newest_url, '?')
+
+	def test_leads_list_owner_filter(self):
+		"""Test the leads are filtered by owner"""
+		response = self.client.get(self.url, {'user__id__exact': self.other.id})
+
+		self.assertEqual(
+			{lead.user_id for lead in response.context['cl'].result_list},
+			{self.other.id},
+		)
+
+	def test_leads_list_owner_link_keeps_filters(self):
+		"""Test the owner link keeps the search and filters, not the page"""
+		response = self.client.get(self.url, {
+			'q': 'lead1@example.com',
+			'id__lt': self.leads[-1].id,
+		})
+
+		lead = response.context['cl'].result_list[0]
+		self.assertEqual(
+			lead.owner_url,
+			f'?q=lead1%40example.com&user__id__exact={self.user.id}',
+		)
+		self.assertContains(response, f'href="{escape(lead.owner_url)}"')
+
+	def test_leads_search(self):
+		"""Test the leads search matches the full text index"""
+		response = self.client.get(self.url, {'q': 'lead1@example.com'})
+
+		self.assertEqual(
+			[lead.id for lead in response.context['cl'].result_list],
+			[self.leads[1].id],
+		)
+
+	def test_add_lead_page(self):
+		"""Test the lead add page doesn't list the users"""
+		response = self.client.get(reverse('admin:core_lead_add'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'vForeignKeyRawIdAdminField')
+		self.assertNotContains(response, self.other.email)
+
+	def test_edit_lead_page(self):
+		"""Test the owner of a lead can't be changed"""
+		url = reverse('admin:core_lead_change', args=[self.leads[0].id])
+		response = self.client.get(url)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertNotContains(response, 'vForeignKeyRawIdAdminField')
+		self.assertNotContains(response, self.other.email)
+
+	def edit_lead(self, lead, **data):
+		"""posting the change form of the lead"""
+		url = reverse('admin:core_lead_change', args=[lead.id])
+		return self.client.post(url, {
+			'fname': lead.fname,
+			'lname': lead.lname,
+			'email': lead.email,
+			'phone': '+972541096752',
+			'ip': '',
+			**data,
+		})
+
+	def test_edit_lead_rekeyed(self):
+		"""Test an edited lead is rekeyed and its owner version bumped"""
+		self.user.lead_dedupe = 'email'
+		self.user.save()
+		lead = self.leads[0]
+
+		response = self.edit_lead(
+			lead, email='new@example.com', user=self.other.id,
+		)
+
+		self.assertEqual(response.status_code, 302)
+		lead.refresh_from_db()
+		self.assertEqual(lead.email, 'new@example.com')
+		self.assertEqual(lead.dedupe_key, 'new@example.com')
+		self.assertEqual(lead.user, self.user)
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, 1)
+
+	def test_edit_lead_duplicate_error(self):
+		"""Test an edit duplicating another lead of the owner is refused"""
+		self.user.lead_dedupe = 'email'
+		self.user.save()
+		lead = self.leads[0]
+		lead.dedupe_key = lead.build_dedupe_key()
+		lead.save()
+
+		response = self.edit_lead(self.leads[1], email=lead.email)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(
+			response, 'The owner has a lead with the same contact details.',
+		)
+		self.leads[1].refresh_from_db()
+		self.assertEqual(self.leads[1].email, 'lead1@example.com')
+
+	def test_delete_lead(self):
+		"""Test deleting a lead bumps the data version of its owner"""
+		url = reverse('admin:core_lead_delete', args=[self.leads[0].id])
+
+		response = self.client.post(url, {'post': 'yes'})
+
+		self.assertEqual(response.status_code, 302)
+		self.assertFalse(Lead.objects.filter(id=self.leads[0].id).exists())
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, 1)
+
+	def test_delete_selected_leads(self):
+		"""Test the selected leads are deleted by the bulk delete"""
+		selected = [self.leads[0].id, self.leads[3].id]
+
+		response = self.client.post(self.url, {
+			'action': 'delete_selected_leads',
+			'_selected_action': selected,
+		}, follow=True)
+
+		self.assertContains(response, 'Deleted 2 leads.')
+		self.assertFalse(Lead.objects.filter(id__in=selected).exists())
+		self.assertEqual(Lead.objects.count(), 3)
+		self.user.refresh_from_db()
+		self.assertGreater(self.user.data_version, 0)
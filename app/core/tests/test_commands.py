@@ -1,9 +1,14 @@
 """Test custom Django Commands"""
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
-from django.core.management import call_command
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
 from psycopg2 import OperationalError as PsycopgError
 
 
@@ -28,3 +33,160 @@ class CommandTest(SimpleTestCase):
 
 		self.assertEqual(patched_check.call_count, 6)
 		patched_check.assert_called_with(databases=['default'])
+
+
+class ImportLeadsCommandTest(TestCase):
+	"""Test the import_leads command"""
+
+	def setUp(self):
+		"""creating the owner of the imported leads"""
+		self.user = get_user_model().objects.create_user(
+			email='user@example.com',
+			password='password123',
+		)
+
+	def write_file(self, suffix, content):
+		"""writing content to a temporary file removed after the test"""
+		fd, path = tempfile.mkstemp(suffix=suffix)
+		with os.fdopen(fd, 'w') as file:
+			file.write(content)
+		self.addCleanup(os.remove, path)
+		return path
+
+	def test_import_leads_csv(self):
+		"""Test importing a CSV file normalizes and skips invalid rows"""
+		path = self.write_file('.csv', (
+			'fname,lname,email,phone,ip\n'
+			'John,Doe,John@EXAMPLE.com,+972 54-109-6752,10.0.0.1\n'
+			'Jane,Doe,jane@example.com,+972541096753,\n'
+			'Bad,Email,not-an-email,+972541096752,\n'
+			'Bad,Phone,bad@example.com,123,\n'
+		))
+		out = StringIO()
+
+		call_command('import_leads', path, user=self.user.email, stdout=out)
+
+		leads = Lead.objects.filter(user=self.user).order_by('id')
+		self.assertEqual(
+			list(leads.values_list('email', 'phone', 'ip')),
+			[
+				('John@example.com', '+972541096752', '10.0.0.1'),
+				('jane@example.com', '+972541096753', None),
+			],
+		)
+		self.assertIn('Imported 2 leads', out.getvalue())
+		self.assertIn('2 invalid rows skipped', out.getvalue())
+
+	def test_import_leads_jsonl_in_chunks(self):
+		"""Test importing a JSON lines file over several COPY chunks"""
+		path = self.write_file('.jsonl', ''.join(
+			'{"fname": "John", "lname": "Doe", '
+			f'"email": "lead{i}@example.com", "phone": "+972541096752"}}\n'
+			for i in range(5)
+		))
+
+		call_command(
+			'import_leads', path,
+			user=self.user.email, chunk_size=2, stdout=StringIO(),
+		)
+
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 5)
+
+	def test_import_leads_jsonl_values_not_strings(self):
+		"""Test the JSON numbers are read as text and other values skipped"""
+		path = self.write_file('.jsonl', (
+			'{"fname": "John", "lname": 7, '
+			'"email": "john@example.com", "phone": "+972541096752"}\n'
+			'{"fname": "Jane", "lname": "Doe", '
+			'"email": "jane@example.com", "phone": 972541096752}\n'
+			'{"fname": {"first": "Jim"}, "lname": "Doe", '
+			'"email": "jim@example.com", "phone": "+972541096752"}\n'
+			'{"fname": "Joe", "lname": "Doe", '
+			'"email": ["joe@example.com"], "phone": "+972541096752"}\n'
+		))
+		out = StringIO()
+
+		call_command('import_leads', path, user=self.user.email, stdout=out)
+
+		lead = Lead.objects.get(user=self.user)
+		self.assertEqual(lead.lname, '7')
+		self.assertIn('3 invalid rows skipped', out.getvalue())
+
+	def test_import_leads_unknown_user_error(self):
+		"""Test importing leads for an unknown user fails"""
+		path = self.write_file('.csv', 'fname,lname,email,phone\n')
+
+		with self.assertRaises(CommandError):
+			call_command('import_leads', path, user='nobody@example.com')
+
+	def test_import_leads_skips_duplicates(self):
+		"""Test importing leads skips the duplicates of the user leads"""
+		self.user.lead_dedupe = 'email'
+		self.user.save()
+		Lead.objects.create(
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='john@example.com',
+			phone='+972541096752',
+		)
+		path = self.write_file('.csv', (
+			'fname,lname,email,phone\n'
+			'John,Doe,JOHN@example.com,+972541096752\n'
+			'Jane,Doe,jane@example.com,+972541096752\n'
+			'Jane,Doe,jane@example.com,+972541096752\n'
+		))
+		out = StringIO()
+
+		call_command('import_leads', path, user=self.user.email, stdout=out)
+
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 2)
+		self.assertIn('Imported 1 leads', out.getvalue())
+		self.assertIn('2 duplicates', out.getvalue())
+
+
+class BenchmarkPhoneCommandTest(SimpleTestCase):
+	"""Test the benchmark_phone command"""
+
+	def test_benchmark_phone(self):
+		"""Test the benchmark reports the cost before and after the cache"""
+		out = StringIO()
+
+		call_command('benchmark_phone', count=100, distinct=10, stdout=out)
+
+		self.assertIn('create: before', out.getvalue())
+		self.assertIn('read: before', out.getvalue())
+
+
+@patch('core.management.commands.serve.Server.run')
+class ServeCommandTest(SimpleTestCase):
+	"""Test the serve command"""
+
+	def test_serve_preloads_wsgi_application(self, patched_run):
+		"""Test the server preloads app.wsgi with the given workers"""
+		with patch('core.management.commands.serve.Server.__init__',
+		           return_value=None) as patched_init:
+			call_command(
+				'serve', workers=3, threads=4, max_requests=500,
+				stdout=StringIO(),
+			)
+
+		application, options, _ = patched_init.call_args.args
+		self.assertEqual(application, 'app.wsgi:application')
+		self.assertTrue(options['preload_app'])
+		self.assertEqual(options['workers'], 3)
+		self.assertEqual(options['threads'], 4)
+		self.assertEqual(options['worker_class'], 'gthread')
+		self.assertEqual(options['max_requests'], 500)
+		patched_run.assert_called_once()
+
+	def test_server_load(self, patched_run):
+		"""Test loading the server imports the application and URLconf"""
+		from app.wsgi import application
+		from core.management.commands.serve import Server
+
+		out = StringIO()
+		server = Server('app.wsgi:application', {}, out.write)
+
+		self.assertIs(server.load(), application)
+		self.assertIn('Preloaded app.wsgi:application', out.getvalue())
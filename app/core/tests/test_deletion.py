@@ -0,0 +1,221 @@
+"""
+Test the chunked deletion of the users
+"""
+from io import StringIO
+
+from core.deletion import delete_user, process, process_pending, schedule
+from core.models import ArchivedLead, Lead, LeadIngest, LeadStats, UserDeletion
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+
+def create_leads(user, count):
+	"""It creates count leads of the user"""
+	return Lead.objects.insert([
+		Lead(
+			user=user,
+			fname='John',
+			lname='Doe',
+			email=f'lead{i}@example.com',
+			phone='+972541096752',
+		)
+		for i in range(count)
+	])
+
+
+class UserDeletionTests(TestCase):
+	"""Test deleting the users by chunks"""
+
+	def setUp(self):
+		User = get_user_model()
+		self.user = User.objects.create_user('user@example.com', 'Password')
+		self.other = User.objects.create_user('other@example.com', 'Password')
+		create_leads(self.user, 5)
+		create_leads(self.other, 2)
+		ArchivedLead.objects.create(
+			id=1000,
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='old@example.com',
+			phone='+972541096752',
+		)
+		LeadIngest.objects.create(
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='new@example.com',
+			phone='+972541096752',
+		)
+
+	def test_schedule_deactivates(self):
+		"""test a scheduled user can't authenticate anymore"""
+		Token.objects.create(user=self.user)
+
+		deletion = schedule(self.user)
+
+		self.user.refresh_from_db()
+		self.assertFalse(self.user.is_active)
+		self.assertFalse(Token.objects.filter(user=self.user).exists())
+		self.assertEqual(deletion.status, UserDeletion.Status.PENDING)
+		self.assertEqual(deletion.leads_total, 5)
+
+	def test_process_by_chunks(self):
+		"""test the rows of the user are deleted, the others kept"""
+		deletion = schedule(self.user)
+
+		process(deletion, chunk_size=2)
+
+		self.assertEqual(deletion.status, UserDeletion.Status.DONE)
+		self.assertEqual(deletion.leads_deleted, 5)
+		self.assertIsNotNone(deletion.finished_at)
+		self.assertFalse(
+			get_user_model().objects.filter(pk=self.user.pk).exists()
+		)
+		self.assertEqual(
+			set(Lead.objects.values_list('user_id', flat=True)),
+			{self.other.pk},
+		)
+		self.assertFalse(ArchivedLead.objects.exists())
+		self.assertFalse(LeadIngest.objects.exists())
+		self.assertFalse(LeadStats.objects.filter(user_id=self.user.pk).exists())
+
+	def test_process_resumed(self):
+		"""test an interrupted deletion is done by running it again"""
+		deletion = schedule(self.user)
+		UserDeletion.objects.filter(pk=deletion.pk).update(
+			status=UserDeletion.Status.RUNNING,
+		)
+		Lead.objects.filter(
+			id__in=Lead.objects.filter(user=self.user).values('id')[:3]
+		).delete()
+		out = StringIO()
+
+		call_command('delete_users', once=True, stdout=out)
+
+		deletion.refresh_from_db()
+		self.assertEqual(deletion.status, UserDeletion.Status.DONE)
+		self.assertEqual(deletion.leads_deleted, 2)
+		self.assertIn('Deleted 1 users', out.getvalue())
+
+	def test_deletion_processed_once(self):
+		"""test a deletion another run is processing is skipped"""
+		deletion = schedule(self.user)
+		other_run = connection.copy()
+		self.addCleanup(other_run.close)
+		with other_run.cursor() as cursor:
+			cursor.execute('SELECT pg_advisory_lock(%s)', [deletion.pk])
+
+		self.assertEqual(process_pending(chunk_size=2), 0)
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 5)
+
+		with other_run.cursor() as cursor:
+			cursor.execute('SELECT pg_advisory_unlock(%s)', [deletion.pk])
+		self.assertEqual(process_pending(chunk_size=2), 1)
+		deletion.refresh_from_db()
+		self.assertEqual(deletion.leads_deleted, 5)
+
+	def test_delete_user_at_once(self):
+		"""test a user with few leads is deleted at once"""
+		deletion = delete_user(self.user)
+
+		self.assertEqual(deletion.status, UserDeletion.Status.DONE)
+		self.assertFalse(Lead.objects.filter(user_id=self.user.pk).exists())
+
+	@override_settings(USER_DELETE_CHUNK_SIZE=2)
+	def test_delete_user_in_background(self):
+		"""test a user with many leads is left to delete_users"""
+		deletion = delete_user(self.user)
+
+		self.assertEqual(deletion.status, UserDeletion.Status.PENDING)
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 5)
+
+		call_command('delete_users', once=True, stdout=StringIO())
+
+		deletion.refresh_from_db()
+		self.assertEqual(deletion.status, UserDeletion.Status.DONE)
+		self.assertEqual(deletion.leads_deleted, 5)
+
+
+class UserDeletionAdminTests(TestCase):
+	"""Test deleting users from the admin"""
+
+	def setUp(self):
+		User = get_user_model()
+		self.client = Client()
+		self.client.force_login(
+			User.objects.create_superuser('admin@example.com', 'Password')
+		)
+		self.user = User.objects.create_user('user@example.com', 'Password')
+		create_leads(self.user, 3)
+
+	def test_delete_confirmation_lists_the_user_only(self):
+		"""test the leads of the user aren't listed"""
+		url = reverse('admin:core_user_delete', args=[self.user.pk])
+
+		response = self.client.get(url)
+
+		self.assertContains(response, 'user@example.com')
+		self.assertContains(response, 'Leads: 3')
+		self.assertNotContains(response, 'lead0@example.com')
+
+	@override_settings(USER_DELETE_CHUNK_SIZE=2)
+	def test_delete_scheduled(self):
+		"""test deleting a user with many leads schedules its deletion"""
+		url = reverse('admin:core_user_delete', args=[self.user.pk])
+
+		response = self.client.post(url, {'post': 'yes'}, follow=True)
+
+		deletion = UserDeletion.objects.get(user_id=self.user.pk)
+		self.assertEqual(deletion.status, UserDeletion.Status.PENDING)
+		self.user.refresh_from_db()
+		self.assertFalse(self.user.is_active)
+		self.assertNotContains(response, 'deleted successfully')
+		self.assertContains(response, 'The deletion of user@example.com')
+		self.assertContains(response, 'href="{}"'.format(reverse(
+			'admin:core_userdeletion_change', args=[deletion.pk],
+		)))
+
+	@override_settings(USER_DELETE_CHUNK_SIZE=2)
+	def test_delete_selected_scheduled(self):
+		"""test the selected users deleted or scheduled are told apart"""
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+
+		response = self.client.post(
+			reverse('admin:core_user_changelist'),
+			{
+				'action': 'delete_selected',
+				'_selected_action': [self.user.pk, other.pk],
+				'post': 'yes',
+			},
+			follow=True,
+		)
+
+		self.assertFalse(get_user_model().objects.filter(pk=other.pk).exists())
+		self.assertNotContains(response, 'Successfully deleted')
+		self.assertContains(response, 'Deleted 1 user.')
+		self.assertContains(response, 'The deletion of user@example.com')
+
+	def test_delete_done(self):
+		"""test deleting a user with few leads tells it is deleted"""
+		url = reverse('admin:core_user_delete', args=[self.user.pk])
+
+		response = self.client.post(url, {'post': 'yes'}, follow=True)
+
+		self.assertContains(response, 'deleted successfully')
+
+	def test_deletions_listed(self):
+		"""test the deletions are listed with their progress"""
+		delete_user(self.user)
+
+		response = self.client.get(
+			reverse('admin:core_userdeletion_changelist')
+		)
+
+		self.assertContains(response, 'user@example.com')
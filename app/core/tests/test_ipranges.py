@@ -0,0 +1,100 @@
+"""
+Test the ip range index of the lead enrichment
+"""
+import io
+import os
+import tempfile
+
+from core import ipranges
+from django.test import SimpleTestCase, override_settings
+
+
+RANGES = (
+	'start,end,country,region,asn\n'
+	'1.0.0.0,1.0.0.255,au,Queensland,AS13335\n'
+	'8.8.8.0,8.8.8.255,US,California,15169\n'
+	'2001:db8::,2001:db8::ffff,FR,Ile-de-France,\n'
+	'167772160,167772415,IL,Tel Aviv,0\n'
+)
+
+
+class IPRangeIndexTests(SimpleTestCase):
+	"""Test building and reading the index"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'ip.idx')
+		self.count = ipranges.build(
+			ipranges.read_ranges(io.StringIO(RANGES)), self.path,
+		)
+		self.index = ipranges.IPRangeIndex(self.path)
+		self.addCleanup(self.index.close)
+
+	def test_lookup(self):
+		"""test the addresses are found in their range"""
+		self.assertEqual(self.count, 4)
+		self.assertEqual(len(self.index), 4)
+		self.assertEqual(
+			self.index.lookup('8.8.8.8'),
+			('US', 'California', 15169),
+		)
+		self.assertEqual(
+			self.index.lookup('1.0.0.0'), ('AU', 'Queensland', 13335),
+		)
+		self.assertEqual(
+			self.index.lookup('1.0.0.255'), ('AU', 'Queensland', 13335),
+		)
+		self.assertEqual(
+			self.index.lookup('2001:db8::1'), ('FR', 'Ile-de-France', None),
+		)
+		self.assertEqual(self.index.lookup('10.0.0.1'), ('IL', 'Tel Aviv', None))
+
+	def test_lookup_outside_ranges(self):
+		"""test the addresses between or around the ranges aren't found"""
+		for address in ('0.255.255.255', '1.0.1.0', '9.0.0.0', '::1', '::'):
+			self.assertIsNone(self.index.lookup(address), address)
+
+	def test_overlapping_ranges(self):
+		"""test overlapping ranges are refused"""
+		ranges = RANGES + '8.8.8.128,8.8.9.0,US,,\n'
+
+		with self.assertRaisesMessage(ValueError, 'overlaps'):
+			ipranges.build(ipranges.read_ranges(io.StringIO(ranges)), self.path)
+
+	def test_invalid_range(self):
+		"""test an invalid line is reported"""
+		ranges = RANGES + '8.8.9.0,not-an-ip,US,,\n'
+
+		with self.assertRaisesMessage(ValueError, 'line 6'):
+			list(ipranges.read_ranges(io.StringIO(ranges)))
+
+	def test_not_an_index(self):
+		"""test a file that isn't an index is refused"""
+		with open(self.path, 'wb') as file:
+			file.write(b'\0' * 32)
+
+		with self.assertRaises(ValueError):
+			ipranges.IPRangeIndex(self.path)
+
+	def test_index_opened_once(self):
+		"""test the index of LEAD_IP_INDEX is opened once per process"""
+		self.addCleanup(ipranges._index.update, path=None, index=None)
+
+		with override_settings(LEAD_IP_INDEX=self.path):
+			index = ipranges.get_index()
+			self.assertIs(ipranges.get_index(), index)
+		with override_settings(LEAD_IP_INDEX=''):
+			self.assertIsNone(ipranges.get_index())
+		self.assertTrue(index.buffer.closed)
+
+	def test_long_values_cut(self):
+		"""test the country and region are cut to the lead field lengths"""
+		ranges = f'8.8.9.0,8.8.9.255,USA,{"r" * 300},15169\n'
+
+		(_start, _end, country, region, _asn), = ipranges.read_ranges(
+			io.StringIO(ranges),
+		)
+
+		self.assertEqual(country, 'US')
+		self.assertEqual(len(region), ipranges.REGION_LENGTH)
@@ -0,0 +1,117 @@
+"""
+Test the request metrics middleware
+"""
+import json
+import logging
+import re
+from io import StringIO
+from unittest.mock import patch
+
+from app.db import pool
+from core import metrics
+from core.models import Lead
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+METRICS_MIDDLEWARE = ['core.middleware.RequestMetricsMiddleware']
+
+
+class RequestMetricsTests(SimpleTestCase):
+	"""Test collecting the request metrics"""
+
+	def test_nested_timer_counted_once(self):
+		"""test a block nested in a block of the same name isn't counted twice"""
+		with metrics.collect() as current:
+			with current.timer('serializer'):
+				with current.timer('serializer'):
+					pass
+			first = current.timings['serializer']
+			with current.timer('serializer'):
+				pass
+
+		self.assertGreater(current.timings['serializer'], first)
+		self.assertIsNone(metrics.current())
+
+	def test_timed_without_metrics(self):
+		"""test a timed function runs as is when no metrics are collected"""
+		function = metrics.timed('auth')(lambda value: value * 2)
+
+		self.assertEqual(function(2), 4)
+
+
+@override_settings(MIDDLEWARE=METRICS_MIDDLEWARE + settings.MIDDLEWARE)
+class RequestMetricsMiddlewareTests(TestCase):
+	"""Test the Server-Timing header and the metrics log"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		token = Token.objects.create(user=self.user)
+		self.client = APIClient()
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+		Lead.objects.create(
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='lead@example.com',
+			phone='+972541096752',
+		)
+
+	def test_server_timing_header(self):
+		"""test the timings and the query count are sent"""
+		response = self.client.get(reverse('lead:lead-list'))
+
+		timing = response['Server-Timing']
+		self.assertRegex(timing, r'db;dur=[\d.]+;desc="2 queries"')
+		for name in ('serializer', 'auth', 'total'):
+			self.assertRegex(timing, rf'{name};dur=[\d.]+')
+		auth = float(re.search(r'auth;dur=([\d.]+)', timing).group(1))
+		self.assertGreater(auth, 0)
+
+	def test_metrics_logged_as_json(self):
+		"""test the metrics of the request are logged"""
+		with self.assertLogs('core.middleware', 'INFO') as logs:
+			self.client.get(reverse('lead:lead-list'))
+
+		record = json.loads(logs.records[0].getMessage())
+		self.assertEqual(record['method'], 'GET')
+		self.assertEqual(record['path'], reverse('lead:lead-list'))
+		self.assertEqual(record['status'], 200)
+		self.assertEqual(record['queries'], 2)
+		for key in ('db_ms', 'serializer_ms', 'auth_ms', 'total_ms'):
+			self.assertIn(key, record)
+		self.assertNotIn('pools', record)
+
+	def test_metrics_written_by_logger(self):
+		"""test the configured logger writes the metrics as a JSON line"""
+		logger = logging.getLogger('core.middleware')
+		self.assertTrue(logger.isEnabledFor(logging.INFO))
+		stream = StringIO()
+		handler, = logger.handlers
+		previous = handler.setStream(stream)
+		self.addCleanup(handler.setStream, previous)
+
+		self.client.get(reverse('lead:lead-list'))
+
+		record = json.loads(stream.getvalue())
+		self.assertEqual(record['path'], reverse('lead:lead-list'))
+
+	@override_settings(DB_POOL=True)
+	def test_pool_stats_logged(self):
+		"""test the stats of the connection pools are logged"""
+		stats = {('default', 'digest'): {'in_use': 1, 'saturation': 0.05}}
+
+		with patch.object(pool, 'get_stats', return_value=stats), \
+			self.assertLogs('core.middleware', 'INFO') as logs:
+			self.client.get(reverse('lead:lead-list'))
+
+		record = json.loads(logs.records[0].getMessage())
+		self.assertEqual(
+			record['pools'], {'default': {'in_use': 1, 'saturation': 0.05}},
+		)
@@ -71,3 +71,81 @@ class ModelTests(TestCase):
 
 		)
 		self.assertEqual(str(lead), lead.email)
+
+	def test_lead_dedupe_key(self):
+		"""Test the dedupe key follows the lead dedupe mode of the user"""
+		user = create_user()
+		lead = models.Lead(
+			user=user,
+			email='Lead@Example.com',
+			phone='+972 54-109-6752',
+		)
+
+		self.assertIsNone(lead.build_dedupe_key())
+		for mode, expected in [
+			('email', 'lead@example.com'),
+			('phone', '+972541096752'),
+			('email_phone', 'lead@example.com|+972541096752'),
+		]:
+			user.lead_dedupe = mode
+			self.assertEqual(lead.build_dedupe_key(), expected)
+
+	def test_insert_leads_skips_duplicates(self):
+		"""Test inserting leads skips the duplicates of the user leads"""
+		user = create_user()
+		user.lead_dedupe = models.User.LeadDedupe.EMAIL
+		user.save()
+		other_user = create_user(email='other@example.com')
+		other_user.lead_dedupe = models.User.LeadDedupe.EMAIL
+		other_user.save()
+		defaults = {'fname': 'John', 'lname': 'Doe', 'phone': '+972541096752'}
+		models.Lead.objects.create(
+			user=user, email='first@example.com', **defaults
+		)
+
+		leads = [
+			models.Lead(user=user, email='FIRST@example.com', **defaults),
+			models.Lead(user=user, email='second@example.com', **defaults),
+			models.Lead(user=user, email='second@example.com', **defaults),
+			models.Lead(user=other_user, email='first@example.com', **defaults),
+		]
+		inserted = models.Lead.objects.insert(leads)
+
+		self.assertEqual(inserted, [leads[1], leads[3]])
+		self.assertIsNone(leads[0].id)
+		self.assertIsNone(leads[2].id)
+		self.assertEqual(models.Lead.objects.filter(user=user).count(), 2)
+		self.assertEqual(models.Lead.objects.count(), 3)
+
+	def test_insert_leads_without_dedupe_key(self):
+		"""Test the inserted leads without a dedupe key get their own ids"""
+		user = create_user()
+		leads = [
+			models.Lead(
+				user=user, fname='John', lname='Doe',
+				email=f'lead{i}@example.com', phone='+972541096752',
+			)
+			for i in range(5)
+		]
+
+		inserted = models.Lead.objects.insert(leads, batch_size=3)
+
+		self.assertEqual(inserted, leads)
+		for lead in leads:
+			self.assertIsNone(lead.dedupe_key)
+			self.assertEqual(
+				models.Lead.objects.get(id=lead.id).email, lead.email,
+			)
+
+	def test_save_keeps_data_version(self):
+		"""Test saving a user loaded before a bump keeps the new version"""
+		user = create_user()
+		stale = get_user_model().objects.get(pk=user.pk)
+		user.bump_data_version()
+
+		stale.name = 'New Name'
+		stale.save()
+
+		user.refresh_from_db()
+		self.assertEqual(user.data_version, 1)
+		self.assertEqual(user.name, 'New Name')
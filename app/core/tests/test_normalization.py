@@ -0,0 +1,71 @@
+"""
+tests for the normalization of lead contact details
+"""
+
+from core import normalization
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+from phonenumber_field.phonenumber import to_python
+
+
+class NormalizationTests(SimpleTestCase):
+	"""Test the email and phone normalization"""
+
+	def setUp(self):
+		"""starting every test with an empty phone number cache"""
+		normalization._parse_phone.cache_clear()
+
+	def test_normalize_email(self):
+		"""Test emails are stripped and their domain lowercased"""
+		self.assertEqual(
+			normalization.normalize_email(' Lead@EXAMPLE.com '),
+			'Lead@example.com',
+		)
+		with self.assertRaises(ValidationError):
+			normalization.normalize_email('not-an-email')
+		with self.assertRaises(ValidationError):
+			normalization.normalize_email(['lead@example.com'])
+
+	def test_normalize_phone(self):
+		"""Test phone numbers are returned in E.164"""
+		self.assertEqual(
+			normalization.normalize_phone('+972 54-109-6752'),
+			'+972541096752',
+		)
+		with self.assertRaises(ValidationError):
+			normalization.normalize_phone('123')
+		with self.assertRaises(ValidationError):
+			normalization.normalize_phone(972541096752)
+
+	def test_phone_number_parsed_once(self):
+		"""Test a raw phone number is parsed once and then cached"""
+		for _ in range(3):
+			phone = normalization.to_phone_number('+972541096752')
+
+		info = normalization._parse_phone.cache_info()
+		self.assertEqual(info.misses, 1)
+		self.assertEqual(info.hits, 2)
+		self.assertEqual(phone, to_python('+972541096752'))
+		self.assertEqual(str(phone), '+972541096752')
+
+	def test_cached_phone_numbers_are_copies(self):
+		"""Test the cached phone numbers are not shared between callers"""
+		first = normalization.to_phone_number('+972541096752')
+		second = normalization.to_phone_number('+972541096752')
+
+		self.assertIsNot(first, second)
+
+	def test_invalid_phone_number(self):
+		"""Test an invalid phone number keeps its raw input"""
+		phone = normalization.to_phone_number('0987654321')
+
+		self.assertFalse(phone.is_valid())
+		self.assertEqual(str(phone), '0987654321')
+
+	def test_phone_number_compared_to_plain_phone_number(self):
+		"""Test cached and plain phone numbers compare equal both ways"""
+		cached = normalization.to_phone_number('+972541096752')
+		plain = to_python('+972541096752')
+
+		self.assertEqual(cached, plain)
+		self.assertEqual(plain, cached)
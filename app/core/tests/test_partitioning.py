@@ -0,0 +1,256 @@
+"""
+Test the online move of the lead table to a partitioned table.
+
+The tests run in the test transaction, the DDL is rolled back with it.
+"""
+import re
+from io import StringIO
+from unittest.mock import patch
+
+from core import partitioning
+from core.models import Lead, LeadStats
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Index
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+PARTITION_RE = re.compile(r' on core_lead_p(\d+)\b')
+
+
+def create_leads(user, count, start=0):
+	"""It creates count leads of the user"""
+	return Lead.objects.insert([
+		Lead(
+			user=user,
+			fname='John',
+			lname='Doe',
+			email=f'lead{i}@example.com',
+			phone='+972541096752',
+		)
+		for i in range(start, start + count)
+	])
+
+
+def table_ids(table):
+	"""returns the ids of the leads of the table"""
+	with connection.cursor() as cursor:
+		cursor.execute(f'SELECT id FROM {table} ORDER BY id')
+		return [row[0] for row in cursor.fetchall()]
+
+
+def table_indexes(table):
+	"""returns the index names of the table"""
+	with connection.cursor() as cursor:
+		cursor.execute(
+			'SELECT indexname FROM pg_indexes WHERE tablename = %s', [table],
+		)
+		return {row[0] for row in cursor.fetchall()}
+
+
+class PartitionLeadsTests(TestCase):
+	"""Test moving the lead table to hash partitions"""
+
+	def setUp(self):
+		User = get_user_model()
+		self.user = User.objects.create_user('user@example.com', 'Password')
+		self.other = User.objects.create_user('other@example.com', 'Password')
+		self.leads = create_leads(self.user, 5) + create_leads(self.other, 3)
+
+	def partition(self):
+		"""It runs the move up to the swap"""
+		partitioning.prepare(4)
+		partitioning.backfill(batch_size=3)
+		partitioning.swap()
+
+	def test_writes_mirrored_during_backfill(self):
+		"""test the writes after prepare are copied to the shadow table"""
+		partitioning.prepare(4)
+		created = create_leads(self.user, 2, start=5)
+		Lead.objects.filter(id=self.leads[0].id).delete()
+		Lead.objects.filter(id=self.leads[1].id).update(fname='Jane')
+
+		read = partitioning.backfill(batch_size=3)
+
+		self.assertEqual(read, 9)
+		self.assertEqual(
+			table_ids(partitioning.SHADOW), table_ids(partitioning.SOURCE),
+		)
+		self.assertIn(created[0].id, table_ids(partitioning.SHADOW))
+		source, shadow = partitioning.verify()
+		self.assertEqual(source, shadow)
+
+	def test_swap(self):
+		"""test the partitioned table replaces the lead table"""
+		ids = table_ids(partitioning.SOURCE)
+
+		self.partition()
+
+		self.assertEqual(partitioning.state(), 'swapped')
+		self.assertEqual(table_ids(partitioning.SOURCE), ids)
+		with connection.cursor() as cursor:
+			cursor.execute(
+				'SELECT count(*) FROM pg_inherits '
+				"WHERE inhparent = 'core_lead'::regclass"
+			)
+			self.assertEqual(cursor.fetchone()[0], 4)
+
+		retired = {
+			name[:-len(partitioning.RETIRED_SUFFIX)]
+			for name in table_indexes(partitioning.RETIRED)
+		}
+		self.assertEqual(
+			table_indexes(partitioning.SOURCE),
+			retired | {partitioning.ID_INDEX},
+		)
+		self.assertIn('core_lead_user_id_idx', retired)
+		self.assertIn('core_lead_pkey', retired)
+
+		# the deferred foreign key checks of the test leads are pending.
+		with connection.cursor() as cursor:
+			cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+		partitioning.drop()
+		self.assertEqual(partitioning.state(), 'partitioned')
+
+	def test_writes_after_swap(self):
+		"""test the sequence, the dedupe and the stats triggers move along"""
+		self.user.lead_dedupe = get_user_model().LeadDedupe.EMAIL
+		self.user.save()
+		self.partition()
+
+		created = create_leads(self.user, 1, start=5)
+		duplicates = create_leads(self.user, 1, start=5)
+
+		self.assertGreater(created[0].id, max(lead.id for lead in self.leads))
+		self.assertEqual(duplicates, [])
+		Lead.objects.filter(id=self.leads[0].id).delete()
+		self.assertEqual(LeadStats.objects.get(user=self.user).total, 5)
+
+	def test_api_queries_pruned(self):
+		"""test each lead query of the API reads a single partition"""
+		self.partition()
+		client = APIClient()
+		client.force_authenticate(self.user)
+		lead_id = self.leads[0].id
+
+		with CaptureQueriesContext(connection) as context:
+			client.get(reverse('lead:lead-list'))
+			client.get(reverse('lead:lead-detail', args=[lead_id]))
+			client.get(reverse('lead:lead-search'), {'q': 'john'})
+			client.post(
+				reverse('lead:lead-bulk-delete'),
+				{'ids': [self.leads[1].id]},
+				format='json',
+			)
+			response = client.delete(
+				reverse('lead:lead-detail', args=[lead_id]),
+			)
+
+		self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+		statements = [
+			query['sql'] for query in context.captured_queries
+			if '"core_lead"' in query['sql']
+		]
+		# the delete reads the lead first.
+		self.assertEqual(len(statements), 6)
+		with connection.cursor() as cursor:
+			for sql in statements:
+				cursor.execute(f'EXPLAIN {sql}')
+				plan = '\n'.join(row[0] for row in cursor.fetchall())
+				self.assertEqual(
+					len(set(PARTITION_RE.findall(plan))), 1, plan,
+				)
+
+	def test_id_lookups_use_index(self):
+		"""test the reads by id alone scan the id index of each partition"""
+		self.partition()
+		queries = [
+			Lead.objects.filter(pk=self.leads[0].id),
+			Lead.objects.filter(id__lt=self.leads[-1].id).order_by('-id')[:2],
+			Lead.objects.filter(id__gt=0).order_by('id')[:2],
+		]
+
+		with connection.cursor() as cursor:
+			cursor.execute('SET LOCAL enable_seqscan = off')
+			for queryset in queries:
+				sql, params = queryset.query.sql_with_params()
+				cursor.execute(f'EXPLAIN {sql}', params)
+				plan = '\n'.join(row[0] for row in cursor.fetchall())
+				self.assertNotIn('Seq Scan', plan)
+				self.assertRegex(plan, r'core_lead_p\d+_id_idx')
+
+	def test_index_migration_after_swap(self):
+		"""test a concurrent index migration builds it on each partition"""
+		self.partition()
+		index = Index(fields=['created_at'], name='core_lead_created_at_idx')
+		with connection.cursor() as cursor:
+			# the deferred foreign key checks of the test leads are pending.
+			cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+			cursor.execute(f'DROP INDEX {index.name}')
+		operation = partitioning.AddIndexConcurrently('lead', index)
+		state = MigrationLoader(connection).project_state()
+
+		# CONCURRENTLY can't run in the test transaction, the collected
+		# statements are run without it.
+		with patch.object(operation, '_ensure_not_in_transaction'), \
+			connection.schema_editor(collect_sql=True, atomic=False) as editor:
+			operation.database_forwards('core', editor, state, state)
+		with connection.cursor() as cursor:
+			for sql in editor.collected_sql:
+				cursor.execute(sql.replace(' CONCURRENTLY', ''))
+			cursor.execute(
+				'SELECT indisvalid FROM pg_index '
+				'WHERE indexrelid = %s::regclass',
+				[index.name],
+			)
+			self.assertTrue(cursor.fetchone()[0])
+		self.assertIn(
+			'core_lead_p0_created_at_idx', table_indexes('core_lead_p0'),
+		)
+		self.assertEqual(len(editor.collected_sql), 1 + 2 * 4)
+
+	def test_prepare_with_pending_migrations_error(self):
+		"""test prepare refuses to run before the migrations"""
+		with patch.object(
+			MigrationExecutor, 'migration_plan', return_value=[object()],
+		):
+			with self.assertRaisesMessage(
+				partitioning.PartitioningError, 'Apply the migrations',
+			):
+				partitioning.prepare(2)
+
+	def test_abort(self):
+		"""test abort drops the shadow table and stops the mirroring"""
+		call_command(
+			'partition_leads', 'prepare', partitions=2, stdout=StringIO(),
+		)
+
+		call_command('partition_leads', 'abort', stdout=StringIO())
+
+		self.assertEqual(partitioning.state(), 'unpartitioned')
+		create_leads(self.user, 1, start=5)
+
+	def test_command(self):
+		"""test the steps of the command"""
+		out = StringIO()
+
+		for step in ('prepare', 'backfill', 'verify', 'swap', 'status'):
+			call_command(
+				'partition_leads', step, partitions=2, batch_size=5, stdout=out,
+			)
+
+		self.assertIn('Copied 8 leads up to id', out.getvalue())
+		self.assertIn('Both tables hold the same 8 leads', out.getvalue())
+		self.assertIn('The lead table is swapped', out.getvalue())
+
+	def test_step_out_of_order_error(self):
+		"""test a step run in the wrong state fails"""
+		with self.assertRaisesMessage(CommandError, 'expected prepared'):
+			call_command('partition_leads', 'swap', stdout=StringIO())
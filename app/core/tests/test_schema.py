@@ -0,0 +1,107 @@
+"""
+Test the API schema generated once per code version
+"""
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from core import schema
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+
+class CachedSchemaTests(SimpleTestCase):
+	"""Test the cached API schema and its view"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = Path(directory.name)
+		settings = override_settings(
+			API_SCHEMA_DIR=self.directory, API_SCHEMA_VERSION='v1',
+		)
+		settings.enable()
+		self.addCleanup(settings.disable)
+		schema._schemas.clear()
+		self.addCleanup(schema._schemas.clear)
+		self.factory = RequestFactory()
+
+	def test_schema_served(self):
+		"""test the schema lists the API, as YAML by default"""
+		response = schema.schema_view(self.factory.get('/api/schema/'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(
+			response['Content-Type'].startswith('application/vnd.oai.openapi')
+		)
+		self.assertIn(b'openapi: 3.0.3', response.content)
+		self.assertIn(b'/api/lead/lead/:', response.content)
+		self.assertEqual(response['ETag'], '"v1-yaml"')
+		self.assertIn('public', response['Cache-Control'])
+
+	def test_schema_served_as_json(self):
+		"""test the schema is served as JSON when asked"""
+		response = schema.schema_view(self.factory.get(
+			'/api/schema/', HTTP_ACCEPT='application/json',
+		))
+
+		self.assertIn('/api/lead/lead/', json.loads(response.content)['paths'])
+		self.assertEqual(response['ETag'], '"v1-json"')
+
+	def test_schema_not_modified(self):
+		"""test the client having the current schema is answered 304"""
+		response = schema.schema_view(self.factory.get(
+			'/api/schema/', HTTP_IF_NONE_MATCH='"v1-yaml"',
+		))
+
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.content, b'')
+
+	def test_schema_generated_once(self):
+		"""test the schema is generated at first use only, and written"""
+		with mock.patch.object(
+			schema, 'generate', wraps=schema.generate,
+		) as generate:
+			schema.load()
+			schema.load()
+
+		generate.assert_called_once()
+		self.assertTrue((self.directory / 'schema-v1.yaml').exists())
+		self.assertTrue((self.directory / 'schema-v1.json').exists())
+
+	def test_schema_read_from_build(self):
+		"""test a process reads the schema written by the build"""
+		call_command('build_schema', stdout=StringIO())
+		schema._schemas.clear()
+
+		with mock.patch.object(schema, 'generate') as generate:
+			version, rendered = schema.load()
+
+		generate.assert_not_called()
+		self.assertEqual(version, 'v1')
+		self.assertIn(b'/api/lead/lead/:', rendered['yaml'])
+
+	def test_schema_invalidated_by_code_version(self):
+		"""test a new code version generates the schema again"""
+		schema.load()
+
+		with override_settings(API_SCHEMA_VERSION='v2'), mock.patch.object(
+			schema, 'generate', wraps=schema.generate,
+		) as generate:
+			response = schema.schema_view(self.factory.get(
+				'/api/schema/', HTTP_IF_NONE_MATCH='"v1-yaml"',
+			))
+
+		generate.assert_called_once()
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['ETag'], '"v2-yaml"')
+		self.assertEqual(list(schema._schemas), ['v2'])
+
+	def test_code_version_of_sources(self):
+		"""test the code version is a hash of the sources without a build one"""
+		with override_settings(API_SCHEMA_VERSION=''):
+			version = schema.code_version()
+
+		self.assertRegex(version, r'^[0-9a-f]{16}$')
@@ -0,0 +1,275 @@
+"""
+Test the throttling and the load shedding
+"""
+import contextvars
+import multiprocessing
+import os
+import signal
+import threading
+from unittest.mock import MagicMock, patch
+
+from core import throttling
+from core.middleware import LoadSheddingMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+LEAD_URL = reverse('lead:lead-list')
+TOKEN_URL = reverse('user:token')
+
+SHEDDING_MIDDLEWARE = ['core.middleware.LoadSheddingMiddleware']
+
+
+def throttle_rates(**rates):
+	"""returns the REST_FRAMEWORK settings with the throttle rates"""
+	return {
+		**settings.REST_FRAMEWORK,
+		'DEFAULT_THROTTLE_RATES': {
+			**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates,
+		},
+	}
+
+
+def die_holding_lock(state):
+	"""killed while holding the shared lock, as a worker on timeout"""
+	with state.lock:
+		os.kill(os.getpid(), signal.SIGKILL)
+
+
+def take_tokens(state, count):
+	"""taking tokens of the shared bucket from a forked process"""
+	for _ in range(count):
+		state.take('shared', 10, 1)
+
+
+class SharedStateTests(SimpleTestCase):
+	"""Test the token buckets and the request counts"""
+
+	def setUp(self):
+		self.state = throttling.SharedState(64)
+		self.now = 1000.0
+		clock = patch.object(
+			throttling.time, 'monotonic', side_effect=lambda: self.now,
+		)
+		clock.start()
+		self.addCleanup(clock.stop)
+
+	def test_bucket(self):
+		"""test a bucket allows its capacity at once then its rate"""
+		waits = [self.state.take('client', 3, 0.5) for _ in range(4)]
+
+		self.assertEqual(waits, [0, 0, 0, 2.0])
+		self.assertEqual(self.state.take('other', 3, 0.5), 0)
+
+		self.now += 2
+		self.assertEqual(self.state.take('client', 3, 0.5), 0)
+		self.assertEqual(self.state.take('client', 3, 0.5), 2.0)
+
+		self.now += 60
+		waits = [self.state.take('client', 3, 0.5) for _ in range(4)]
+		self.assertEqual(waits, [0, 0, 0, 2.0])
+
+	def test_denied_without_lock(self):
+		"""test a denied client is denied again without the shared lock"""
+		self.state.take('client', 1, 1)
+		self.state.take('client', 1, 1)
+		self.state.lock = MagicMock()
+
+		self.now += 0.5
+		self.assertEqual(self.state.take('client', 1, 1), 0.5)
+
+		self.state.lock.__enter__.assert_not_called()
+
+	def test_full_table(self):
+		"""test the buckets of a full table are replaced, full ones first"""
+		state = throttling.SharedState(2)
+		for client in range(10):
+			self.assertEqual(state.take(f'client{client}', 1, 1), 0)
+
+	def test_shared_by_forked_processes(self):
+		"""test the buckets are shared with the processes forked after"""
+		context = multiprocessing.get_context('fork')
+		process = context.Process(target=take_tokens, args=(self.state, 9))
+		process.start()
+		process.join()
+
+		self.assertEqual(self.state.take('shared', 10, 1), 0)
+		self.assertGreater(self.state.take('shared', 10, 1), 0)
+
+	def test_lock_released_by_killed_process(self):
+		"""test the shared lock of a process killed holding it is released"""
+		context = multiprocessing.get_context('fork')
+		process = context.Process(target=die_holding_lock, args=(self.state,))
+		process.start()
+		process.join()
+		self.assertEqual(process.exitcode, -signal.SIGKILL)
+
+		taker = threading.Thread(
+			target=self.state.take, args=('client', 1, 1), daemon=True,
+		)
+		taker.start()
+		taker.join(5)
+
+		self.assertFalse(taker.is_alive())
+
+	def test_requests(self):
+		"""test the requests are counted up to the limit"""
+		self.assertTrue(self.state.enter(2))
+		self.assertTrue(self.state.enter(2))
+		self.assertFalse(self.state.enter(2))
+
+		self.state.leave()
+		self.assertEqual(self.state.requests(), 1)
+		self.assertTrue(self.state.enter(2))
+
+	def test_release_process(self):
+		"""test the requests of an exited process are uncounted"""
+		context = multiprocessing.get_context('fork')
+		process = context.Process(target=self.state.enter, args=(5,))
+		process.start()
+		process.join()
+		self.state.enter(5)
+		self.assertEqual(self.state.requests(), 2)
+
+		self.state.release_process(process.pid)
+
+		self.assertEqual(self.state.requests(), 1)
+
+
+class ThrottleTests(TestCase):
+	"""Test the throttles of the API"""
+
+	def setUp(self):
+		throttling.state.reset()
+		self.addCleanup(throttling.state.reset)
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	@override_settings(REST_FRAMEWORK=throttle_rates(lead_token='2/min'))
+	def test_token_throttled(self):
+		"""test the requests of a token over its rate are answered 429"""
+		for _ in range(2):
+			response = self.client.get(LEAD_URL)
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+		response = self.client.get(LEAD_URL)
+
+		self.assertEqual(
+			response.status_code, status.HTTP_429_TOO_MANY_REQUESTS,
+		)
+		self.assertEqual(response['Retry-After'], '30')
+
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+		self.client.force_authenticate(other)
+		response = self.client.get(LEAD_URL)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	@override_settings(REST_FRAMEWORK=throttle_rates(auth_ip='2/hour'))
+	def test_ip_throttled(self):
+		"""test the token requests of an ip over its rate are answered 429"""
+		payload = {'email': 'user@example.com', 'password': 'wrong'}
+		for _ in range(2):
+			response = self.client.post(TOKEN_URL, payload)
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+		response = self.client.post(TOKEN_URL, payload)
+
+		self.assertEqual(
+			response.status_code, status.HTTP_429_TOO_MANY_REQUESTS,
+		)
+		self.assertEqual(response['Retry-After'], '1800')
+		response = self.client.post(
+			TOKEN_URL, payload, REMOTE_ADDR='10.0.0.2',
+		)
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	@override_settings(REST_FRAMEWORK=throttle_rates(lead_token=''))
+	def test_scope_without_rate(self):
+		"""test a scope without a rate isn't throttled"""
+		for _ in range(5):
+			response = self.client.get(LEAD_URL)
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(
+	MIDDLEWARE=SHEDDING_MIDDLEWARE + settings.MIDDLEWARE,
+	LOAD_SHED_MAX_REQUESTS=1,
+	LOAD_SHED_RETRY_AFTER=3,
+)
+class LoadSheddingTests(TestCase):
+	"""Test shedding the requests over the concurrency limit"""
+
+	def setUp(self):
+		throttling.state.reset()
+		self.addCleanup(throttling.state.reset)
+		user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		token = Token.objects.create(user=user)
+		self.client = APIClient()
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+	def test_requests_under_limit(self):
+		"""test the requests served one after the other aren't shed"""
+		for _ in range(3):
+			response = self.client.get(LEAD_URL)
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+		self.assertEqual(throttling.state.requests(), 0)
+
+	def test_requests_over_limit(self):
+		"""test a request over the limit is shed before any query"""
+		throttling.state.enter(1)
+
+		with self.assertNumQueries(0):
+			response = self.client.get(LEAD_URL)
+
+		self.assertEqual(
+			response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE,
+		)
+		self.assertEqual(response['Retry-After'], '3')
+		self.assertEqual(throttling.state.requests(), 1)
+
+	def test_streaming_counted_until_consumed(self):
+		"""test a streaming response is counted until it is consumed"""
+		response = self.client.get(reverse('lead:lead-export'))
+		self.assertEqual(throttling.state.requests(), 1)
+
+		b''.join(response.streaming_content)
+		response.close()
+
+		self.assertEqual(throttling.state.requests(), 0)
+
+	def test_streaming_closed_in_another_context(self):
+		"""test the slot is released by a close out of the request context"""
+		response = self.client.get(reverse('lead:lead-export'))
+		# the connections of a fresh context aren't those of the test.
+		request_finished.disconnect(close_old_connections)
+		self.addCleanup(request_finished.connect, close_old_connections)
+
+		contextvars.Context().run(response.close)
+
+		self.assertEqual(throttling.state.requests(), 0)
+
+	def test_released_on_error(self):
+		"""test the slot is released when the view raises"""
+		middleware = LoadSheddingMiddleware(
+			MagicMock(side_effect=RuntimeError),
+		)
+
+		with self.assertRaises(RuntimeError):
+			middleware(MagicMock())
+
+		self.assertEqual(throttling.state.requests(), 0)
@@ -0,0 +1,328 @@
+"""
+The throttling and the load shedding of the API.
+
+The throttles are token buckets kept in a memory region shared by the
+processes forked from the serve command master, which creates it when
+it preloads the application. A bucket is found by the hash of its key in
+a fixed table of THROTTLE_SLOTS slots, and updated under a lock shared by
+the processes, a record lock of a file released by the system when its
+holder dies, e.g. a worker killed on timeout. A process remembers until when a key is denied, so the
+requests of a flooding client are denied without taking the lock.
+
+A scope is throttled once its THROTTLE_*_RATE setting is set.
+
+The same region counts the requests being served by all the processes,
+LoadSheddingMiddleware answers 503 over LOAD_SHED_MAX_REQUESTS of them.
+"""
+import fcntl
+import functools
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+# the number of processes counted by the concurrency limiter.
+MAX_PROCESSES = 1024
+# the slots probed for the bucket of a key.
+PROBES = 8
+# the keys a process remembers as denied, forgotten all at once beyond.
+MAX_DENIED = 10000
+
+# the requests being served by all the processes.
+TOTAL = struct.Struct('<q')
+# the pid of a process and the requests it is serving.
+PROCESS = struct.Struct('<qq')
+# the key hash, the tokens, the update time and the time the bucket is
+# full again of a bucket, the hash 0 being a free slot.
+BUCKET = struct.Struct('<Qddd')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class SharedLock:
+	"""
+	A lock of the processes forked after it is created and of their
+	threads: a POSIX record lock on an anonymous file, which the system
+	releases when the process holding it dies, taken under a lock of
+	the threads of the process, the record locks being per process
+	"""
+
+	def __init__(self):
+		self.file = tempfile.TemporaryFile()
+		self.threads = threading.Lock()
+
+	def __enter__(self):
+		self.threads.acquire()
+		try:
+			fcntl.lockf(self.file, fcntl.LOCK_EX)
+		except BaseException:
+			self.threads.release()
+			raise
+		return self
+
+	def __exit__(self, *exc_info):
+		try:
+			fcntl.lockf(self.file, fcntl.LOCK_UN)
+		finally:
+			self.threads.release()
+
+
+class SharedState:
+	"""
+	The buckets and the request counts in an anonymous shared memory map,
+	inherited by the processes forked after it is created
+	"""
+
+	def __init__(self, slots):
+		"""
+		:param slots: the number of buckets of the table
+		"""
+		self.slots = slots
+		self.processes_offset = TOTAL.size
+		self.buckets_offset = (
+			self.processes_offset + MAX_PROCESSES * PROCESS.size
+		)
+		self.buffer = mmap.mmap(
+			-1, self.buckets_offset + slots * BUCKET.size,
+		)
+		self.lock = SharedLock()
+		# the entry of the current process, (pid, position)
+		self.entry = (None, None)
+		self.denied = {}
+
+	def take(self, key, capacity, rate):
+		"""
+		It takes a token from the bucket of the key, refilled by rate
+		tokens per second up to capacity
+
+		:return: 0 when a token was taken, else the seconds until one is
+			available
+		"""
+		now = time.monotonic()
+		denied_until = self.denied.get(key)
+		if denied_until is not None:
+			if now < denied_until:
+				return denied_until - now
+			self.denied.pop(key, None)
+
+		digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+		key_hash = int.from_bytes(digest, 'little') or 1
+		with self.lock:
+			offset, tokens, updated_at = self.find(key_hash, now)
+			if updated_at:
+				tokens = min(capacity, tokens + (now - updated_at) * rate)
+			else:
+				tokens = capacity
+			wait = 0.0
+			if tokens >= 1:
+				tokens -= 1
+			else:
+				wait = (1 - tokens) / rate
+			BUCKET.pack_into(
+				self.buffer, offset, key_hash, tokens, now,
+				now + (capacity - tokens) / rate,
+			)
+
+		if wait:
+			if len(self.denied) >= MAX_DENIED:
+				self.denied.clear()
+			self.denied[key] = now + wait
+		return wait
+
+	def find(self, key_hash, now):
+		"""
+		It returns the offset, the tokens and the update time of the bucket
+		of the key hash, the time being 0 for a new bucket. A new bucket
+		takes a free slot, else a full one, else the soonest full one.
+		"""
+		first = key_hash % self.slots
+		victim, victim_full_at = None, None
+		for probe in range(PROBES):
+			offset = self.buckets_offset + (
+				(first + probe) % self.slots
+			) * BUCKET.size
+			slot_hash, tokens, updated_at, full_at = BUCKET.unpack_from(
+				self.buffer, offset,
+			)
+			if slot_hash == key_hash:
+				return offset, tokens, updated_at
+			if slot_hash == 0 or full_at <= now:
+				return offset, 0.0, 0.0
+			if victim is None or full_at < victim_full_at:
+				victim, victim_full_at = offset, full_at
+		return victim, 0.0, 0.0
+
+	def process_position(self):
+		"""
+		It returns the position of the entry of the current process,
+		claimed on first use, to be called under the lock
+		"""
+		pid = os.getpid()
+		if self.entry[0] == pid:
+			return self.entry[1]
+		free = None
+		for position in range(MAX_PROCESSES):
+			entry_pid, _count = PROCESS.unpack_from(
+				self.buffer, self.processes_offset + position * PROCESS.size,
+			)
+			if entry_pid == pid:
+				free = position
+				break
+			if entry_pid == 0 and free is None:
+				free = position
+		if free is None:
+			raise RuntimeError('Too many processes for the load shedding')
+		PROCESS.pack_into(
+			self.buffer, self.processes_offset + free * PROCESS.size, pid, 0,
+		)
+		self.entry = (pid, free)
+		return free
+
+	def enter(self, limit):
+		"""
+		It counts a request of the current process
+
+		:return: False when limit requests are already being served
+		"""
+		with self.lock:
+			(total,) = TOTAL.unpack_from(self.buffer, 0)
+			if total >= limit:
+				return False
+			self.add(self.process_position(), 1, total)
+		return True
+
+	def leave(self):
+		"""It uncounts a request of the current process"""
+		with self.lock:
+			(total,) = TOTAL.unpack_from(self.buffer, 0)
+			self.add(self.process_position(), -1, total)
+
+	def add(self, position, count, total):
+		"""adding count to the requests of the process and to the total"""
+		offset = self.processes_offset + position * PROCESS.size
+		pid, current = PROCESS.unpack_from(self.buffer, offset)
+		PROCESS.pack_into(self.buffer, offset, pid, current + count)
+		TOTAL.pack_into(self.buffer, 0, total + count)
+
+	def release_process(self, pid):
+		"""
+		It uncounts the requests of a process that exited, possibly killed
+		while serving them
+		"""
+		with self.lock:
+			for position in range(MAX_PROCESSES):
+				offset = self.processes_offset + position * PROCESS.size
+				entry_pid, count = PROCESS.unpack_from(self.buffer, offset)
+				if entry_pid == pid:
+					(total,) = TOTAL.unpack_from(self.buffer, 0)
+					TOTAL.pack_into(self.buffer, 0, total - count)
+					PROCESS.pack_into(self.buffer, offset, 0, 0)
+					return
+
+	def requests(self):
+		"""returns the number of requests being served"""
+		return TOTAL.unpack_from(self.buffer, 0)[0]
+
+	def reset(self):
+		"""It forgets every bucket and request count"""
+		with self.lock:
+			self.buffer[:] = bytes(len(self.buffer))
+		self.entry = (None, None)
+		self.denied.clear()
+
+
+# created on import, by the serve command master before the fork.
+state = SharedState(settings.THROTTLE_SLOTS)
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+	"""
+	returns the capacity and the tokens per second of a rate as
+	'<requests>/<period>', e.g. '100/min', None for no rate
+	"""
+	if not rate:
+		return None
+	requests, period = rate.split('/')
+	requests = int(requests)
+	return requests, requests / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+	"""
+	A token bucket per client of the views of a throttle_scope, the rate
+	being the DEFAULT_THROTTLE_RATES of '<scope>_<kind>', e.g. lead_token.
+	The capacity is the number of requests of the rate, the bucket being
+	refilled at the rate, so a client can send them at once then at the
+	rate. The views without a scope or rate aren't throttled.
+	"""
+
+	# the kind of client, the second part of the rate name
+	kind = None
+
+	def __init__(self):
+		self.delay = None
+
+	def get_key(self, request):
+		"""returns the client of the request, None not to throttle it"""
+		raise NotImplementedError
+
+	def allow_request(self, request, view):
+		scope = getattr(view, 'throttle_scope', None)
+		rate = parse_rate(
+			api_settings.DEFAULT_THROTTLE_RATES.get(f'{scope}_{self.kind}')
+		) if scope else None
+		key = self.get_key(request) if rate else None
+		if key is None:
+			return True
+		capacity, per_second = rate
+		self.delay = state.take(
+			f'{scope}:{self.kind}:{key}', capacity, per_second,
+		)
+		return not self.delay
+
+	def wait(self):
+		return self.delay
+
+
+class TokenRateThrottle(TokenBucketThrottle):
+	"""The token bucket of each authentication token, one per user"""
+
+	kind = 'token'
+
+	def get_key(self, request):
+		if request.user and request.user.is_authenticated:
+			return str(request.user.pk)
+		return None
+
+
+class IPRateThrottle(TokenBucketThrottle):
+	"""The token bucket of each client ip, see NUM_PROXIES"""
+
+	kind = 'ip'
+
+	def get_key(self, request):
+		return self.get_ident(request)
+
+
+def enter():
+	"""
+	It counts a request being served by all the processes, to be
+	uncounted by leave once served
+
+	:return: False when LOAD_SHED_MAX_REQUESTS are already being served
+	"""
+	return state.enter(settings.LOAD_SHED_MAX_REQUESTS)
+
+
+def leave():
+	"""It uncounts a request counted by enter"""
+	state.leave()
@@ -0,0 +1,86 @@
+"""
+The archival of the old leads.
+
+archive_leads moves the leads created more than LEAD_ARCHIVE_AFTER_DAYS
+ago from core_lead to core_archivedlead, by batches of the oldest ones.
+A batch is deleted and archived by a single statement, so an interrupted
+run loses nothing and the next run goes on from the oldest lead left.
+The leads without created_at, created before it was recorded, are kept.
+The archived leads stay in the lead counters, the delete trigger of the
+counters skips the deletes of archive_batch, see migration 0015.
+"""
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+
+# the batch is locked with SKIP LOCKED, so the leads being written by a
+# request are left to the next run instead of waited for.
+ARCHIVE_BATCH = """
+WITH moved AS (
+	DELETE FROM core_lead WHERE (user_id, id) IN (
+		SELECT user_id, id FROM core_lead
+		WHERE created_at < %s
+		ORDER BY created_at
+		LIMIT %s
+		FOR UPDATE SKIP LOCKED
+	)
+	RETURNING id, user_id, fname, lname, email, phone, ip, created_at
+), archived AS (
+	INSERT INTO core_archivedlead
+		(id, user_id, fname, lname, email, phone, ip, created_at, archived_at)
+	SELECT id, user_id, fname, lname, email, phone, ip, created_at, now()
+	FROM moved
+)
+SELECT user_id, count(*) FROM moved GROUP BY user_id
+"""
+
+
+def archive_batch(before, batch_size):
+	"""
+	It archives the oldest leads created before the date, in one
+	transaction, and bumps the data version of their users
+
+	:param before: the datetime before which leads are archived
+	:param batch_size: the maximum number of leads archived
+	:return: the number of archived leads
+	"""
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute("SET LOCAL lead.archiving = 'on'")
+		cursor.execute(ARCHIVE_BATCH, [before, batch_size])
+		counts = dict(cursor.fetchall())
+		# SET LOCAL lasts until the outermost transaction ends.
+		cursor.execute("SET LOCAL lead.archiving = 'off'")
+		if counts:
+			get_user_model().objects.filter(pk__in=counts).update(
+				data_version=models.F('data_version') + 1,
+				data_modified_at=timezone.now(),
+			)
+	return sum(counts.values())
+
+
+def archive(days, batch_size, pause=0.0, progress=None):
+	"""
+	It archives the leads older than days, batch after batch
+
+	:param days: the age in days of the archived leads
+	:param batch_size: the number of leads archived per transaction
+	:param pause: the seconds slept between batches
+	:param progress: a callable given the number of leads archived so
+		far after each batch
+	:return: the number of archived leads
+	"""
+	before = timezone.now() - timedelta(days=days)
+	total = 0
+	while True:
+		count = archive_batch(before, batch_size)
+		if not count:
+			return total
+		total += count
+		if progress is not None:
+			progress(total)
+		if pause:
+			time.sleep(pause)
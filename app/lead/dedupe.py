@@ -0,0 +1,114 @@
+"""
+The rebuild of the dedupe keys of the leads after a dedupe mode change.
+
+The key of a lead is built with the lead_dedupe of its user when it is
+inserted, so once the mode changes the keys of the existing leads are
+rebuilt by rekey_leads, batch after batch, lead_dedupe_keyed being null
+until they all are. The new leads are keyed with the new mode meanwhile.
+A lead whose new key is already held by another lead of the user keeps
+no key, it is a duplicate created under the former mode.
+"""
+from core.models import Lead
+from core.normalization import dedupe_key
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+
+
+REKEY_BATCH = """
+UPDATE core_lead
+SET dedupe_key = CASE WHEN EXISTS (
+	SELECT 1 FROM core_lead other
+	WHERE other.user_id = rekeyed.user_id
+	AND other.dedupe_key = rekeyed.dedupe_key
+	AND other.id <> rekeyed.id
+) THEN NULL ELSE rekeyed.dedupe_key END
+FROM (VALUES {values}) AS rekeyed (user_id, id, dedupe_key)
+WHERE core_lead.user_id = rekeyed.user_id AND core_lead.id = rekeyed.id
+AND core_lead.dedupe_key IS DISTINCT FROM rekeyed.dedupe_key
+"""
+REKEYED_ROW = '(%s::bigint, %s::bigint, %s::varchar)'
+
+# the attempts of a batch whose keys are taken by concurrent inserts.
+RETRIES = 3
+
+
+def pending_users():
+	"""returns the users whose leads aren't keyed with their mode"""
+	stale = ~Q(lead_dedupe_keyed=F('lead_dedupe'))
+	return get_user_model().objects.filter(
+		Q(lead_dedupe_keyed__isnull=True) | stale,
+	).order_by('id')
+
+
+def rekey_batch(user_id, mode, start_id, batch_size):
+	"""
+	It rebuilds the keys of the leads of the user following the id,
+	in one transaction
+
+	:return: the last id read and the number of leads read
+	"""
+	leads = list(
+		Lead.objects
+		.filter(user_id=user_id, id__gt=start_id)
+		.order_by('id')
+		.values_list('id', 'email', 'phone', 'dedupe_key')[:batch_size]
+	)
+	if not leads:
+		return start_id, 0
+
+	rekeyed = [
+		(lead_id, dedupe_key(mode, email, phone), current)
+		for lead_id, email, phone, current in leads
+	]
+	# the leads already keyed with the mode keep their key, then the
+	# first lead of the batch holding a key.
+	keys = {key for _id, key, current in rekeyed if key == current}
+	params, rows = [], 0
+	for lead_id, key, current in rekeyed:
+		if key == current:
+			continue
+		if key in keys:
+			key = None
+		elif key is not None:
+			keys.add(key)
+		params.extend([user_id, lead_id, key])
+		rows += 1
+	if not rows:
+		return leads[-1][0], len(leads)
+	sql = REKEY_BATCH.format(values=', '.join([REKEYED_ROW] * rows))
+
+	for attempt in range(RETRIES):
+		try:
+			with transaction.atomic(), connection.cursor() as cursor:
+				cursor.execute(sql, params)
+			break
+		except IntegrityError:
+			# a lead inserted meanwhile took a key, seen by the next try.
+			if attempt == RETRIES - 1:
+				raise
+	return leads[-1][0], len(leads)
+
+
+def rekey(user, batch_size):
+	"""
+	It rebuilds the dedupe keys of the leads of the user with its current
+	lead_dedupe, then marks them keyed unless the mode changed meanwhile
+
+	:return: the number of leads read
+	"""
+	User = get_user_model()
+	mode = user.lead_dedupe
+	User.objects.filter(pk=user.pk).update(lead_dedupe_keyed=None)
+
+	last_id, read = 0, 0
+	while True:
+		last_id, batch_read = rekey_batch(user.pk, mode, last_id, batch_size)
+		if not batch_read:
+			break
+		read += batch_read
+
+	User.objects.filter(pk=user.pk, lead_dedupe=mode).update(
+		lead_dedupe_keyed=mode,
+	)
+	return read
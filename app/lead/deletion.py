@@ -0,0 +1,52 @@
+"""
+The bulk delete of the leads of a user
+"""
+from core.models import Lead
+from django.db import connection, transaction
+
+
+# the filter conditions of a bulk delete -> their lookups.
+FILTER_LOOKUPS = {
+	'email':          'email__iexact',
+	'phone':          'phone',
+	'created_after':  'created_at__gte',
+	'created_before': 'created_at__lt',
+}
+
+
+def filter_leads(queryset, conditions):
+	"""returns the leads of the queryset matching all the conditions"""
+	return queryset.filter(**{
+		FILTER_LOOKUPS[name]: value for name, value in conditions.items()
+	})
+
+
+def delete_leads(user, queryset, batch_size):
+	"""
+	It deletes the leads of the queryset by batches, each batch a single
+	DELETE ... WHERE id IN (SELECT ... LIMIT) in its own transaction, so
+	no lead is loaded and the locks are held briefly. The data version
+	of the user is bumped with each batch.
+
+	:param user: the owner of the leads
+	:param queryset: the leads of the user to delete
+	:param batch_size: the maximum number of leads deleted per statement
+	:return: the number of deleted leads
+	"""
+	subquery, params = queryset.values('id')[:batch_size].query \
+		.sql_with_params()
+	# filtered on the user again so the partitions are pruned.
+	sql = (
+		f'DELETE FROM {Lead._meta.db_table} '
+		f'WHERE user_id = %s AND id IN ({subquery})'
+	)
+	deleted = 0
+	while True:
+		with transaction.atomic(), connection.cursor() as cursor:
+			cursor.execute(sql, [user.pk, *params])
+			count = cursor.rowcount
+			if count:
+				user.bump_data_version()
+		deleted += count
+		if count < batch_size:
+			return deleted
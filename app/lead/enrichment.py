@@ -0,0 +1,92 @@
+"""
+The backfill of the ip enrichment of the existing leads.
+
+The leads created with LEAD_IP_INDEX are enriched on insert, see
+core.ipranges. enrich_leads sets the country, region and ASN of the other
+leads with an ip, and of all of them again once the index is rebuilt from
+a newer range file, by batches of ids each in its own short transaction.
+Only the leads whose enrichment changes are written.
+"""
+import time
+
+from core import ipranges
+from core.models import Lead
+from django.db import connection, transaction
+
+
+ENRICH_BATCH = """
+UPDATE core_lead
+SET ip_country = enriched.country,
+	ip_region = enriched.region,
+	ip_asn = enriched.asn
+FROM (VALUES {values}) AS enriched (user_id, id, country, region, asn)
+WHERE core_lead.user_id = enriched.user_id AND core_lead.id = enriched.id
+AND (core_lead.ip_country, core_lead.ip_region, core_lead.ip_asn)
+	IS DISTINCT FROM (enriched.country, enriched.region, enriched.asn)
+"""
+ENRICHED_ROW = '(%s::bigint, %s::bigint, %s::varchar, %s::varchar, %s::bigint)'
+
+
+def enrich_batch(index, start_id, batch_size):
+	"""
+	It enriches the leads with an ip following the id, in one transaction
+
+	:param index: the IPRangeIndex
+	:param start_id: the id after which the leads are enriched
+	:param batch_size: the maximum number of leads read
+	:return: the last id read, the number of leads read and of leads
+		updated
+	"""
+	with transaction.atomic():
+		leads = list(
+			Lead.objects
+			.filter(id__gt=start_id, ip__isnull=False)
+			.order_by('id')
+			.values_list('user_id', 'id', 'ip')[:batch_size]
+		)
+		if not leads:
+			return start_id, 0, 0
+
+		params = []
+		for user_id, lead_id, ip in leads:
+			params.extend([
+				user_id,
+				lead_id,
+				*(index.lookup(ip) or (None, None, None)),
+			])
+		with connection.cursor() as cursor:
+			cursor.execute(
+				ENRICH_BATCH.format(
+					values=', '.join([ENRICHED_ROW] * len(leads)),
+				),
+				params,
+			)
+			updated = cursor.rowcount
+	return leads[-1][1], len(leads), updated
+
+
+def backfill(index, batch_size, start_id=0, pause=0.0, progress=None):
+	"""
+	It enriches the leads with an ip, batch after batch. It can be run
+	again from any id.
+
+	:param index: the IPRangeIndex
+	:param batch_size: the number of leads read per transaction
+	:param start_id: the id after which the leads are enriched
+	:param pause: the seconds slept between batches
+	:param progress: a callable given the last id read, the number of
+		leads read and of leads updated so far after each batch
+	:return: the number of leads read and of leads updated
+	"""
+	last_id, read, updated = start_id, 0, 0
+	while True:
+		last_id, batch_read, batch_updated = enrich_batch(
+			index, last_id, batch_size,
+		)
+		if not batch_read:
+			return read, updated
+		read, updated = read + batch_read, updated + batch_updated
+		if progress is not None:
+			progress(last_id, read, updated)
+		if pause:
+			time.sleep(pause)
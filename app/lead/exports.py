@@ -0,0 +1,69 @@
+"""Streaming exports of leads"""
+
+import csv
+import json
+
+from django.conf import settings
+
+
+# The exported columns, same as the lead API schema.
+EXPORT_FIELDS = ('id', 'fname', 'lname', 'email', 'phone')
+
+
+class Echo:
+	"""A file-like object whose write returns the value instead of storing it"""
+
+	def write(self, value):
+		"""returns the written value so csv.writer can be used as a generator"""
+		return value
+
+
+def iter_rows(queryset):
+	"""
+	It yields the export columns of the queryset as tuples,
+	reading from a server-side cursor so only one chunk is in memory
+
+	:param queryset: the leads to export
+	"""
+	return queryset.values_list(*EXPORT_FIELDS).iterator(
+		chunk_size=settings.LEAD_EXPORT_CHUNK_SIZE,
+	)
+
+
+def _chunked(lines):
+	"""
+	It joins the lines into chunks of LEAD_EXPORT_CHUNK_SIZE lines,
+	so the response is not written one tiny row at a time
+	"""
+	chunk = []
+	for line in lines:
+		chunk.append(line)
+		if len(chunk) >= settings.LEAD_EXPORT_CHUNK_SIZE:
+			yield ''.join(chunk)
+			chunk = []
+	if chunk:
+		yield ''.join(chunk)
+
+
+def stream_csv(queryset):
+	"""It yields the leads of the queryset as CSV, header first"""
+	writer = csv.writer(Echo())
+	yield writer.writerow(EXPORT_FIELDS)
+	yield from _chunked(
+		writer.writerow(row) for row in iter_rows(queryset)
+	)
+
+
+def stream_ndjson(queryset):
+	"""It yields the leads of the queryset as newline delimited JSON"""
+	yield from _chunked(
+		json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+		for row in iter_rows(queryset)
+	)
+
+
+# output name -> (content type, file extension, stream generator)
+EXPORTERS = {
+	'csv':    ('text/csv', 'csv', stream_csv),
+	'ndjson': ('application/x-ndjson', 'ndjson', stream_ndjson),
+}
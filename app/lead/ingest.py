@@ -0,0 +1,149 @@
+"""
+The write-behind lead ingest.
+
+With LEAD_INGEST_ASYNC a created lead is validated, staged in the
+core_leadingest table and answered 202 with a receipt. The drain_leads
+workers insert the staged leads in batches and record the outcome of
+each receipt.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from core.models import Lead, LeadIngest
+from core.normalization import normalize_phone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# the seconds the number of pending leads is cached by a process.
+BACKLOG_TTL = 1.0
+
+_backlog = {'pending': 0, 'checked_at': None}
+_backlog_lock = threading.Lock()
+
+
+class IngestQueueFull(APIException):
+	"""The ingest queue holds LEAD_INGEST_MAX_PENDING leads, retry later"""
+	status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+	default_detail = _('Too many leads waiting to be ingested, retry later.')
+	default_code = 'ingest_queue_full'
+
+	def __init__(self, wait, detail=None, code=None):
+		"""
+		:param wait: the seconds after which the client should retry,
+			sent as Retry-After
+		"""
+		super().__init__(detail, code)
+		self.wait = wait
+
+
+def pending_count():
+	"""
+	It returns the number of pending leads, up to LEAD_INGEST_MAX_PENDING
+	plus one, counted at most every BACKLOG_TTL seconds per process
+	"""
+	now = time.monotonic()
+	with _backlog_lock:
+		checked_at = _backlog['checked_at']
+		if checked_at is not None and now - checked_at < BACKLOG_TTL:
+			return _backlog['pending']
+		# the count is bounded, it reads the partial pending index only.
+		_backlog['pending'] = LeadIngest.objects.filter(
+			status=LeadIngest.Status.PENDING,
+		)[:settings.LEAD_INGEST_MAX_PENDING + 1].count()
+		_backlog['checked_at'] = now
+		return _backlog['pending']
+
+
+def enqueue(user, validated_data):
+	"""
+	It stages a validated lead of the user
+
+	:raise IngestQueueFull: when LEAD_INGEST_MAX_PENDING leads are pending
+	:return: the LeadIngest receipt
+	"""
+	if pending_count() >= settings.LEAD_INGEST_MAX_PENDING:
+		raise IngestQueueFull(settings.LEAD_INGEST_RETRY_AFTER)
+
+	staged = LeadIngest.objects.create(
+		user=user,
+		fname=validated_data['fname'],
+		lname=validated_data['lname'],
+		email=validated_data['email'],
+		phone=normalize_phone(validated_data['phone']),
+		ip=validated_data.get('ip'),
+	)
+	with _backlog_lock:
+		_backlog['pending'] += 1
+	return staged
+
+
+def drain(batch_size):
+	"""
+	It inserts a batch of pending leads, oldest first. The batch is locked
+	with SKIP LOCKED so concurrent workers drain distinct batches, and the
+	leads are written, the receipts updated and the data versions bumped
+	in one transaction.
+
+	:param batch_size: the maximum number of leads inserted
+	:return: the number of drained leads, 0 when none is pending
+	"""
+	with transaction.atomic():
+		staged = list(
+			LeadIngest.objects
+			.filter(status=LeadIngest.Status.PENDING)
+			.select_related('user')
+			.select_for_update(skip_locked=True, of=('self',))
+			.order_by('id')[:batch_size]
+		)
+		if not staged:
+			return 0
+
+		leads = [
+			Lead(
+				user=item.user,
+				fname=item.fname,
+				lname=item.lname,
+				email=item.email,
+				phone=item.phone,
+				ip=item.ip,
+			)
+			for item in staged
+		]
+		Lead.objects.insert(leads, batch_size=len(leads))
+
+		processed_at = timezone.now()
+		users = {}
+		for item, lead in zip(staged, leads):
+			item.lead_id = lead.id
+			item.processed_at = processed_at
+			if lead.id is None:
+				item.status = LeadIngest.Status.DUPLICATE
+			else:
+				item.status = LeadIngest.Status.CREATED
+				users[item.user_id] = item.user
+		LeadIngest.objects.bulk_update(
+			staged, ['status', 'lead_id', 'processed_at'],
+		)
+		for user in users.values():
+			user.bump_data_version()
+
+	return len(staged)
+
+
+def purge(days):
+	"""
+	It deletes the receipts processed more than days ago
+
+	:return: the number of deleted receipts
+	"""
+	return LeadIngest.objects.exclude(
+		status=LeadIngest.Status.PENDING,
+	).filter(
+		processed_at__lt=timezone.now() - timedelta(days=days),
+	).delete()[0]
@@ -0,0 +1,45 @@
+"""a Django command that moves the old leads to the archive"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from lead.archive import archive
+
+
+class Command(BaseCommand):
+	"""a Django command that moves the old leads to the archive"""
+
+	help = (
+		'Move the leads older than LEAD_ARCHIVE_AFTER_DAYS days to the '
+		'archive table in small batches. It can be stopped and run again '
+		'at any time.'
+	)
+
+	def add_arguments(self, parser):
+		"""the age of the archived leads and the batches"""
+		parser.add_argument(
+			'--days', type=int, default=settings.LEAD_ARCHIVE_AFTER_DAYS,
+			help='the age in days over which leads are archived',
+		)
+		parser.add_argument(
+			'--batch-size', type=int,
+			default=settings.LEAD_ARCHIVE_BATCH_SIZE,
+			help='the leads archived per transaction',
+		)
+		parser.add_argument(
+			'--pause', type=float, default=0.0,
+			help='the seconds slept between batches',
+		)
+
+	def handle(self, *args, **options):
+		"""It archives the old leads, writing the progress"""
+		def progress(total):
+			if options['verbosity'] > 1:
+				self.stdout.write(f'Archived {total} leads')
+
+		total = archive(
+			options['days'],
+			options['batch_size'],
+			pause=options['pause'],
+			progress=progress,
+		)
+		self.stdout.write(self.style.SUCCESS(f'Archived {total} leads'))
@@ -0,0 +1,67 @@
+"""a Django command that measures the lead read serialization cost"""
+
+import time
+
+from core.models import Lead
+from django.core.management.base import BaseCommand, CommandError
+from lead.renderers import FastJSONRenderer
+from lead.serializers import LeadSerializer, LeadValuesSerializer
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BaseCommand):
+	"""a Django command that measures the lead read serialization cost"""
+
+	help = (
+		'Measure serializing and rendering a page of leads with '
+		'LeadSerializer and JSONRenderer against the values() fast path.'
+	)
+
+	def add_arguments(self, parser):
+		"""the page size and the number of rounds"""
+		parser.add_argument('--page-size', type=int, default=1000)
+		parser.add_argument('--rounds', type=int, default=20)
+
+	def handle(self, *args, **options):
+		"""
+		It builds the rows of a page as the database returns them and times,
+		per page, the current path (model instances, LeadSerializer,
+		JSONRenderer) against the fast path (values() dicts,
+		LeadValuesSerializer, FastJSONRenderer)
+		"""
+		fields = LeadSerializer.Meta.fields
+		rows = [
+			(i, 'John', 'Doe', f'lead{i}@example.com', '+972541096752')
+			for i in range(options['page_size'])
+		]
+
+		def current():
+			leads = [Lead.from_db('default', fields, row) for row in rows]
+			return JSONRenderer().render(
+				LeadSerializer(leads, many=True).data
+			)
+
+		def fast():
+			values = [dict(zip(fields, row)) for row in rows]
+			return FastJSONRenderer().render(
+				LeadValuesSerializer(values, many=True).data
+			)
+
+		if current() != fast():
+			raise CommandError('The fast path output differs')
+
+		before = self.measure(current, options['rounds'])
+		after = self.measure(fast, options['rounds'])
+		self.stdout.write(
+			f'page of {options["page_size"]} leads: '
+			f'LeadSerializer {before:.2f} ms, '
+			f'fast path {after:.2f} ms '
+			f'({before / after:.1f}x)'
+		)
+
+	def measure(self, path, rounds):
+		"""returns the mean ms of running the path"""
+		start = time.perf_counter()
+		for _ in range(rounds):
+			path()
+		return (time.perf_counter() - start) * 1000 / rounds
@@ -0,0 +1,38 @@
+"""a Django command that builds the ip range index of the lead enrichment"""
+
+from core import ipranges
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+	"""a Django command that builds the ip range index of the lead enrichment"""
+
+	help = (
+		'Build the memory-mapped ip range index read by the lead enrichment '
+		'from a CSV range file of start ip, end ip, country, region and '
+		'ASN. The running processes read the new index once restarted.'
+	)
+
+	def add_arguments(self, parser):
+		"""the range file and the index file"""
+		parser.add_argument('path', help='the CSV range file')
+		parser.add_argument(
+			'--output', default=settings.LEAD_IP_INDEX,
+			help='the index file, LEAD_IP_INDEX by default',
+		)
+
+	def handle(self, *args, **options):
+		"""It builds the index"""
+		if not options['output']:
+			raise CommandError('Set LEAD_IP_INDEX or use --output')
+		try:
+			with open(options['path'], newline='', encoding='utf-8') as file:
+				count = ipranges.build(
+					ipranges.read_ranges(file), options['output'],
+				)
+		except ValueError as error:
+			raise CommandError(f'Invalid range file: {error}')
+		self.stdout.write(self.style.SUCCESS(
+			f'Indexed {count} ranges in {options["output"]}'
+		))
@@ -0,0 +1,108 @@
+"""a Django command that inserts the leads staged by the async ingest"""
+
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from lead.ingest import drain, purge
+
+
+logger = logging.getLogger(__name__)
+
+# the seconds between two purges of the processed receipts.
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+	"""a Django command that inserts the leads staged by the async ingest"""
+
+	help = (
+		'Drain the async lead ingest queue: worker threads insert the '
+		'pending leads in batches until stopped by SIGTERM or SIGINT.'
+	)
+
+	def add_arguments(self, parser):
+		"""the workers, the batch size and the polling interval"""
+		parser.add_argument(
+			'--workers', type=int, default=settings.LEAD_INGEST_WORKERS,
+		)
+		parser.add_argument(
+			'--batch-size', type=int, default=settings.LEAD_INGEST_BATCH_SIZE,
+		)
+		parser.add_argument(
+			'--poll-interval', type=float, default=1.0,
+			help='the seconds an idle worker waits before polling again',
+		)
+		parser.add_argument(
+			'--once', action='store_true',
+			help='exit once the queue is empty',
+		)
+
+	def handle(self, *args, **options):
+		"""
+		It runs the workers, each one with its own database connection,
+		and purges the old receipts every PURGE_INTERVAL seconds
+		"""
+		self.verbosity = options['verbosity']
+		self.stopping = threading.Event()
+		self.lock = threading.Lock()
+		self.drained = 0
+		if threading.current_thread() is threading.main_thread():
+			for signum in (signal.SIGTERM, signal.SIGINT):
+				signal.signal(signum, lambda *args: self.stopping.set())
+
+		workers = [
+			threading.Thread(
+				target=self.work,
+				args=(
+					options['batch_size'],
+					options['poll_interval'],
+					options['once'],
+				),
+				name=f'drain-{index}',
+			)
+			for index in range(options['workers'])
+		]
+		for worker in workers:
+			worker.start()
+
+		purged_at = None
+		while any(worker.is_alive() for worker in workers):
+			if purged_at is None or \
+				time.monotonic() - purged_at >= PURGE_INTERVAL:
+				purged = purge(settings.LEAD_INGEST_RETENTION_DAYS)
+				purged_at = time.monotonic()
+				if purged and self.verbosity >= 2:
+					self.stdout.write(f'Purged {purged} receipts')
+			self.stopping.wait(options['poll_interval'])
+		connections.close_all()
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Drained {self.drained} leads'
+		))
+
+	def work(self, batch_size, poll_interval, once):
+		"""It drains batches until stopped, waiting while the queue is empty"""
+		try:
+			while not self.stopping.is_set():
+				try:
+					count = drain(batch_size)
+				except DatabaseError:
+					# the batch is rolled back and stays pending.
+					logger.exception('draining the lead ingest failed')
+					connections.close_all()
+					self.stopping.wait(poll_interval)
+					continue
+				if count:
+					with self.lock:
+						self.drained += count
+					continue
+				if once:
+					return
+				self.stopping.wait(poll_interval)
+		finally:
+			connections.close_all()
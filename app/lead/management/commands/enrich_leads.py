@@ -0,0 +1,55 @@
+"""a Django command that enriches the ip of the existing leads"""
+
+from core import ipranges
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from lead.enrichment import backfill
+
+
+class Command(BaseCommand):
+	"""a Django command that enriches the ip of the existing leads"""
+
+	help = (
+		'Set the country, region and ASN of the leads with an ip from the '
+		'LEAD_IP_INDEX index, in small batches. It can be stopped and run '
+		'again from the last id written.'
+	)
+
+	def add_arguments(self, parser):
+		"""the batches and where to start"""
+		parser.add_argument(
+			'--batch-size', type=int,
+			default=settings.LEAD_ENRICH_BATCH_SIZE,
+			help='the leads read per transaction',
+		)
+		parser.add_argument(
+			'--start-id', type=int, default=0,
+			help='the id after which leads are enriched, to resume',
+		)
+		parser.add_argument(
+			'--pause', type=float, default=0.0,
+			help='the seconds slept between batches',
+		)
+
+	def handle(self, *args, **options):
+		"""It enriches the leads, writing the progress"""
+		index = ipranges.get_index()
+		if index is None:
+			raise CommandError('Set LEAD_IP_INDEX to enrich the leads')
+
+		def progress(last_id, read, updated):
+			if options['verbosity'] > 1:
+				self.stdout.write(
+					f'Enriched {updated} of {read} leads up to id {last_id}'
+				)
+
+		read, updated = backfill(
+			index,
+			options['batch_size'],
+			start_id=options['start_id'],
+			pause=options['pause'],
+			progress=progress,
+		)
+		self.stdout.write(self.style.SUCCESS(
+			f'Enriched {updated} of {read} leads'
+		))
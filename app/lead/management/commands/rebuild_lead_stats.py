@@ -0,0 +1,48 @@
+"""a Django command that recomputes the lead counters"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from lead.stats import rebuild
+
+
+class Command(BaseCommand):
+	"""a Django command that recomputes the lead counters"""
+
+	help = (
+		'Recompute the lead counters and daily rollups of the users '
+		'from their leads, by chunks of users.'
+	)
+
+	def add_arguments(self, parser):
+		"""the users and the number of users per transaction"""
+		parser.add_argument(
+			'--user', action='append', dest='emails', default=[],
+			help='the email of a user to rebuild, all the users by default',
+		)
+		parser.add_argument(
+			'--chunk-size', type=int, default=100,
+			help='the users rebuilt per transaction, the writes of their '
+			'leads wait for it',
+		)
+
+	def handle(self, *args, **options):
+		"""It rebuilds the counters of the users, chunk by chunk"""
+		users = get_user_model().objects.order_by('id')
+		if options['emails']:
+			users = users.filter(email__in=options['emails'])
+			missing = set(options['emails']) - set(
+				users.values_list('email', flat=True)
+			)
+			if missing:
+				raise CommandError(
+					f'Unknown users: {", ".join(sorted(missing))}'
+				)
+
+		user_ids = list(users.values_list('id', flat=True))
+		chunk_size = options['chunk_size']
+		for start in range(0, len(user_ids), chunk_size):
+			rebuild(user_ids[start:start + chunk_size])
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Rebuilt the lead counters of {len(user_ids)} users'
+		))
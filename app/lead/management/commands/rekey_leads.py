@@ -0,0 +1,34 @@
+"""a Django command that rebuilds the dedupe keys of the leads"""
+
+from django.core.management.base import BaseCommand
+from lead.dedupe import pending_users, rekey
+
+
+class Command(BaseCommand):
+	"""a Django command that rebuilds the dedupe keys of the leads"""
+
+	help = (
+		'Rebuild the dedupe keys of the leads of the users whose lead '
+		'dedupe mode changed, in small batches. Run it after changing a '
+		'mode, an interrupted rebuild is resumed by the next run.'
+	)
+
+	def add_arguments(self, parser):
+		"""the batch size"""
+		parser.add_argument(
+			'--batch-size', type=int, default=1000,
+			help='the leads rekeyed per transaction',
+		)
+
+	def handle(self, *args, **options):
+		"""It rekeys the leads of the pending users"""
+		users = 0
+		for user in list(pending_users()):
+			read = rekey(user, options['batch_size'])
+			users += 1
+			if options['verbosity'] > 1:
+				self.stdout.write(f'Rekeyed {read} leads of {user.email}')
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Rekeyed the leads of {users} users'
+		))
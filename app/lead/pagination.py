@@ -0,0 +1,69 @@
+"""Pagination classes for the lead API"""
+
+from django.conf import settings
+from rest_framework.pagination import (
+	CursorPagination,
+	LimitOffsetPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class LeadCursorPagination(CursorPagination):
+	"""
+	Keyset pagination over the leads of a user.
+
+	Pages are addressed by an opaque cursor encoding the last seen id,
+	so every page is an index range scan on (user_id, id) instead of an
+	OFFSET scan, and rows inserted while paging never shift the pages.
+	"""
+	ordering = '-id'
+	page_size = settings.LEAD_PAGE_SIZE
+	page_size_query_param = 'page_size'
+	max_page_size = settings.LEAD_MAX_PAGE_SIZE
+
+
+class LeadSearchPagination(LimitOffsetPagination):
+	"""
+	Offset pagination over the ranked results of a lead search.
+
+	The results are ordered by rank, so a keyset doesn't apply, but the
+	search is bounded by LEAD_SEARCH_MAX_CANDIDATES so the offsets stay
+	small. No COUNT is run, a page is read with one more row to tell
+	whether there is a next page.
+	"""
+	default_limit = settings.LEAD_PAGE_SIZE
+	limit_query_param = 'page_size'
+	max_limit = settings.LEAD_MAX_PAGE_SIZE
+
+	def paginate_queryset(self, queryset, request, view=None):
+		"""returns the leads of the page, reading one more row"""
+		self.request = request
+		self.limit = self.get_limit(request)
+		self.offset = self.get_offset(request)
+		results = list(queryset[self.offset:self.offset + self.limit + 1])
+		self.has_next = len(results) > self.limit
+		return results[:self.limit]
+
+	def get_paginated_response(self, data):
+		"""the page, with the links to the next and previous pages"""
+		return Response({
+			'next':     self.get_next_link(),
+			'previous': self.get_previous_link(),
+			'results':  data,
+		})
+
+	def get_paginated_response_schema(self, schema):
+		schema = super().get_paginated_response_schema(schema)
+		del schema['properties']['count']
+		return schema
+
+	def get_next_link(self):
+		"""returns the link to the next page, None on the last page"""
+		if not self.has_next:
+			return None
+		url = self.request.build_absolute_uri()
+		url = replace_query_param(url, self.limit_query_param, self.limit)
+		return replace_query_param(
+			url, self.offset_query_param, self.offset + self.limit
+		)
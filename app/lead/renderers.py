@@ -0,0 +1,40 @@
+"""Renderers for the lead API"""
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+	"""
+	A JSONRenderer encoding with orjson.
+
+	The output is byte for byte the JSONRenderer one for compact unicode
+	JSON, the default settings. Indented output, other settings and values
+	orjson can't encode are rendered by JSONRenderer.
+	"""
+	options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+	def render(self, data, accepted_media_type=None, renderer_context=None):
+		"""Render `data` into JSON with orjson, returning a bytestring"""
+		if data is None:
+			return b''
+
+		indent = self.get_indent(accepted_media_type, renderer_context or {})
+		if indent is not None or self.ensure_ascii or not self.compact:
+			return super().render(data, accepted_media_type, renderer_context)
+
+		try:
+			ret = orjson.dumps(
+				data,
+				default=self.encoder_class().default,
+				option=self.options,
+			)
+		except orjson.JSONEncodeError:
+			return super().render(data, accepted_media_type, renderer_context)
+
+		# escaping the U+2028 and U+2029 line separators like JSONRenderer.
+		return ret.replace(
+			b'\xe2\x80\xa8', b'\\u2028'
+		).replace(
+			b'\xe2\x80\xa9', b'\\u2029'
+		)
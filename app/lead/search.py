@@ -0,0 +1,62 @@
+"""The lead search"""
+
+import re
+
+from core.normalization import normalize_phone
+from core.search import (
+	SEARCH_CONFIG,
+	search_document,
+	search_vector,
+	trigram_available,
+)
+from django.contrib.postgres.search import (
+	SearchQuery,
+	SearchRank,
+	TrigramWordSimilarity,
+)
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+PHONE_PATTERN = re.compile(r'\+?[\d\s().-]{6,}')
+
+
+def search_terms(value):
+	"""
+	It returns the searched text with its spaces collapsed,
+	a phone number is normalized to E.164 like the stored ones
+
+	:param value: the search input
+	"""
+	value = ' '.join(value.split())
+	if PHONE_PATTERN.fullmatch(value):
+		try:
+			return normalize_phone(value)
+		except ValidationError:
+			return re.sub(r'[^\d+]', '', value)
+	return value
+
+
+def search_leads(queryset, terms, max_candidates):
+	"""
+	It matches the leads of the queryset by full text and, when pg_trgm is
+	installed, by trigram word similarity, both served by GIN indexes
+
+	:param queryset: the leads searched, of a single user
+	:param terms: the searched text, see search_terms
+	:param max_candidates: the number of most recent matches ranked
+	:return: the ids of the matching leads, as a subquery,
+		and the rank expression of a lead
+	"""
+	query = SearchQuery(terms, config=SEARCH_CONFIG, search_type='websearch')
+	match = Q(search_vector=query)
+	rank = SearchRank(search_vector(), query)
+	queryset = queryset.alias(search_vector=search_vector())
+
+	if trigram_available(queryset.db):
+		queryset = queryset.alias(search_document=search_document())
+		match |= Q(search_document__trigram_word_similar=terms)
+		rank = rank + TrigramWordSimilarity(terms, search_document())
+
+	candidates = queryset.filter(match).order_by('-id').values('id')
+	return candidates[:max_candidates], rank
@@ -1,6 +1,24 @@
 """Serializers for the lead API"""
-from core.models import (Lead, )
-from rest_framework import serializers
+from datetime import timedelta
+
+from core.models import (ArchivedLead, Lead, LeadIngest)
+from core.normalization import normalize_phone, to_phone_number
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+
+# the inserts of a lead whose duplicate is deleted before it is read.
+CREATE_ATTEMPTS = 3
+
+
+class LeadConflict(APIException):
+	"""The duplicate of the lead is created and deleted concurrently"""
+	status_code = status.HTTP_409_CONFLICT
+	default_detail = _('The lead is being changed concurrently, retry later.')
+	default_code = 'lead_conflict'
 
 
 class LeadSerializer(serializers.ModelSerializer):
@@ -16,3 +34,151 @@ class LeadSerializer(serializers.ModelSerializer):
 		model = Lead
 		fields = ['id', 'fname', 'lname', 'email', 'phone']
 		read_only_fields = ('__all__',)
+
+	def create(self, validated_data):
+		"""
+		Create the lead with INSERT ... ON CONFLICT,
+		returning the existing lead when it is a duplicate, then
+		self.duplicate is True
+		"""
+		lead = Lead(**validated_data)
+		for _attempt in range(CREATE_ATTEMPTS):
+			self.duplicate = not Lead.objects.insert([lead])
+			if not self.duplicate:
+				return lead
+			try:
+				return Lead.objects.get(
+					user=lead.user, dedupe_key=lead.dedupe_key,
+				)
+			except Lead.DoesNotExist:
+				# the existing lead was deleted meanwhile, inserted again.
+				continue
+		raise LeadConflict()
+
+
+class LeadFilterSerializer(serializers.Serializer):
+	"""The conditions on the leads of a bulk delete, all of them must match"""
+	email = serializers.EmailField(required=False)
+	phone = serializers.CharField(required=False)
+	created_after = serializers.DateTimeField(required=False)
+	created_before = serializers.DateTimeField(required=False)
+
+	def validate_phone(self, value):
+		"""the phone numbers are stored in E.164"""
+		return normalize_phone(value)
+
+	def validate(self, attrs):
+		"""at least one condition, an empty filter would match every lead"""
+		if not attrs:
+			raise serializers.ValidationError(
+				_('Expected at least one condition.')
+			)
+		return attrs
+
+
+class LeadBulkDeleteSerializer(serializers.Serializer):
+	"""The leads of a bulk delete, by ids or by filter"""
+	ids = serializers.ListField(
+		child=serializers.IntegerField(min_value=1),
+		required=False,
+		allow_empty=False,
+		max_length=settings.LEAD_BULK_MAX_SIZE,
+	)
+	filter = LeadFilterSerializer(required=False)
+	deleted = serializers.IntegerField(read_only=True)
+
+	def validate(self, attrs):
+		"""either the ids or the filter"""
+		if ('ids' in attrs) == ('filter' in attrs):
+			raise serializers.ValidationError(
+				_('Expected either ids or filter.')
+			)
+		return attrs
+
+
+class LeadValuesSerializer(LeadSerializer):
+	"""
+	A read only LeadSerializer of the dicts of Lead.objects.values(),
+	for the list and retrieve fast path.
+
+	The dicts already hold the fields in the LeadSerializer order, so no
+	model instance nor field object is built per row. The phone number is
+	stored in its representation format unless PHONENUMBER_DEFAULT_FORMAT
+	differs from PHONENUMBER_DB_FORMAT, then it is formatted through the
+	phone number cache.
+	"""
+
+	def to_representation(self, instance):
+		"""returns the values dict of the lead as is"""
+		if self.reformat_phone():
+			instance['phone'] = str(to_phone_number(instance['phone']))
+		return instance
+
+	@staticmethod
+	def reformat_phone():
+		"""tells if the stored phone numbers must be reformatted"""
+		db_format = getattr(settings, 'PHONENUMBER_DB_FORMAT', 'E164')
+		return db_format != getattr(
+			settings, 'PHONENUMBER_DEFAULT_FORMAT', 'E164'
+		)
+
+
+class LeadReceiptSerializer(serializers.ModelSerializer):
+	"""The receipt of a lead accepted by the async ingest"""
+
+	lead = serializers.IntegerField(source='lead_id', read_only=True)
+
+	class Meta:
+		"""the outcome of the staged lead, the lead id once created"""
+		model = LeadIngest
+		fields = ['receipt', 'status', 'lead', 'created_at', 'processed_at']
+		read_only_fields = fields
+
+
+class LeadStatsQuerySerializer(serializers.Serializer):
+	"""
+	The days of the lead stats, from since to until included,
+	the last LEAD_STATS_DAYS days by default
+	"""
+	since = serializers.DateField(required=False)
+	until = serializers.DateField(required=False)
+
+	def validate(self, attrs):
+		"""defaulting the days and bounding their number"""
+		until = attrs.get('until') or timezone.now().date()
+		since = attrs.get('since') or \
+			until - timedelta(days=settings.LEAD_STATS_DAYS - 1)
+		if since > until:
+			raise serializers.ValidationError(
+				_('since must not be after until.')
+			)
+		if (until - since).days >= settings.LEAD_STATS_MAX_DAYS:
+			raise serializers.ValidationError(
+				_('At most %(max)d days can be read.') %
+				{'max': settings.LEAD_STATS_MAX_DAYS}
+			)
+		return {'since': since, 'until': until}
+
+
+class LeadDayCountSerializer(serializers.Serializer):
+	"""The number of leads created on a day"""
+	day = serializers.DateField()
+	count = serializers.IntegerField()
+
+
+class LeadStatsSerializer(serializers.Serializer):
+	"""The number of leads of the user and per day"""
+	total = serializers.IntegerField()
+	days = LeadDayCountSerializer(many=True)
+
+
+class ArchivedLeadSerializer(serializers.ModelSerializer):
+	"""Serializer for the archived leads, read only"""
+
+	class Meta:
+		model = ArchivedLead
+		fields = (
+			'id', 'fname', 'lname', 'email', 'phone', 'ip',
+			'created_at', 'archived_at',
+		)
+		read_only_fields = fields
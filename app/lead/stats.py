@@ -0,0 +1,94 @@
+"""The lead counters of the users"""
+
+from datetime import timedelta
+
+from core.models import LeadDailyStats, LeadStats
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def get_stats(user, since, until):
+	"""
+	It returns the number of leads of the user and, for each day from
+	since to until included, the number of leads created that day
+
+	:return: a dict of the total and of the days, in order
+	"""
+	total = LeadStats.objects.filter(user=user).values_list(
+		'total', flat=True,
+	).first()
+	counts = dict(
+		LeadDailyStats.objects.filter(
+			user=user, day__range=(since, until),
+		).values_list('day', 'count')
+	)
+	return {
+		'total': total or 0,
+		'days':  [
+			{'day': day, 'count': counts.get(day, 0)}
+			for day in (
+				since + timedelta(days=offset)
+				for offset in range((until - since).days + 1)
+			)
+		],
+	}
+
+
+def rebuild(user_ids):
+	"""
+	It recomputes the counters of the users from their leads, archived
+	ones included. Only the
+	LeadStats rows of the users are locked meanwhile: the triggers of the
+	concurrent inserts and deletes of their leads update them first, so
+	they wait and apply on top of the recount, and the leads of the other
+	users are written as usual. The data version of the users is bumped,
+	the clients holding the former counters read the new ones.
+
+	:param user_ids: the ids of the users
+	"""
+	user_ids = sorted(user_ids)
+	with transaction.atomic(), connection.cursor() as cursor:
+		# the rows are created then locked in user_id order, as the
+		# triggers do, so they don't deadlock with them.
+		cursor.execute(
+			'INSERT INTO core_leadstats (user_id, total) '
+			'SELECT id, 0 FROM core_user WHERE id = ANY(%s) ORDER BY id '
+			'ON CONFLICT (user_id) DO NOTHING',
+			[user_ids],
+		)
+		cursor.execute(
+			'SELECT user_id FROM core_leadstats WHERE user_id = ANY(%s) '
+			'ORDER BY user_id FOR UPDATE',
+			[user_ids],
+		)
+		cursor.execute(
+			'UPDATE core_leadstats AS stats SET total = ('
+			'SELECT count(*) FROM core_lead WHERE user_id = stats.user_id'
+			') + ('
+			'SELECT count(*) FROM core_archivedlead '
+			'WHERE user_id = stats.user_id'
+			') WHERE stats.user_id = ANY(%s)',
+			[user_ids],
+		)
+		cursor.execute(
+			'DELETE FROM core_leaddailystats WHERE user_id = ANY(%s)',
+			[user_ids],
+		)
+		cursor.execute(
+			'INSERT INTO core_leaddailystats (user_id, day, count) '
+			"SELECT user_id, (created_at AT TIME ZONE 'UTC')::date AS day, "
+			'count(*) FROM ('
+			'SELECT user_id, created_at FROM core_lead '
+			'WHERE user_id = ANY(%s) AND created_at IS NOT NULL '
+			'UNION ALL '
+			'SELECT user_id, created_at FROM core_archivedlead '
+			'WHERE user_id = ANY(%s) AND created_at IS NOT NULL'
+			') AS leads GROUP BY user_id, day',
+			[user_ids, user_ids],
+		)
+		get_user_model().objects.filter(pk__in=user_ids).update(
+			data_version=F('data_version') + 1,
+			data_modified_at=timezone.now(),
+		)
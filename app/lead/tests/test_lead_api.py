@@ -2,17 +2,32 @@
 Test for Lead API
 """
 
+import csv
+import io
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
 from core.models import Lead
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from lead.pagination import LeadCursorPagination
 from lead.serializers import LeadSerializer
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
 
 # Creating url for the lead list view.
 LEAD_URL = reverse('lead:lead-list')
+# Creating url for the lead bulk create action.
+BULK_URL = reverse('lead:lead-bulk')
+# Creating url for the lead bulk delete action.
+BULK_DELETE_URL = reverse('lead:lead-bulk-delete')
+# Creating url for the lead export action.
+EXPORT_URL = reverse('lead:lead-export')
 
 
 def detail_url(lead_id):
@@ -93,7 +108,7 @@ class PrivateLeadAPITest(TestCase):
 		serializer = LeadSerializer(leads, many=True)
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
-		self.assertEqual(response.data, serializer.data)
+		self.assertEqual(response.data['results'], serializer.data)
 
 	def test_lead_list_limited_to_user(self):
 		"""Test that the lead is limited to its own user"""
@@ -108,7 +123,40 @@ class PrivateLeadAPITest(TestCase):
 		serializer = LeadSerializer(leads, many=True)
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
-		self.assertEqual(response.data, serializer.data)
+		self.assertEqual(response.data['results'], serializer.data)
+
+	def test_lead_list_cursor_pagination(self):
+		"""Test the lead list is paged with opaque cursors on -id"""
+		leads = [create_lead(user=self.user) for _ in range(5)]
+
+		response = self.client.get(LEAD_URL, {'page_size': 2})
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertIsNone(response.data['previous'])
+		self.assertEqual(
+			[lead['id'] for lead in response.data['results']],
+			[leads[4].id, leads[3].id],
+		)
+
+		# a lead created while paging must not shift the next page.
+		create_lead(user=self.user)
+		response = self.client.get(response.data['next'])
+
+		self.assertEqual(
+			[lead['id'] for lead in response.data['results']],
+			[leads[2].id, leads[1].id],
+		)
+		self.assertIsNotNone(response.data['previous'])
+
+	def test_lead_list_page_size_capped(self):
+		"""Test the requested page size is capped by the maximum"""
+		for _ in range(3):
+			create_lead(user=self.user)
+
+		with patch.object(LeadCursorPagination, 'max_page_size', 2):
+			response = self.client.get(LEAD_URL, {'page_size': 100})
+
+		self.assertEqual(len(response.data['results']), 2)
 
 	def test_get_lead_detail(self):
 		"""
@@ -165,3 +213,305 @@ class PrivateLeadAPITest(TestCase):
 		response = self.client.delete(url)
 		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 		self.assertTrue(Lead.objects.filter(id=lead.id).exists())
+
+	def test_bulk_create_leads(self):
+		"""Test creating many leads in a single request"""
+		payload = [
+			{
+				'fname': 'John',
+				'lname': 'Doe',
+				'email': f'lead{i}@example.com',
+				'phone': '+972541096752',
+			} for i in range(3)
+		]
+
+		response = self.client.post(BULK_URL, payload, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertEqual(response.data['created'], 3)
+		self.assertEqual(response.data['duplicates'], [])
+		self.assertEqual(response.data['errors'], [])
+		leads = Lead.objects.filter(user=self.user)
+		self.assertEqual(leads.count(), 3)
+		self.assertCountEqual(
+			response.data['ids'],
+			leads.values_list('id', flat=True),
+		)
+
+	def test_bulk_create_reports_item_errors(self):
+		"""Test invalid items are reported without failing the batch"""
+		payload = [
+			{
+				'fname': 'John',
+				'lname': 'Doe',
+				'email': 'leadtest@example.com',
+				'phone': '+972541096752',
+			},
+			{
+				'fname': 'Jane',
+				'lname': 'Doe',
+				'email': 'not-an-email',
+				'phone': '+972541096752',
+			},
+		]
+
+		response = self.client.post(BULK_URL, payload, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertEqual(response.data['created'], 1)
+		self.assertEqual(len(response.data['errors']), 1)
+		self.assertEqual(response.data['errors'][0]['index'], 1)
+		self.assertIn('email', response.data['errors'][0]['errors'])
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 1)
+
+	def test_bulk_create_rejects_non_list(self):
+		"""Test the bulk endpoint requires a list of leads"""
+		response = self.client.post(BULK_URL, {'fname': 'John'}, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertFalse(Lead.objects.exists())
+
+	def test_bulk_delete_leads_by_ids(self):
+		"""Test deleting leads by ids deletes the leads of the user only"""
+		leads = [
+			create_lead(self.user, email=f'lead{i}@example.com')
+			for i in range(3)
+		]
+		other = create_lead(create_user('other@example.com'))
+
+		response = self.client.post(
+			BULK_DELETE_URL,
+			{'ids': [leads[0].id, leads[1].id, other.id]},
+			format='json',
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data, {'deleted': 2})
+		self.assertEqual(
+			set(Lead.objects.values_list('id', flat=True)),
+			{leads[2].id, other.id},
+		)
+
+	@override_settings(LEAD_DELETE_BATCH_SIZE=2)
+	def test_bulk_delete_leads_by_filter_in_batches(self):
+		"""Test deleting leads by filter, over several batches"""
+		for i in range(5):
+			create_lead(self.user, email='same@example.com', fname=str(i))
+		kept = create_lead(self.user, email='kept@example.com')
+		version = self.user.data_version
+
+		response = self.client.post(
+			BULK_DELETE_URL,
+			{'filter': {'email': 'SAME@example.com'}},
+			format='json',
+		)
+
+		self.assertEqual(response.data, {'deleted': 5})
+		self.assertEqual(list(Lead.objects.all()), [kept])
+		self.assertGreater(self.user.data_version, version)
+
+	def test_bulk_delete_leads_by_phone_and_date(self):
+		"""Test the filter conditions must all match"""
+		old = create_lead(
+			self.user, phone='+972541096752',
+			created_at=timezone.now() - timedelta(days=10),
+		)
+		create_lead(self.user, phone='+972541096752', email='new@example.com')
+		create_lead(
+			self.user, phone='+972541096753', email='other@example.com',
+			created_at=timezone.now() - timedelta(days=10),
+		)
+
+		response = self.client.post(BULK_DELETE_URL, {'filter': {
+			'phone': '+972 54-109-6752',
+			'created_before': timezone.now() - timedelta(days=1),
+		}}, format='json')
+
+		self.assertEqual(response.data, {'deleted': 1})
+		self.assertFalse(Lead.objects.filter(id=old.id).exists())
+
+	def test_bulk_delete_invalid_payload_error(self):
+		"""Test a bulk delete needs either ids or a non-empty filter"""
+		for payload in (
+			{},
+			{'ids': []},
+			{'filter': {}},
+			{'ids': [1], 'filter': {'email': 'john@example.com'}},
+			{'filter': {'phone': '123'}},
+		):
+			response = self.client.post(
+				BULK_DELETE_URL, payload, format='json',
+			)
+
+			self.assertEqual(
+				response.status_code, status.HTTP_400_BAD_REQUEST, payload,
+			)
+
+	def test_export_leads_csv(self):
+		"""Test exporting the leads of the user as a CSV stream"""
+		other_user = create_user(email='other@example.com', password='pass123')
+		create_lead(user=other_user, email='other@example.com')
+		first = create_lead(user=self.user, email='first@example.com')
+		second = create_lead(user=self.user, email='second@example.com')
+
+		response = self.client.get(EXPORT_URL)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertTrue(response.streaming)
+		self.assertEqual(response['Content-Type'], 'text/csv')
+		content = b''.join(response.streaming_content).decode()
+		rows = list(csv.reader(io.StringIO(content)))
+		self.assertEqual(rows[0], ['id', 'fname', 'lname', 'email', 'phone'])
+		self.assertEqual(
+			[row[3] for row in rows[1:]],
+			[second.email, first.email],
+		)
+
+	def test_export_leads_ndjson(self):
+		"""Test exporting the leads of the user as a NDJSON stream"""
+		lead = create_lead(user=self.user)
+
+		response = self.client.get(EXPORT_URL, {'output': 'ndjson'})
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		content = b''.join(response.streaming_content).decode()
+		rows = [json.loads(line) for line in content.splitlines()]
+		self.assertEqual(rows, [LeadSerializer(lead).data])
+
+	def test_export_unknown_output_error(self):
+		"""Test an unknown export output is rejected"""
+		response = self.client.get(EXPORT_URL, {'output': 'pdf'})
+
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_create_duplicate_lead_returns_existing(self):
+		"""Test creating a duplicate lead returns the existing lead"""
+		self.user.lead_dedupe = 'email'
+		self.user.save()
+		lead = create_lead(user=self.user, email='leadtest@example.com')
+		payload = {
+			'fname': 'John',
+			'lname': 'Doe',
+			'email': 'LeadTest@example.com',
+			'phone': '+972541096752',
+		}
+
+		response = self.client.post(LEAD_URL, payload)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['id'], lead.id)
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 1)
+
+	def test_create_duplicate_deleted_concurrently(self):
+		"""Test a duplicate deleted before it is read is created again"""
+		self.user.lead_dedupe = 'email'
+		self.user.save()
+		lead = create_lead(user=self.user, email='leadtest@example.com')
+		payload = {
+			'fname': 'John',
+			'lname': 'Doe',
+			'email': 'leadtest@example.com',
+			'phone': '+972541096752',
+		}
+
+		def deleted(**kwargs):
+			lead.delete()
+			raise Lead.DoesNotExist
+
+		with patch.object(Lead.objects, 'get', side_effect=deleted):
+			response = self.client.post(LEAD_URL, payload)
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertNotEqual(response.data['id'], lead.id)
+		self.assertTrue(Lead.objects.filter(id=response.data['id']).exists())
+
+	def test_create_duplicate_conflict(self):
+		"""Test a duplicate deleted at every attempt is answered 409"""
+		payload = {
+			'fname': 'John',
+			'lname': 'Doe',
+			'email': 'leadtest@example.com',
+			'phone': '+972541096752',
+		}
+
+		with patch.object(Lead.objects, 'insert', return_value=[]), \
+			patch.object(Lead.objects, 'get', side_effect=Lead.DoesNotExist):
+			response = self.client.post(LEAD_URL, payload)
+
+		self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+	def test_bulk_create_reports_duplicates(self):
+		"""Test the bulk create skips and reports duplicated leads"""
+		self.user.lead_dedupe = 'phone'
+		self.user.save()
+		create_lead(user=self.user, phone='+972541096752')
+		payload = [
+			{
+				'fname': 'John',
+				'lname': 'Doe',
+				'email': 'leadtest@example.com',
+				'phone': phone,
+			} for phone in ['+972541096752', '+972541096753', '+972541096753']
+		]
+
+		response = self.client.post(BULK_URL, payload, format='json')
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertEqual(response.data['created'], 1)
+		self.assertEqual(response.data['duplicates'], [0, 2])
+		self.assertEqual(Lead.objects.filter(user=self.user).count(), 2)
+
+	def test_lead_list_not_modified(self):
+		"""Test an unchanged lead list is answered 304 without queries"""
+		create_lead(user=self.user)
+		response = self.client.get(LEAD_URL)
+		etag = response['ETag']
+
+		with self.assertNumQueries(0):
+			response = self.client.get(LEAD_URL, HTTP_IF_NONE_MATCH=etag)
+
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+		self.assertEqual(response['ETag'], etag)
+
+	def test_lead_list_modified_after_create_and_delete(self):
+		"""Test creating or deleting a lead changes the lead list ETag"""
+		lead = create_lead(user=self.user)
+		etag = self.client.get(LEAD_URL)['ETag']
+
+		self.client.post(BULK_URL, [{
+			'fname': 'John',
+			'lname': 'Doe',
+			'email': 'leadtest@example.com',
+			'phone': '+972541096752',
+		}], format='json')
+		response = self.client.get(LEAD_URL, HTTP_IF_NONE_MATCH=etag)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertNotEqual(response['ETag'], etag)
+		self.assertIn('Last-Modified', response)
+
+		etag = response['ETag']
+		self.client.delete(detail_url(lead.id))
+		response = self.client.get(LEAD_URL, HTTP_IF_NONE_MATCH=etag)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(len(response.data['results']), 1)
+
+	def test_lead_reads_byte_identical(self):
+		"""Test the fast read path renders exactly like LeadSerializer"""
+		lead = create_lead(user=self.user, fname='Jos\u00e9 \u2028 "Jr"')
+		create_lead(user=self.user, phone='+972541096752')
+		leads = Lead.objects.filter(user=self.user).order_by('-id')
+
+		response = self.client.get(LEAD_URL)
+		expected = JSONRenderer().render({
+			'next':     None,
+			'previous': None,
+			'results':  LeadSerializer(leads, many=True).data,
+		})
+		self.assertEqual(response.content, expected)
+
+		response = self.client.get(detail_url(lead.id))
+		expected = JSONRenderer().render(LeadSerializer(lead).data)
+		self.assertEqual(response.content, expected)
@@ -0,0 +1,194 @@
+"""
+Test the archival of the old leads
+"""
+from datetime import timedelta
+from io import StringIO
+
+from core.models import ArchivedLead, Lead, LeadDailyStats, LeadStats
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from lead.archive import archive
+from lead.stats import rebuild
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+ARCHIVED_URL = reverse('lead:archived-lead-list')
+
+
+def archived_url(lead_id):
+	"""returns the URL of an archived lead"""
+	return reverse('lead:archived-lead-detail', args=[lead_id])
+
+
+def create_lead(user, index, days_ago=0, **params):
+	"""It creates a lead of the user, created days ago"""
+	defaults = {
+		'fname': 'John',
+		'lname': 'Doe',
+		'email': f'lead{index}@example.com',
+		'phone': '+972541096752',
+		'created_at': timezone.now() - timedelta(days=days_ago),
+	}
+	defaults.update(params)
+	return Lead.objects.create(user=user, **defaults)
+
+
+class ArchiveLeadsTests(TestCase):
+	"""Test moving the old leads to the archive"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+
+	def test_archive_old_leads_in_batches(self):
+		"""test the old leads are moved, in batches, the recent ones kept"""
+		old = [create_lead(self.user, i, days_ago=400 + i) for i in range(5)]
+		recent = create_lead(self.user, 5, days_ago=10)
+		undated = create_lead(self.user, 6, created_at=None)
+		progress = []
+
+		archived = archive(365, batch_size=2, progress=progress.append)
+
+		self.assertEqual(archived, 5)
+		self.assertEqual(progress, [2, 4, 5])
+		self.assertEqual(
+			set(Lead.objects.values_list('id', flat=True)),
+			{recent.id, undated.id},
+		)
+		lead = ArchivedLead.objects.get(id=old[0].id)
+		self.assertEqual(lead.user, self.user)
+		self.assertEqual(lead.email, old[0].email)
+		self.assertEqual(lead.phone, '+972541096752')
+		self.assertEqual(lead.created_at, old[0].created_at)
+
+	def test_archive_bumps_data_version(self):
+		"""test the cached reads of the users are invalidated"""
+		create_lead(self.user, 0, days_ago=400)
+		version = self.user.data_version
+
+		archive(365, batch_size=10)
+
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, version + 1)
+
+	def test_archive_keeps_counters(self):
+		"""test the archived leads stay in the lead counters"""
+		old = create_lead(self.user, 0, days_ago=400)
+		create_lead(self.user, 1, days_ago=10)
+		day = old.created_at.date()
+
+		archive(365, batch_size=10)
+
+		self.assertEqual(LeadStats.objects.get(user=self.user).total, 2)
+		self.assertEqual(
+			LeadDailyStats.objects.get(user=self.user, day=day).count, 1,
+		)
+		Lead.objects.filter(user=self.user).delete()
+		self.assertEqual(LeadStats.objects.get(user=self.user).total, 1)
+
+		rebuild([self.user.id])
+
+		self.assertEqual(LeadStats.objects.get(user=self.user).total, 1)
+		self.assertEqual(
+			LeadDailyStats.objects.get(user=self.user, day=day).count, 1,
+		)
+
+	def test_archive_nothing(self):
+		"""test a run without old leads changes nothing"""
+		create_lead(self.user, 0, days_ago=10)
+		version = self.user.data_version
+
+		self.assertEqual(archive(365, batch_size=10), 0)
+
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, version)
+
+	def test_command(self):
+		"""test the command archives the leads older than --days"""
+		create_lead(self.user, 0, days_ago=40)
+		create_lead(self.user, 1, days_ago=20)
+		out = StringIO()
+
+		call_command('archive_leads', days=30, batch_size=1, stdout=out)
+
+		self.assertEqual(Lead.objects.count(), 1)
+		self.assertEqual(ArchivedLead.objects.count(), 1)
+		self.assertIn('Archived 1 leads', out.getvalue())
+
+
+class ArchivedLeadApiTests(TestCase):
+	"""Test reading the archived leads"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def test_auth_required(self):
+		"""test the archive requires authentication"""
+		response = APIClient().get(ARCHIVED_URL)
+
+		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+	def test_list_archived_leads(self):
+		"""test the archived leads of the user are listed, newest first"""
+		leads = [create_lead(self.user, i, days_ago=400) for i in range(2)]
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+		create_lead(other, 0, days_ago=400)
+		archive(365, batch_size=10)
+
+		response = self.client.get(ARCHIVED_URL)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(
+			[lead['id'] for lead in response.data['results']],
+			[leads[1].id, leads[0].id],
+		)
+		self.assertEqual(response.data['results'][0]['email'], leads[1].email)
+
+	def test_retrieve_archived_lead(self):
+		"""test an archived lead is read by its lead id"""
+		lead = create_lead(self.user, 0, days_ago=400)
+		archive(365, batch_size=10)
+
+		response = self.client.get(archived_url(lead.id))
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['fname'], 'John')
+		self.assertIn('archived_at', response.data)
+
+	def test_retrieve_other_user_archived_lead_error(self):
+		"""test the archived leads of another user are not found"""
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+		lead = create_lead(other, 0, days_ago=400)
+		archive(365, batch_size=10)
+
+		response = self.client.get(archived_url(lead.id))
+
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+	def test_lead_list_modified_after_archive(self):
+		"""test the lead list isn't answered 304 once leads are archived"""
+		create_lead(self.user, 0, days_ago=400)
+		etag = self.client.get(reverse('lead:lead-list'))['ETag']
+
+		archive(365, batch_size=10)
+		# the authenticated user is loaded by each request.
+		self.user.refresh_from_db()
+		response = self.client.get(
+			reverse('lead:lead-list'), HTTP_IF_NONE_MATCH=etag,
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['results'], [])
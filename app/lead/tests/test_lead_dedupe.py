@@ -0,0 +1,99 @@
+"""
+Test rebuilding the dedupe keys of the leads after a mode change
+"""
+from io import StringIO
+
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from lead.dedupe import pending_users, rekey
+
+
+def create_lead(user, email, phone='+972541096752'):
+	"""It creates a lead of the user"""
+	return Lead.objects.create(
+		user=user, fname='John', lname='Doe', email=email, phone=phone,
+	)
+
+
+class RekeyLeadsTests(TestCase):
+	"""Test the dedupe keys follow the dedupe mode of the user"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+
+	def change_mode(self, mode):
+		"""It changes the dedupe mode of the user"""
+		self.user.lead_dedupe = mode
+		self.user.save()
+
+	def test_mode_change_pending(self):
+		"""test a mode change is pending until the leads are rekeyed"""
+		self.assertNotIn(self.user, pending_users())
+
+		self.change_mode('email')
+
+		self.assertIn(self.user, pending_users())
+		rekey(self.user, batch_size=10)
+		self.assertNotIn(self.user, pending_users())
+
+	def test_rekey(self):
+		"""test the leads are keyed with the new mode, duplicates unkeyed"""
+		first = create_lead(self.user, 'lead@example.com')
+		duplicate = create_lead(self.user, 'LEAD@example.com')
+		other = create_lead(self.user, 'other@example.com', '+972541096753')
+		self.change_mode('email')
+		# created after the change, already keyed with the new mode.
+		create_lead(self.user, 'new@example.com')
+
+		read = rekey(self.user, batch_size=2)
+
+		self.assertEqual(read, 4)
+		keys = dict(Lead.objects.values_list('id', 'dedupe_key'))
+		self.assertEqual(keys[first.id], 'lead@example.com')
+		self.assertIsNone(keys[duplicate.id])
+		self.assertEqual(keys[other.id], 'other@example.com')
+		self.assertEqual(
+			Lead.objects.insert([Lead(
+				user=self.user, fname='John', lname='Doe',
+				email='lead@example.com', phone='+972541096752',
+			)]),
+			[],
+		)
+
+	def test_rekey_keeps_leads_created_meanwhile(self):
+		"""test a key taken by a lead created after the change stays"""
+		old = create_lead(self.user, 'lead@example.com')
+		self.change_mode('email')
+		new = create_lead(self.user, 'lead@example.com')
+
+		rekey(self.user, batch_size=10)
+
+		keys = dict(Lead.objects.values_list('id', 'dedupe_key'))
+		self.assertIsNone(keys[old.id])
+		self.assertEqual(keys[new.id], 'lead@example.com')
+
+	def test_mode_changed_during_rekey(self):
+		"""test a rekey with a former mode leaves the user pending"""
+		self.change_mode('email')
+		user = get_user_model().objects.get(pk=self.user.pk)
+		self.change_mode('phone')
+
+		rekey(user, batch_size=10)
+
+		self.assertIn(self.user, pending_users())
+
+	def test_command(self):
+		"""test the command rekeys the pending users"""
+		lead = create_lead(self.user, 'lead@example.com')
+		self.change_mode('phone')
+		out = StringIO()
+
+		call_command('rekey_leads', stdout=out)
+
+		lead.refresh_from_db()
+		self.assertEqual(lead.dedupe_key, '+972541096752')
+		self.assertIn('Rekeyed the leads of 1 users', out.getvalue())
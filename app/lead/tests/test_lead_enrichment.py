@@ -0,0 +1,153 @@
+"""
+Test the ip enrichment of the leads
+"""
+import io
+import os
+import tempfile
+from io import StringIO
+
+from core import ipranges
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from lead.enrichment import backfill
+
+
+RANGES = (
+	'1.0.0.0,1.0.0.255,AU,Queensland,13335\n'
+	'8.8.8.0,8.8.8.255,US,California,15169\n'
+)
+
+
+def create_lead(user, index, ip):
+	"""It creates a lead of the user with the ip, without enrichment"""
+	return Lead.objects.create(
+		user=user,
+		fname='John',
+		lname='Doe',
+		email=f'lead{index}@example.com',
+		phone='+972541096752',
+		ip=ip,
+	)
+
+
+class LeadEnrichmentTests(TestCase):
+	"""Test setting the country, region and ASN of the lead ips"""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'ip.idx')
+		self.ranges_path = os.path.join(directory.name, 'ranges.csv')
+		with open(self.ranges_path, 'w') as file:
+			file.write(RANGES)
+		ipranges.build(ipranges.read_ranges(io.StringIO(RANGES)), self.path)
+		self.addCleanup(ipranges._index.update, path=None, index=None)
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+
+	def test_enriched_on_insert(self):
+		"""test the inserted leads are enriched with LEAD_IP_INDEX"""
+		leads = [
+			Lead(
+				user=self.user,
+				fname='John',
+				lname='Doe',
+				email=f'lead{i}@example.com',
+				phone='+972541096752',
+				ip=ip,
+			)
+			for i, ip in enumerate(['8.8.8.8', '9.9.9.9', None])
+		]
+
+		with override_settings(LEAD_IP_INDEX=self.path):
+			Lead.objects.insert(leads)
+
+		self.assertEqual(
+			list(Lead.objects.order_by('id').values_list(
+				'ip_country', 'ip_region', 'ip_asn',
+			)),
+			[('US', 'California', 15169), (None, None, None), (None, None, None)],
+		)
+
+	def test_not_enriched_without_index(self):
+		"""test the leads aren't enriched without LEAD_IP_INDEX"""
+		lead = Lead(
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='lead@example.com',
+			phone='+972541096752',
+			ip='8.8.8.8',
+		)
+
+		Lead.objects.insert([lead])
+
+		self.assertIsNone(Lead.objects.get().ip_country)
+
+	def test_backfill(self):
+		"""test the existing leads are enriched, and rewritten when changed"""
+		leads = [
+			create_lead(self.user, i, ip)
+			for i, ip in enumerate(['8.8.8.8', '1.0.0.1', '9.9.9.9', None])
+		]
+		progress = []
+
+		read, updated = backfill(
+			ipranges.IPRangeIndex(self.path), 2,
+			progress=lambda *args: progress.append(args),
+		)
+
+		self.assertEqual((read, updated), (3, 2))
+		self.assertEqual(progress, [(leads[1].id, 2, 2), (leads[2].id, 3, 2)])
+		leads[0].refresh_from_db()
+		self.assertEqual(
+			(leads[0].ip_country, leads[0].ip_region, leads[0].ip_asn),
+			('US', 'California', 15169),
+		)
+		# a second run writes nothing.
+		self.assertEqual(backfill(ipranges.IPRangeIndex(self.path), 2), (3, 0))
+
+	def test_commands(self):
+		"""test building the index and enriching the leads by command"""
+		lead = create_lead(self.user, 0, '1.0.0.1')
+		path = self.path + '.new'
+		out = StringIO()
+
+		call_command('build_ip_index', self.ranges_path, output=path, stdout=out)
+		with override_settings(LEAD_IP_INDEX=path):
+			call_command('enrich_leads', batch_size=10, stdout=out)
+
+		self.assertIn('Indexed 2 ranges', out.getvalue())
+		self.assertIn('Enriched 1 of 1 leads', out.getvalue())
+		lead.refresh_from_db()
+		self.assertEqual(lead.ip_country, 'AU')
+
+	def test_enrich_without_index_error(self):
+		"""test enrich_leads fails without LEAD_IP_INDEX"""
+		with self.assertRaisesMessage(CommandError, 'LEAD_IP_INDEX'):
+			call_command('enrich_leads', stdout=StringIO())
+
+	def test_import_enriched(self):
+		"""test the imported leads are enriched"""
+		path = os.path.join(os.path.dirname(self.path), 'leads.csv')
+		with open(path, 'w') as file:
+			file.write(
+				'fname,lname,email,phone,ip\n'
+				'John,Doe,john@example.com,+972541096752,8.8.8.8\n'
+				'Jane,Doe,jane@example.com,+972541096753,\n'
+			)
+
+		with override_settings(LEAD_IP_INDEX=self.path):
+			call_command(
+				'import_leads', path, user=self.user.email, stdout=StringIO(),
+			)
+
+		self.assertEqual(
+			list(Lead.objects.order_by('id').values_list(
+				'ip_country', 'ip_region', 'ip_asn',
+			)),
+			[('US', 'California', 15169), (None, None, None)],
+		)
@@ -0,0 +1,233 @@
+"""
+Test the async lead ingest
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from core.models import Lead, LeadIngest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from lead.ingest import drain, purge
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+LEAD_URL = reverse('lead:lead-list')
+
+PAYLOAD = {
+	'fname': 'John',
+	'lname': 'Doe',
+	'email': 'john@example.com',
+	'phone': '+972 54-109-6752',
+}
+
+
+def receipt_url(receipt):
+	"""returns the URL of the status of a receipt"""
+	return reverse('lead:lead-receipt', args=[receipt])
+
+
+def stage(user, **params):
+	"""It stages a lead of the user"""
+	defaults = {
+		'fname': 'John',
+		'lname': 'Doe',
+		'email': 'john@example.com',
+		'phone': '+972541096752',
+	}
+	defaults.update(params)
+	return LeadIngest.objects.create(user=user, **defaults)
+
+
+@override_settings(LEAD_INGEST_ASYNC=True)
+@patch('lead.ingest.BACKLOG_TTL', 0)
+class AsyncLeadCreateTests(TestCase):
+	"""Test creating leads with the async ingest"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def test_create_accepted_with_receipt(self):
+		"""test the lead is staged and answered 202"""
+		response = self.client.post(LEAD_URL, PAYLOAD)
+
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		self.assertEqual(response.data['status'], 'pending')
+		self.assertIsNone(response.data['lead'])
+		self.assertTrue(
+			response['Location'].endswith(
+				receipt_url(response.data['receipt'])
+			)
+		)
+		self.assertFalse(Lead.objects.exists())
+		staged = LeadIngest.objects.get()
+		self.assertEqual(staged.user, self.user)
+		self.assertEqual(staged.phone, '+972541096752')
+
+	def test_create_invalid_rejected(self):
+		"""test an invalid lead is rejected before being staged"""
+		response = self.client.post(LEAD_URL, {**PAYLOAD, 'phone': '12'})
+
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertFalse(LeadIngest.objects.exists())
+
+	@override_settings(LEAD_INGEST_MAX_PENDING=1, LEAD_INGEST_RETRY_AFTER=7)
+	def test_create_backpressure(self):
+		"""test creates are answered 503 while the queue is full"""
+		self.client.post(LEAD_URL, PAYLOAD)
+
+		response = self.client.post(LEAD_URL, PAYLOAD)
+
+		self.assertEqual(
+			response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+		)
+		self.assertEqual(response['Retry-After'], '7')
+		self.assertEqual(LeadIngest.objects.count(), 1)
+
+		drain(10)
+		response = self.client.post(LEAD_URL, PAYLOAD)
+
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+	def test_receipt_status(self):
+		"""test the receipt tells the created lead once drained"""
+		receipt = self.client.post(LEAD_URL, PAYLOAD).data['receipt']
+
+		response = self.client.get(receipt_url(receipt))
+		self.assertEqual(response.data['status'], 'pending')
+
+		drain(10)
+		response = self.client.get(receipt_url(receipt))
+
+		lead = Lead.objects.get()
+		self.assertEqual(response.data['status'], 'created')
+		self.assertEqual(response.data['lead'], lead.id)
+		self.assertIsNotNone(response.data['processed_at'])
+		self.assertEqual(str(lead.phone), '+972541096752')
+
+	def test_receipt_of_other_user_not_found(self):
+		"""test the receipts of other users aren't found"""
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+		staged = stage(other)
+
+		response = self.client.get(receipt_url(staged.receipt))
+
+		self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DrainTests(TestCase):
+	"""Test draining the staged leads"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+
+	def test_drain_in_batches(self):
+		"""test the staged leads are inserted oldest first, by batch"""
+		staged = [
+			stage(self.user, email=f'lead{i}@example.com') for i in range(5)
+		]
+
+		self.assertEqual(drain(3), 3)
+		self.assertEqual(drain(3), 2)
+		self.assertEqual(drain(3), 0)
+
+		self.assertEqual(
+			list(Lead.objects.order_by('id').values_list('email', flat=True)),
+			[item.email for item in staged],
+		)
+		self.assertFalse(
+			LeadIngest.objects.filter(status=LeadIngest.Status.PENDING)
+			.exists()
+		)
+
+	def test_drain_duplicates(self):
+		"""test a lead duplicating an existing one is recorded as such"""
+		self.user.lead_dedupe = get_user_model().LeadDedupe.EMAIL
+		self.user.save()
+		first = stage(self.user)
+		second = stage(self.user, fname='Jane')
+
+		drain(10)
+
+		first.refresh_from_db()
+		second.refresh_from_db()
+		self.assertEqual(first.status, LeadIngest.Status.CREATED)
+		self.assertEqual(second.status, LeadIngest.Status.DUPLICATE)
+		self.assertIsNone(second.lead_id)
+		self.assertEqual(Lead.objects.count(), 1)
+
+	def test_drain_users_sharing_dedupe_key(self):
+		"""test the leads of a batch are told apart by user and key"""
+		User = get_user_model()
+		other = User.objects.create_user('other@example.com', 'Password')
+		for user in (self.user, other):
+			user.lead_dedupe = User.LeadDedupe.EMAIL
+			user.save()
+		Lead.objects.create(
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='john@example.com',
+			phone='+972541096752',
+		)
+		duplicate = stage(self.user)
+		created = stage(other)
+
+		drain(10)
+
+		duplicate.refresh_from_db()
+		created.refresh_from_db()
+		self.assertEqual(duplicate.status, LeadIngest.Status.DUPLICATE)
+		self.assertIsNone(duplicate.lead_id)
+		self.assertEqual(created.status, LeadIngest.Status.CREATED)
+		self.assertEqual(Lead.objects.get(id=created.lead_id).user, other)
+
+	def test_drain_bumps_data_version(self):
+		"""test the drained leads change the data version of the user"""
+		stage(self.user)
+
+		drain(10)
+
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, 1)
+
+	def test_purge(self):
+		"""test only the old processed receipts are purged"""
+		stage(self.user)
+		stage(self.user, email='other@example.com')
+		drain(1)
+
+		self.assertEqual(purge(days=1), 0)
+		self.assertEqual(purge(days=-1), 1)
+		self.assertEqual(LeadIngest.objects.count(), 1)
+
+
+class DrainLeadsCommandTest(TransactionTestCase):
+	"""Test the drain_leads command"""
+
+	def test_drain_leads_once(self):
+		"""test the workers drain the queue then exit"""
+		user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		for i in range(25):
+			stage(user, email=f'lead{i}@example.com')
+		out = StringIO()
+
+		call_command(
+			'drain_leads', workers=3, batch_size=4, once=True,
+			poll_interval=0.01, stdout=out,
+		)
+
+		self.assertIn('Drained 25 leads', out.getvalue())
+		self.assertEqual(Lead.objects.count(), 25)
@@ -0,0 +1,206 @@
+"""
+Test the query budgets of the lead API endpoints
+"""
+from datetime import date, timedelta
+
+from core.models import ArchivedLead, Lead, LeadIngest
+from core.testing import QueryBudgetMixin
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from lead import urls
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+LEADS = 25
+
+
+class LeadQueryBudgetTests(QueryBudgetMixin, TestCase):
+	"""Test the lead endpoints stay within their query budget"""
+
+	urls = urls
+	# with LEADS leads, the token authentication included.
+	budgets = {
+		'lead:api-root':    {'get': 0},
+		'lead:lead-list':   {'get': 2, 'post': 3},
+		'lead:lead-detail': {'get': 2, 'delete': 4},
+		'lead:lead-bulk':   {'post': 3},
+		'lead:lead-bulk-delete': {'post': 5},
+		'lead:lead-export': {'get': 2},
+		'lead:lead-search': {'get': 3},
+		'lead:lead-receipt': {'get': 2},
+		'lead:lead-stats':  {'get': 3},
+		'lead:archived-lead-list':   {'get': 2},
+		'lead:archived-lead-detail': {'get': 2},
+	}
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		token = Token.objects.create(user=self.user)
+		self.client = APIClient()
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+		self.leads = Lead.objects.insert([
+			Lead(
+				user=self.user,
+				fname='John',
+				lname='Doe',
+				email=f'lead{i}@example.com',
+				phone='+972541096752',
+			)
+			for i in range(LEADS)
+		])
+
+	def test_api_root(self):
+		"""test the API root runs no query"""
+		self.assertQueryBudget('lead:api-root', 'get')
+
+	def test_list(self):
+		"""test the list queries don't grow with the leads"""
+		response = self.assertQueryBudget('lead:lead-list', 'get')
+
+		self.assertEqual(len(response.data['results']), LEADS)
+
+	def test_create(self):
+		"""test creating a lead"""
+		response = self.assertQueryBudget('lead:lead-list', 'post', data={
+			'fname': 'Jane',
+			'lname': 'Doe',
+			'email': 'jane@example.com',
+			'phone': '+972541096753',
+		})
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+	@override_settings(LEAD_INGEST_ASYNC=True)
+	def test_create_async(self):
+		"""test staging a lead"""
+		response = self.assertQueryBudget('lead:lead-list', 'post', data={
+			'fname': 'Jane',
+			'lname': 'Doe',
+			'email': 'jane@example.com',
+			'phone': '+972541096753',
+		})
+
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+	def test_receipt(self):
+		"""test reading the status of a receipt"""
+		staged = LeadIngest.objects.create(
+			user=self.user,
+			fname='Jane',
+			lname='Doe',
+			email='jane@example.com',
+			phone='+972541096753',
+		)
+
+		response = self.assertQueryBudget(
+			'lead:lead-receipt', 'get', args=[staged.receipt],
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_retrieve(self):
+		"""test retrieving a lead"""
+		response = self.assertQueryBudget(
+			'lead:lead-detail', 'get', args=[self.leads[0].id],
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_destroy(self):
+		"""test deleting a lead"""
+		response = self.assertQueryBudget(
+			'lead:lead-detail', 'delete', args=[self.leads[0].id],
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+	def test_bulk_create(self):
+		"""test the bulk create queries don't grow with the leads"""
+		payload = [
+			{
+				'fname': 'Jane',
+				'lname': 'Doe',
+				'email': f'bulk{i}@example.com',
+				'phone': '+972541096753',
+			}
+			for i in range(LEADS)
+		]
+
+		response = self.assertQueryBudget(
+			'lead:lead-bulk', 'post', data=payload, format='json',
+		)
+
+		self.assertEqual(response.data['created'], LEADS)
+
+	def test_bulk_delete(self):
+		"""test the bulk delete queries don't grow with the leads"""
+		response = self.assertQueryBudget(
+			'lead:lead-bulk-delete', 'post',
+			data={'filter': {'phone': '+972541096752'}}, format='json',
+		)
+
+		self.assertEqual(response.data, {'deleted': LEADS})
+
+	def test_search(self):
+		"""test the search queries don't grow with the matches"""
+		response = self.assertQueryBudget(
+			'lead:lead-search', 'get', data={'q': 'john'},
+		)
+
+		self.assertEqual(len(response.data['results']), LEADS)
+
+	def test_stats(self):
+		"""test the stats queries don't grow with the leads nor the days"""
+		response = self.assertQueryBudget(
+			'lead:lead-stats', 'get', data={
+				'since': date.today() - timedelta(days=365),
+				'until': date.today(),
+			},
+		)
+
+		self.assertEqual(response.data['total'], LEADS)
+
+	def test_archived_list(self):
+		"""test the archive list queries don't grow with the leads"""
+		ArchivedLead.objects.bulk_create([
+			ArchivedLead(
+				id=lead.id,
+				user=self.user,
+				fname=lead.fname,
+				lname=lead.lname,
+				email=lead.email,
+				phone=lead.phone,
+			)
+			for lead in self.leads
+		])
+
+		response = self.assertQueryBudget('lead:archived-lead-list', 'get')
+
+		self.assertEqual(len(response.data['results']), LEADS)
+
+	def test_archived_retrieve(self):
+		"""test retrieving an archived lead"""
+		archived = ArchivedLead.objects.create(
+			id=1,
+			user=self.user,
+			fname='John',
+			lname='Doe',
+			email='john@example.com',
+			phone='+972541096752',
+		)
+
+		response = self.assertQueryBudget(
+			'lead:archived-lead-detail', 'get', args=[archived.id],
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_export(self):
+		"""test the export queries don't grow with the leads"""
+		response = self.assertQueryBudget('lead:lead-export', 'get')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
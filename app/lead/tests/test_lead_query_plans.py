@@ -0,0 +1,90 @@
+"""
+Query plan regression tests for the lead API querysets
+"""
+
+from core.models import Lead
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from lead.views import LeadViewSet
+from rest_framework.test import APIRequestFactory
+
+
+INDEX_NAME = 'core_lead_user_id_idx'
+
+
+def create_user(email='user@example.com', password='Password'):
+	"""Create and return a new user"""
+	return get_user_model().objects.create_user(email, password)
+
+
+def get_view_queryset(user, action):
+	"""
+	It builds a LeadViewSet for the given user and action,
+	and returns the queryset the view would run
+	"""
+	request = APIRequestFactory().get('/')
+	request.user = user
+	return LeadViewSet(action=action, request=request).get_queryset()
+
+
+class LeadQueryPlanTests(TestCase):
+	"""
+	The lead querysets must be served by the (user_id, id DESC) index.
+
+	Sequential scans and sorts are disabled for the planner, so a plan that
+	still contains a sort or a sequential scan means no index fits the query,
+	whatever the table statistics left by other tests.
+	"""
+
+	def setUp(self):
+		"""creating a user with a few leads and disabling seq scans and sorts"""
+		self.user = create_user()
+		self.leads = [
+			Lead.objects.create(
+				user=self.user,
+				fname='John',
+				lname='Doe',
+				email='leadtest@example.com',
+				phone='+972541096752',
+			) for _ in range(3)
+		]
+		with connection.cursor() as cursor:
+			cursor.execute('SET LOCAL enable_seqscan = off')
+			cursor.execute('SET LOCAL enable_sort = off')
+
+	def assertIndexPlan(self, queryset):
+		"""asserting the plan of the queryset uses the lead index only"""
+		plan = queryset.explain()
+
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('Sort', plan)
+		self.assertIn(INDEX_NAME, plan)
+
+	def test_list_plan(self):
+		"""Test the first page of the lead list uses the index"""
+		queryset = get_view_queryset(self.user, 'list')
+
+		self.assertIndexPlan(queryset[:100])
+
+	def test_list_next_page_plan(self):
+		"""Test a cursor page of the lead list uses the index"""
+		queryset = get_view_queryset(self.user, 'list')
+
+		self.assertIndexPlan(queryset.filter(id__lt=self.leads[-1].id)[:100])
+
+	def test_retrieve_plan(self):
+		"""Test retrieving a lead does not scan the table"""
+		queryset = get_view_queryset(self.user, 'retrieve')
+		plan = queryset.filter(pk=self.leads[0].id).explain()
+
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('Sort', plan)
+
+	def test_destroy_plan(self):
+		"""Test the lookup of a lead to destroy does not scan the table"""
+		queryset = get_view_queryset(self.user, 'destroy')
+		plan = queryset.filter(pk=self.leads[0].id).explain()
+
+		self.assertNotIn('Seq Scan', plan)
+		self.assertNotIn('Sort', plan)
@@ -0,0 +1,178 @@
+"""
+Test the lead search
+"""
+from core.models import Lead
+from core.search import trigram_available
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from lead.search import search_leads, search_terms
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+SEARCH_URL = reverse('lead:lead-search')
+
+
+def create_lead(user, **params):
+	"""It creates a lead of the user"""
+	defaults = {
+		'fname': 'John',
+		'lname': 'Doe',
+		'email': 'john@example.com',
+		'phone': '+972541096752',
+	}
+	defaults.update(params)
+	return Lead.objects.create(user=user, **defaults)
+
+
+class SearchTermsTests(TestCase):
+	"""Test normalizing the search input"""
+
+	def test_search_terms(self):
+		"""test collapsing spaces and normalizing phone numbers"""
+		self.assertEqual(search_terms('  John   Doe '), 'John Doe')
+		self.assertEqual(search_terms('+972 54-109-6752'), '+972541096752')
+		self.assertEqual(search_terms('054-109'), '054109')
+
+
+class LeadSearchApiTests(TestCase):
+	"""Test the search action of the lead API"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def search(self, q, **params):
+		"""returns the response of a search"""
+		return self.client.get(SEARCH_URL, {'q': q, **params})
+
+	def test_search_requires_q(self):
+		"""test a search without text is rejected"""
+		response = self.client.get(SEARCH_URL, {'q': '  '})
+
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertIn('q', response.data)
+
+	def test_search_by_each_field(self):
+		"""test searching by name, email and phone number"""
+		lead = create_lead(
+			self.user, fname='Maya', lname='Cohen',
+			email='maya@example.com', phone='+972541234567',
+		)
+		create_lead(self.user)
+
+		for q in ('maya', 'Cohen', 'maya@example.com', '+972 54-123-4567'):
+			response = self.search(q)
+
+			self.assertEqual(response.status_code, status.HTTP_200_OK)
+			self.assertEqual(
+				[result['id'] for result in response.data['results']],
+				[lead.id],
+				q,
+			)
+
+	def test_search_ranked(self):
+		"""test the best match comes first"""
+		create_lead(self.user, fname='John', lname='Smith')
+		full = create_lead(
+			self.user, fname='John', lname='Doe', email='doe@example.com',
+		)
+
+		response = self.search('john doe')
+
+		ids = [result['id'] for result in response.data['results']]
+		self.assertEqual(ids[0], full.id)
+
+	def test_search_result_fields(self):
+		"""test the results are serialized like the lead list"""
+		lead = create_lead(self.user)
+
+		response = self.search('john')
+
+		self.assertEqual(response.data['results'], [{
+			'id': lead.id,
+			'fname': 'John',
+			'lname': 'Doe',
+			'email': 'john@example.com',
+			'phone': '+972541096752',
+		}])
+
+	def test_search_limited_to_user(self):
+		"""test the leads of other users aren't found"""
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+		create_lead(other)
+
+		response = self.search('john')
+
+		self.assertEqual(response.data['results'], [])
+
+	def test_search_paginated(self):
+		"""test the pages of a search don't overlap"""
+		leads = [
+			create_lead(self.user, email=f'john{i}@example.com')
+			for i in range(5)
+		]
+
+		first = self.search('john', page_size=3)
+		second = self.client.get(first.data['next'])
+
+		ids = [result['id'] for result in first.data['results']] + \
+			[result['id'] for result in second.data['results']]
+		self.assertEqual(sorted(ids), sorted(lead.id for lead in leads))
+		self.assertIsNone(second.data['next'])
+		self.assertIsNotNone(second.data['previous'])
+		self.assertNotIn('count', first.data)
+
+	@override_settings(LEAD_SEARCH_MAX_CANDIDATES=2)
+	def test_search_candidates_bounded(self):
+		"""test only the most recent matches are ranked"""
+		leads = [create_lead(self.user) for _ in range(3)]
+
+		response = self.search('john')
+
+		self.assertEqual(
+			sorted(result['id'] for result in response.data['results']),
+			sorted(lead.id for lead in leads[1:]),
+		)
+
+	def test_search_fuzzy(self):
+		"""test a misspelled name still matches by trigrams"""
+		if not trigram_available():
+			self.skipTest('pg_trgm is not installed')
+		lead = create_lead(self.user, fname='Jonathan')
+
+		response = self.search('jonatan')
+
+		self.assertIn(
+			lead.id, [result['id'] for result in response.data['results']],
+		)
+
+
+class LeadSearchQueryPlanTests(TestCase):
+	"""Test the search is served by the search indexes"""
+
+	def test_search_plan(self):
+		"""
+		test the full text match is the indexed expression,
+		searching all the leads so the user index can't serve it
+		"""
+		user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		create_lead(user)
+		with connection.cursor() as cursor:
+			cursor.execute('SET LOCAL enable_seqscan = off')
+			cursor.execute('SET LOCAL enable_indexscan = off')
+
+		candidates, _ = search_leads(Lead.objects.all(), 'john', 100)
+		plan = candidates.explain()
+
+		self.assertIn('core_lead_search_idx', plan)
+		self.assertNotIn('Seq Scan', plan)
@@ -0,0 +1,250 @@
+"""
+Test the lead counters and the lead stats endpoint
+"""
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+
+from core.models import Lead, LeadDailyStats, LeadStats
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from lead.stats import rebuild
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+STATS_URL = reverse('lead:lead-stats')
+
+
+def create_lead(user, index, **params):
+	"""It creates a lead of the user"""
+	defaults = {
+		'fname': 'John',
+		'lname': 'Doe',
+		'email': f'lead{index}@example.com',
+		'phone': '+972541096752',
+	}
+	defaults.update(params)
+	return Lead.objects.create(user=user, **defaults)
+
+
+def counters(user):
+	"""returns the total and the daily counts of the user"""
+	total = LeadStats.objects.filter(user=user).values_list(
+		'total', flat=True,
+	).first()
+	days = dict(
+		LeadDailyStats.objects.filter(user=user).values_list('day', 'count')
+	)
+	return total, days
+
+
+class LeadCountersTests(TestCase):
+	"""Test the counters follow the lead writes"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.day = datetime(2024, 3, 1, 23, 30, tzinfo=timezone.utc)
+
+	def test_create_and_delete(self):
+		"""test the counters are incremented and decremented"""
+		leads = [
+			create_lead(self.user, i, created_at=self.day) for i in range(3)
+		]
+		leads[0].delete()
+
+		self.assertEqual(counters(self.user), (2, {self.day.date(): 2}))
+
+	def test_insert_counts_created_leads_only(self):
+		"""test the duplicates skipped by insert aren't counted"""
+		self.user.lead_dedupe = get_user_model().LeadDedupe.EMAIL
+		self.user.save()
+		leads = [
+			Lead(
+				user=self.user, fname='John', lname='Doe',
+				email=f'lead{i % 2}@example.com', phone='+972541096752',
+			)
+			for i in range(4)
+		]
+		Lead.objects.insert(leads)
+
+		total, days = counters(self.user)
+		self.assertEqual(total, 2)
+		self.assertEqual(sum(days.values()), 2)
+
+	def test_import_counted(self):
+		"""test the leads copied by import_leads are counted"""
+		fd, path = tempfile.mkstemp(suffix='.csv')
+		with os.fdopen(fd, 'w') as file:
+			file.write(
+				'fname,lname,email,phone,ip\n'
+				'John,Doe,john@example.com,+972541096752,\n'
+				'Jane,Doe,jane@example.com,+972541096753,\n'
+			)
+		self.addCleanup(os.remove, path)
+
+		call_command(
+			'import_leads', path, user=self.user.email, stdout=StringIO(),
+		)
+
+		self.assertEqual(counters(self.user)[0], 2)
+
+	def test_days_are_utc(self):
+		"""test a lead is counted on its UTC day"""
+		create_lead(self.user, 0, created_at=self.day)
+		create_lead(self.user, 1, created_at=self.day + timedelta(hours=1))
+
+		self.assertEqual(counters(self.user)[1], {
+			date(2024, 3, 1): 1,
+			date(2024, 3, 2): 1,
+		})
+
+	def test_user_delete(self):
+		"""test deleting a user with leads deletes its counters"""
+		create_lead(self.user, 0)
+
+		self.user.delete()
+
+		self.assertFalse(LeadStats.objects.exists())
+		self.assertFalse(LeadDailyStats.objects.exists())
+
+	def test_rebuild_command(self):
+		"""test the counters are recomputed from the leads"""
+		create_lead(self.user, 0, created_at=self.day)
+		create_lead(self.user, 1, created_at=self.day)
+		LeadStats.objects.update(total=10)
+		LeadDailyStats.objects.all().delete()
+		out = StringIO()
+
+		call_command('rebuild_lead_stats', chunk_size=1, stdout=out)
+
+		self.assertEqual(counters(self.user), (2, {self.day.date(): 2}))
+		self.assertIn('Rebuilt the lead counters of 1 users', out.getvalue())
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, 1)
+
+	def test_rebuild_locks_counters_only(self):
+		"""test the rebuild locks the counters, not the lead table"""
+		create_lead(self.user, 0, created_at=self.day)
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+
+		with transaction.atomic():
+			rebuild([other.id, self.user.id])
+			with connection.cursor() as cursor:
+				cursor.execute(
+					'SELECT mode FROM pg_locks '
+					'WHERE pid = pg_backend_pid() '
+					"AND relation = 'core_lead'::regclass"
+				)
+				modes = {row[0] for row in cursor.fetchall()}
+
+		# the RowExclusiveLock of the test lead insert is held too.
+		self.assertNotIn('ShareLock', modes)
+		self.assertNotIn('ExclusiveLock', modes)
+		self.assertEqual(counters(self.user), (1, {self.day.date(): 1}))
+		self.assertEqual(counters(other), (0, {}))
+
+
+class LeadStatsApiTests(TestCase):
+	"""Test the lead stats endpoint"""
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			'user@example.com', 'Password',
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def test_auth_required(self):
+		"""test the stats require authentication"""
+		response = APIClient().get(STATS_URL)
+
+		self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+	def test_days_zero_filled(self):
+		"""test every day of the range is answered, in order"""
+		day = datetime(2024, 3, 2, 12, tzinfo=timezone.utc)
+		create_lead(self.user, 0, created_at=day)
+		create_lead(self.user, 1, created_at=day)
+		create_lead(self.user, 2, created_at=day - timedelta(days=10))
+		other = get_user_model().objects.create_user(
+			'other@example.com', 'Password',
+		)
+		create_lead(other, 0, created_at=day)
+
+		response = self.client.get(
+			STATS_URL, {'since': '2024-03-01', 'until': '2024-03-03'},
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.json(), {
+			'total': 3,
+			'days':  [
+				{'day': '2024-03-01', 'count': 0},
+				{'day': '2024-03-02', 'count': 2},
+				{'day': '2024-03-03', 'count': 0},
+			],
+		})
+
+	@override_settings(LEAD_STATS_DAYS=7)
+	def test_default_days(self):
+		"""test the last LEAD_STATS_DAYS days are answered by default"""
+		create_lead(self.user, 0)
+
+		response = self.client.get(STATS_URL)
+
+		days = response.json()['days']
+		self.assertEqual(len(days), 7)
+		self.assertEqual(days[-1]['count'], 1)
+
+	@override_settings(LEAD_STATS_MAX_DAYS=10)
+	def test_invalid_ranges(self):
+		"""test reversed and too long ranges are rejected"""
+		for params in (
+			{'since': '2024-03-02', 'until': '2024-03-01'},
+			{'since': '2024-03-01', 'until': '2024-03-11'},
+			{'since': 'yesterday'},
+		):
+			response = self.client.get(STATS_URL, params)
+
+			self.assertEqual(
+				response.status_code, status.HTTP_400_BAD_REQUEST, params,
+			)
+
+	def test_modified_by_rebuild(self):
+		"""test a rebuild of the counters ends the 304 answers"""
+		params = {'since': '2024-03-01', 'until': '2024-03-03'}
+		etag = self.client.get(STATS_URL, params)['ETag']
+
+		rebuild([self.user.id])
+		# as loaded by the authentication of the next request.
+		self.user.refresh_from_db()
+
+		response = self.client.get(STATS_URL, params, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_not_modified(self):
+		"""test a range is answered 304 until a lead is written"""
+		params = {'since': '2024-03-01', 'until': '2024-03-03'}
+		etag = self.client.get(STATS_URL, params)['ETag']
+
+		response = self.client.get(STATS_URL, params, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+		self.client.post(reverse('lead:lead-list'), {
+			'fname': 'John',
+			'lname': 'Doe',
+			'email': 'john@example.com',
+			'phone': '+972541096752',
+		})
+		response = self.client.get(STATS_URL, params, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['total'], 1)
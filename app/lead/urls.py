@@ -8,6 +8,9 @@ from rest_framework.routers import DefaultRouter
 router = DefaultRouter()
 
 router.register('lead', views.LeadViewSet)
+router.register(
+	'archived', views.ArchivedLeadViewSet, basename='archived-lead',
+)
 
 app_name = 'lead'
 
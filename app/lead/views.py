@@ -1,13 +1,31 @@
 """Views for the lead API"""
 
-from core.models import (Lead)
-from lead import serializers
-from rest_framework import (mixins, viewsets)
-from rest_framework.authentication import TokenAuthentication
+from core.authentication import TokenAuthentication
+from core.mixins import ConditionalGetMixin
+from core.models import (ArchivedLead, Lead, LeadIngest)
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.translation import gettext as _
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from lead import ingest, serializers
+from lead.deletion import delete_leads, filter_leads
+from lead.exports import EXPORTERS
+from lead.pagination import LeadCursorPagination, LeadSearchPagination
+from lead.renderers import FastJSONRenderer
+from lead.search import search_leads, search_terms
+from lead.stats import get_stats
+from rest_framework import (mixins, status, viewsets)
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
 
 class LeadViewSet(
+	ConditionalGetMixin,
 	mixins.CreateModelMixin,
 	mixins.ListModelMixin,
 	mixins.DestroyModelMixin,
@@ -19,11 +37,302 @@ class LeadViewSet(
 	queryset = Lead.objects.all()
 	authentication_classes = [TokenAuthentication]
 	permission_classes = [IsAuthenticated]
+	throttle_scope = 'lead'
+	pagination_class = LeadCursorPagination
+	renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+	# the actions reading leads as values() dicts instead of model instances.
+	values_actions = ('list', 'retrieve', 'search')
 
 	def get_queryset(self):
 		"""retrieving leads for the authenticated user"""
-		return self.queryset.filter(user=self.request.user).order_by('-id')
+		queryset = self.queryset.filter(user=self.request.user).order_by('-id')
+		if self.action in self.values_actions:
+			return queryset.values(*serializers.LeadSerializer.Meta.fields)
+		return queryset
+
+	def get_serializer_class(self):
+		"""the values serializer for the read actions"""
+		if self.action in self.values_actions:
+			return serializers.LeadValuesSerializer
+		if self.action == 'receipt':
+			return serializers.LeadReceiptSerializer
+		if self.action == 'stats':
+			return serializers.LeadStatsSerializer
+		if self.action == 'bulk_delete':
+			return serializers.LeadBulkDeleteSerializer
+		return self.serializer_class
+
+	@extend_schema(responses={
+		200: serializers.LeadSerializer,
+		201: serializers.LeadSerializer,
+		202: serializers.LeadReceiptSerializer,
+	})
+	def create(self, request, *args, **kwargs):
+		"""
+		Create a lead.
+
+		A duplicate of an existing lead of the user, see lead_dedupe, is
+		skipped and answered 200 with the existing lead, 409 when it is
+		deleted and created again concurrently at every attempt. With
+		LEAD_INGEST_ASYNC the valid lead is staged and answered 202 with a
+		receipt, whose status tells when it is created. Creates are
+		answered 503 with Retry-After while the ingest queue is full.
+		"""
+		serializer = self.get_serializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		if not settings.LEAD_INGEST_ASYNC:
+			self.perform_create(serializer)
+			if serializer.duplicate:
+				return Response(serializer.data, status=status.HTTP_200_OK)
+			return Response(
+				serializer.data,
+				status=status.HTTP_201_CREATED,
+				headers=self.get_success_headers(serializer.data),
+			)
+
+		staged = ingest.enqueue(request.user, serializer.validated_data)
+		return Response(
+			serializers.LeadReceiptSerializer(staged).data,
+			status=status.HTTP_202_ACCEPTED,
+			headers={'Location': reverse(
+				'lead:lead-receipt', args=[staged.receipt], request=request,
+			)},
+		)
+
+	@extend_schema(responses=serializers.LeadSerializer)
+	def list(self, request, *args, **kwargs):
+		"""List the leads, 304 when the client has the current version"""
+		return self.conditional_get(request, super().list, *args, **kwargs)
+
+	@extend_schema(responses=serializers.LeadSerializer)
+	def retrieve(self, request, *args, **kwargs):
+		"""Retrieve a lead, 304 when the client has the current version"""
+		return self.conditional_get(
+			request, super().retrieve, *args, **kwargs
+		)
 
 	def perform_create(self, serializer):
 		"""Create New Lead"""
 		serializer.save(user=self.request.user)
+		if not serializer.duplicate:
+			self.request.user.bump_data_version()
+
+	def perform_destroy(self, instance):
+		"""Delete the lead, filtered on the user to prune the partitions"""
+		Lead.objects.filter(user=self.request.user, id=instance.id).delete()
+		self.request.user.bump_data_version()
+
+	@action(detail=False, methods=['post'], url_path='bulk', url_name='bulk')
+	def bulk_create(self, request):
+		"""
+		Create many leads in one request.
+
+		The payload is a list of leads. Every item is validated with a single
+		LeadSerializer instance, the valid ones are written with one multi-row
+		INSERT ... ON CONFLICT and the invalid ones are reported back by their
+		index, as are the duplicates of existing leads.
+		"""
+		items = request.data
+		if not isinstance(items, list) or not items:
+			raise ValidationError(_('Expected a non-empty list of leads.'))
+		if len(items) > settings.LEAD_BULK_MAX_SIZE:
+			raise ValidationError(
+				_('A bulk request accepts at most %(max)d leads.') %
+				{'max': settings.LEAD_BULK_MAX_SIZE}
+			)
+
+		validator = self.get_serializer()
+		indexes, leads, errors = [], [], []
+		for index, item in enumerate(items):
+			try:
+				data = validator.run_validation(item)
+			except ValidationError as exc:
+				errors.append({'index': index, 'errors': exc.detail})
+				continue
+			indexes.append(index)
+			leads.append(Lead(user=request.user, **data))
+
+		created = Lead.objects.insert(leads, batch_size=len(leads) or 1)
+		if created:
+			request.user.bump_data_version()
+
+		return Response(
+			{
+				'created':    len(created),
+				'ids':        [lead.id for lead in created],
+				'duplicates': [
+					index for index, lead in zip(indexes, leads)
+					if lead.id is None
+				],
+				'errors':     errors,
+			},
+			status=status.HTTP_201_CREATED if leads else
+			status.HTTP_400_BAD_REQUEST,
+		)
+
+	@action(
+		detail=False,
+		methods=['post'],
+		url_path='bulk-delete',
+		url_name='bulk-delete',
+	)
+	def bulk_delete(self, request):
+		"""
+		Delete many leads in one request.
+
+		The payload is either {"ids": [...]}, at most LEAD_BULK_MAX_SIZE
+		ids, or {"filter": {...}} matching the leads by email, phone,
+		created_after and created_before. Only the leads of the user are
+		deleted, by set-based DELETEs of LEAD_DELETE_BATCH_SIZE leads at
+		most. The answer is the number of deleted leads.
+		"""
+		serializer = self.get_serializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		queryset = Lead.objects.filter(user=request.user)
+		if 'ids' in serializer.validated_data:
+			queryset = queryset.filter(id__in=serializer.validated_data['ids'])
+		else:
+			queryset = filter_leads(
+				queryset, serializer.validated_data['filter'],
+			)
+
+		deleted = delete_leads(
+			request.user, queryset, settings.LEAD_DELETE_BATCH_SIZE,
+		)
+		return Response({'deleted': deleted})
+
+	@extend_schema(
+		parameters=[OpenApiParameter(
+			'q', str, required=True,
+			description='the searched names, email or phone number',
+		)],
+		responses=serializers.LeadSerializer(many=True),
+	)
+	@action(
+		detail=False, methods=['get'], pagination_class=LeadSearchPagination,
+	)
+	def search(self, request):
+		"""
+		Search the leads by first name, last name, email and phone number.
+
+		The ?q= text is matched by full text (web search syntax) and, when
+		pg_trgm is installed, by trigram similarity, so typos and partial
+		words still match. Results are ranked best first and paginated
+		with ?page_size= and ?offset=, among the LEAD_SEARCH_MAX_CANDIDATES
+		most recent matches.
+		"""
+		terms = search_terms(request.query_params.get('q', ''))
+		if not terms:
+			raise ValidationError({'q': _('This field is required.')})
+		return self.conditional_get(request, self.search_results, terms)
+
+	def search_results(self, request, terms):
+		"""returns the page of the ranked leads matching the terms"""
+		candidates, rank = search_leads(
+			Lead.objects.filter(user=request.user),
+			terms,
+			settings.LEAD_SEARCH_MAX_CANDIDATES,
+		)
+		queryset = self.get_queryset().filter(id__in=candidates).order_by(
+			rank.desc(), '-id',
+		)
+		page = self.paginate_queryset(queryset)
+		serializer = self.get_serializer(page, many=True)
+		return self.get_paginated_response(serializer.data)
+
+	@action(
+		detail=False,
+		methods=['get'],
+		url_path=r'receipts/(?P<receipt>[0-9a-f-]{36})',
+		url_name='receipt',
+	)
+	def receipt(self, request, receipt):
+		"""The status of a lead accepted by the async ingest"""
+		staged = get_object_or_404(
+			LeadIngest, user=request.user, receipt=receipt,
+		)
+		return Response(self.get_serializer(staged).data)
+
+	@extend_schema(parameters=[serializers.LeadStatsQuerySerializer])
+	@action(detail=False, methods=['get'])
+	def stats(self, request):
+		"""
+		The number of leads of the user and of leads created per day.
+
+		The days are ?since= to ?until= included (YYYY-MM-DD, UTC), the
+		last LEAD_STATS_DAYS days by default. The counters are kept up to
+		date on every write, so the cost doesn't grow with the leads.
+		"""
+		query = serializers.LeadStatsQuerySerializer(data=request.query_params)
+		query.is_valid(raise_exception=True)
+		# the default days move with the date, not with the data version.
+		if {'since', 'until'} - set(request.query_params):
+			return self.stats_results(request, **query.validated_data)
+		return self.conditional_get(
+			request, self.stats_results, **query.validated_data,
+		)
+
+	def stats_results(self, request, since, until):
+		"""returns the lead counters of the user"""
+		return Response(
+			self.get_serializer(get_stats(request.user, since, until)).data
+		)
+
+	@action(detail=False, methods=['get'])
+	def export(self, request):
+		"""
+		Stream all the leads of the user as CSV or NDJSON.
+
+		The output is picked with ?output=csv (default) or ?output=ndjson.
+		Rows are read from a server-side cursor and written as they come,
+		so memory stays flat whatever the number of leads.
+		"""
+		output = request.query_params.get('output', 'csv')
+		if output not in EXPORTERS:
+			raise ValidationError(
+				{'output': _('Expected one of: %(choices)s.') %
+				 {'choices': ', '.join(EXPORTERS)}}
+			)
+
+		content_type, extension, stream = EXPORTERS[output]
+		response = StreamingHttpResponse(
+			stream(self.get_queryset()),
+			content_type=content_type,
+		)
+		response['Content-Disposition'] = \
+			f'attachment; filename="leads.{extension}"'
+		return response
+
+
+class ArchivedLeadViewSet(
+	ConditionalGetMixin,
+	mixins.ListModelMixin,
+	mixins.RetrieveModelMixin,
+	viewsets.GenericViewSet,
+):
+	"""
+	The leads moved to the archive by archive_leads, read only.
+
+	The archive isn't searched nor exported, it is paginated newest first
+	like the leads.
+	"""
+	serializer_class = serializers.ArchivedLeadSerializer
+	queryset = ArchivedLead.objects.all()
+	authentication_classes = [TokenAuthentication]
+	permission_classes = [IsAuthenticated]
+	throttle_scope = 'lead'
+	pagination_class = LeadCursorPagination
+
+	def get_queryset(self):
+		"""retrieving the archived leads of the authenticated user"""
+		return self.queryset.filter(user=self.request.user).order_by('-id')
+
+	def list(self, request, *args, **kwargs):
+		"""List the archived leads, newest first"""
+		return self.conditional_get(request, super().list, *args, **kwargs)
+
+	def retrieve(self, request, *args, **kwargs):
+		"""Retrieve an archived lead"""
+		return self.conditional_get(
+			request, super().retrieve, *args, **kwargs
+		)
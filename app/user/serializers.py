@@ -1,6 +1,7 @@
 """
 Serializers for the user API view
 """
+from core.models import UserDeletion
 from django.contrib.auth import (authenticate, get_user_model)
 from django.utils.translation import gettext as _
 from rest_framework import serializers
@@ -67,3 +68,15 @@ class AuthTokenSerializer(serializers.Serializer):
 		# Returning the user object to the view.
 		attrs['user'] = user
 		return attrs
+
+
+class UserDeletionSerializer(serializers.ModelSerializer):
+	"""The progress of the deletion of a user"""
+
+	class Meta:
+		model = UserDeletion
+		fields = (
+			'receipt', 'status', 'leads_total', 'leads_deleted',
+			'created_at', 'finished_at',
+		)
+		read_only_fields = fields
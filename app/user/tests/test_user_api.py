@@ -2,8 +2,9 @@
 tests for the user api
 """
 
+from core.models import Lead, UserDeletion
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -168,3 +169,60 @@ class PrivateUserAPITests(TestCase):
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
 		self.assertEqual(self.user.name, payload.get('name'))
 		self.assertTrue(self.user.check_password(payload.get('password')))
+
+	def test_retrieve_profile_not_modified(self):
+		"""Test an unchanged profile is answered 304"""
+		etag = self.client.get(ME_URL)['ETag']
+
+		response = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+	def test_retrieve_profile_modified_after_update(self):
+		"""Test updating the profile changes its ETag"""
+		etag = self.client.get(ME_URL)['ETag']
+		self.client.patch(ME_URL, {'name': 'updated_name'})
+
+		response = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['name'], 'updated_name')
+		self.user.refresh_from_db()
+		self.assertEqual(self.user.data_version, 1)
+
+	def test_delete_user(self):
+		"""Test deleting the user with few leads deletes it at once"""
+		response = self.client.delete(ME_URL)
+
+		self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+		self.assertFalse(
+			get_user_model().objects.filter(pk=self.user.pk).exists()
+		)
+
+	@override_settings(USER_DELETE_CHUNK_SIZE=1)
+	def test_delete_user_with_many_leads(self):
+		"""Test deleting the user with many leads answers a receipt"""
+		Lead.objects.insert([
+			Lead(
+				user=self.user,
+				fname='John',
+				lname='Doe',
+				email=f'lead{i}@example.com',
+				phone='+972541096752',
+			)
+			for i in range(2)
+		])
+
+		response = self.client.delete(ME_URL)
+
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		self.assertEqual(response.data['status'], 'pending')
+		self.assertEqual(response.data['leads_total'], 2)
+		deletion = APIClient().get(response['Location'])
+		self.assertEqual(deletion.status_code, status.HTTP_200_OK)
+		self.assertEqual(
+			deletion.data['receipt'],
+			str(UserDeletion.objects.get(user_id=self.user.pk).receipt),
+		)
+		self.user.refresh_from_db()
+		self.assertFalse(self.user.is_active)
@@ -0,0 +1,92 @@
+"""
+Test the query budgets of the user API endpoints
+"""
+
+from core.deletion import schedule
+from core.testing import QueryBudgetMixin
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from user import urls
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+	"""Test the user endpoints stay within their query budget"""
+
+	urls = urls
+	# the token authentication included, the token creation runs
+	# in a savepoint, the deletion claims and releases its lock.
+	budgets = {
+		'user:create': {'post': 2},
+		'user:token':  {'post': 5},
+		'user:me':     {'get': 1, 'patch': 3, 'delete': 36},
+		'user:deletion': {'get': 1},
+	}
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(
+			email='user@example.com', password='Password', name='Name',
+		)
+		self.client = APIClient()
+
+	def authenticate(self):
+		"""It authenticates the client with a token of the user"""
+		token = Token.objects.create(user=self.user)
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+	def test_create(self):
+		"""test creating a user"""
+		response = self.assertQueryBudget('user:create', 'post', data={
+			'email': 'new@example.com',
+			'password': 'Password',
+			'name': 'Name',
+		})
+
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+	def test_token(self):
+		"""test creating a token"""
+		response = self.assertQueryBudget('user:token', 'post', data={
+			'email': 'user@example.com',
+			'password': 'Password',
+		})
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_retrieve_me(self):
+		"""test retrieving the authenticated user"""
+		self.authenticate()
+
+		response = self.assertQueryBudget('user:me', 'get')
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_update_me(self):
+		"""test updating the authenticated user"""
+		self.authenticate()
+
+		response = self.assertQueryBudget(
+			'user:me', 'patch', data={'name': 'New'},
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+	def test_delete_me(self):
+		"""test deleting the authenticated user"""
+		self.authenticate()
+
+		response = self.assertQueryBudget('user:me', 'delete')
+
+		self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+	def test_deletion(self):
+		"""test reading the progress of a deletion"""
+		deletion = schedule(self.user)
+
+		response = self.assertQueryBudget(
+			'user:deletion', 'get', args=[deletion.receipt],
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -13,5 +13,10 @@ urlpatterns = [
 	path('create/', views.CreateUserView.as_view(), name='create'),
 	path('token/', views.CreateTokenView.as_view(), name='token'),
 	path('me/', views.ManageUserView.as_view(), name='me'),
+	path(
+		'deletions/<uuid:receipt>/',
+		views.UserDeletionView.as_view(),
+		name='deletion',
+	),
 
 ]
@@ -1,29 +1,47 @@
 """Views for the user API """
 
-from rest_framework import authentication, generics, permissions
+from core.authentication import TokenAuthentication
+from core.deletion import delete_user
+from core.mixins import ConditionalGetMixin
+from core.models import UserDeletion
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.settings import api_settings
 
-from .serializers import (AuthTokenSerializer, UserSerializer)
+from .serializers import (
+	AuthTokenSerializer,
+	UserDeletionSerializer,
+	UserSerializer,
+)
 
 
 class CreateUserView(generics.CreateAPIView):
 	"""Create a new user in the system"""
 	serializer_class = UserSerializer
+	throttle_scope = 'auth'
 
 
 class CreateTokenView(ObtainAuthToken):
 	"""Create a new Auth Token for user"""
 	serializer_class = AuthTokenSerializer
 	renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+	throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+	throttle_scope = 'auth'
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(
+	ConditionalGetMixin,
+	generics.RetrieveUpdateDestroyAPIView,
+):
 	"""Manage the authenticated user"""
 
 	serializer_class = UserSerializer
-	authentication_classes = [authentication.TokenAuthentication]
+	authentication_classes = [TokenAuthentication]
 	permission_classes = [permissions.IsAuthenticated]
+	throttle_scope = 'user'
 
 	# overwrite the get object for getting only the user authenticated
 	def get_object(self):
@@ -33,3 +51,47 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 		"""
 		"""retrieving and returns the authenticated user"""
 		return self.request.user
+
+	def retrieve(self, request, *args, **kwargs):
+		"""Retrieve the user, 304 when the client has the current version"""
+		return self.conditional_get(
+			request, super().retrieve, *args, **kwargs
+		)
+
+	def perform_update(self, serializer):
+		"""Update the user and bump its data version"""
+		serializer.save()
+		self.request.user.bump_data_version()
+
+	@extend_schema(responses={202: UserDeletionSerializer, 204: None})
+	def destroy(self, request, *args, **kwargs):
+		"""
+		Delete the user, its tokens are revoked at once.
+
+		A user with more than USER_DELETE_CHUNK_SIZE leads is answered 202
+		with a receipt, its leads are deleted in the background by
+		delete_users.
+		"""
+		deletion = delete_user(request.user)
+		if deletion.status == UserDeletion.Status.DONE:
+			return Response(status=status.HTTP_204_NO_CONTENT)
+		return Response(
+			UserDeletionSerializer(deletion).data,
+			status=status.HTTP_202_ACCEPTED,
+			headers={'Location': reverse(
+				'user:deletion', args=[deletion.receipt], request=request,
+			)},
+		)
+
+
+class UserDeletionView(generics.RetrieveAPIView):
+	"""
+	The progress of the deletion of a user, by its receipt. It is public
+	since the user can't authenticate anymore.
+	"""
+	serializer_class = UserDeletionSerializer
+	queryset = UserDeletion.objects.all()
+	authentication_classes = []
+	permission_classes = [permissions.AllowAny]
+	lookup_field = 'receipt'
+	throttle_scope = 'user'